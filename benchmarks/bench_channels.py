@@ -0,0 +1,155 @@
+"""Benchmarks for the channel API against a local fake Firebase server.
+
+Usage::
+
+  python -m benchmarks.bench_channels --requests 2000 --latency 0.005
+  python -m benchmarks.bench_channels --save baseline.json
+  python -m benchmarks.bench_channels --compare baseline.json --tolerance 0.2
+  python -m benchmarks.bench_channels --transports requests urllib3 --pools bounded
+
+When comparing against a baseline, the process exits with a non-zero
+status if any benchmark's throughput dropped by more than `tolerance`.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+import uuid
+
+from multiprocessing.pool import ThreadPool
+
+from firechannel import create_channel, delete_channel, send_message
+from firechannel.pool import BoundedPool, ThreadLocalPool
+from firechannel.testing import FakeFirebaseServer
+from firechannel.transport import HTTP2Transport, RequestsTransport, Urllib3Transport
+
+#: The operations that can be benchmarked.
+OPERATIONS = {
+    "create_channel": lambda client, channel_id: create_channel(channel_id, firebase_client=client),
+    "send_message": lambda client, channel_id: send_message(channel_id, "hello!" * 20, firebase_client=client),
+    "delete_channel": lambda client, channel_id: delete_channel(channel_id, firebase_client=client),
+}
+
+#: The pool types that can be benchmarked.
+POOLS = {
+    "thread-local": lambda concurrency: ThreadLocalPool,
+    "bounded": lambda concurrency: BoundedPool.configure(max_size=concurrency),
+}
+
+#: The transports that can be benchmarked.  The fake server only
+#: speaks HTTP/1.1, so the HTTP/2 transport needs `--url` to point at
+#: an HTTP/2 proxy in front of it, eg. nghttpx.
+TRANSPORTS = {
+    "requests": lambda concurrency: RequestsTransport(),
+    "urllib3": lambda concurrency: Urllib3Transport(maxsize=concurrency),
+    "http2": lambda concurrency: HTTP2Transport(),
+}
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    index = min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))
+    return samples[index]
+
+
+def run_benchmark(client, operation, concurrency, requests):
+    channel_ids = [uuid.uuid4().hex for _ in range(requests)]
+    fn = OPERATIONS[operation]
+
+    def timed(channel_id):
+        started_at = time.time()
+        fn(client, channel_id)
+        return time.time() - started_at
+
+    pool = ThreadPool(concurrency)
+    try:
+        started_at = time.time()
+        latencies = pool.map(timed, channel_ids, chunksize=1)
+        elapsed = time.time() - started_at
+    finally:
+        pool.close()
+        pool.join()
+
+    return {
+        "ops_per_second": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def run_benchmarks(server, operations, pools, transports, concurrency_levels, requests, uri_template=None):
+    results = {}
+    for transport_name in transports:
+        for pool_name in pools:
+            for concurrency in concurrency_levels:
+                client = server.client(
+                    pool_factory=POOLS[pool_name](concurrency),
+                    transport=TRANSPORTS[transport_name](concurrency),
+                    uri_template=uri_template or server.uri_template,
+                )
+                for operation in operations:
+                    # Results for the default transport keep their old
+                    # names so that existing baselines still apply.
+                    name = "{}/{}/c{}".format(operation, pool_name, concurrency)
+                    if transport_name != "requests":
+                        name = "{}/{}/{}/c{}".format(operation, pool_name, transport_name, concurrency)
+                    results[name] = result = run_benchmark(client, operation, concurrency, requests)
+                    print("{:<40} {ops_per_second:>10.1f} ops/s  p50 {p50_ms:>8.2f}ms  p99 {p99_ms:>8.2f}ms".format(
+                        name, **result
+                    ))
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in sorted(results.items()):
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+
+        change = result["ops_per_second"] / expected["ops_per_second"] - 1
+        if change < -tolerance:
+            regressions.append(name)
+            print("REGRESSION {:<40} {:>+7.1%}".format(name, change))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--operations", nargs="+", choices=sorted(OPERATIONS), default=sorted(OPERATIONS))
+    parser.add_argument("--pools", nargs="+", choices=sorted(POOLS), default=sorted(POOLS))
+    parser.add_argument("--transports", nargs="+", choices=sorted(TRANSPORTS), default=["requests"])
+    parser.add_argument("--url", help="benchmark against this server instead of the fake one's URL")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=1000, help="requests per benchmark")
+    parser.add_argument("--latency", type=float, default=0.0, help="server latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--save", help="save the results to this file")
+    parser.add_argument("--compare", help="compare the results against this file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="max allowed drop in throughput")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR)
+    with FakeFirebaseServer(latency=args.latency, error_rate=args.error_rate) as server:
+        uri_template = args.url and args.url.rstrip("/") + "/{path}"
+        results = run_benchmarks(
+            server, args.operations, args.pools, args.transports, args.concurrency, args.requests, uri_template,
+        )
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f), args.tolerance):
+                return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,21 @@
-from .channel import get_client, set_client, create_channel, delete_channel, send_message, find_all_expired_channels  # noqa
+from .channel import get_client, set_client, create_channel, delete_channel, send_message, send_messages  # noqa
+from .channel import warm_up  # noqa
+from .channel import delete_channels, find_all_expired_channels, start_token_reservoir  # noqa
+from .channel import create_multiplexed_channel  # noqa
+from .channel import append_message, append_messages, trim_channel_logs, publish, delete_topic  # noqa
+from .asynchronous import AsyncFirebase, create_channel_async, delete_channel_async, send_message_async  # noqa
+from .asynchronous import find_all_expired_channels_async  # noqa
 from .credentials import get_credentials  # noqa
+from .encoding import Codec, MessageEncoder, decode_message, register_codec  # noqa
+from .expiry import ExpiryIndex  # noqa
 from .firebase import Firebase  # noqa
-from .pool import Pool, ThreadLocalPool  # noqa
+from .instrumentation import MemorySink, NullSink, Sink, StatsdSink  # noqa
+from .outbox import Outbox  # noqa
+from .pool import Pool, BoundedPool, ThreadLocalPool  # noqa
+from .retry import CircuitBreaker, RetryPolicy  # noqa
+from .sender import BackgroundSender  # noqa
+from .sharding import ShardedFirebase  # noqa
+from .sweeper import sweep_expired_channels  # noqa
+from .transport import Transport, RequestsTransport, Urllib3Transport, HTTP2Transport  # noqa
 
 __version__ = "0.6.0"
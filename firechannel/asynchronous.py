@@ -0,0 +1,129 @@
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+
+from .channel import create_channel, delete_channel, find_all_expired_channels, get_client, send_message
+from .firebase import Firebase
+from .pool import BoundedPool
+
+
+class AsyncFirebase(Firebase):
+    """A Firebase client that can run requests in the background.
+
+    Requests are run on a pool of `concurrency` worker threads, each of
+    which reserves a session from a pool of the same size.  Background
+    calls return `AsyncResult` objects whose `get()` method returns the
+    result of the call or raises the same errors the equivalent
+    blocking call would have.
+
+    Under gevent, the workers are greenlets so `concurrency` can be
+    raised to thousands of in-flight requests.
+
+    Parameters:
+      project(str): The name of the project.
+      credentials(Credentials): An OAuth2 credentials object.
+        Optional on Google App Engine.
+      concurrency(int): The max number of requests in flight at once.
+    """
+
+    def __init__(self, project, credentials=None, concurrency=32, **options):
+        options.setdefault("pool_factory", BoundedPool.configure(max_size=concurrency))
+        super(AsyncFirebase, self).__init__(project, credentials, **options)
+        self.concurrency = concurrency
+        self._executor = None
+        self._executor_mutex = Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._executor_mutex:
+                if self._executor is None:
+                    self._executor = ThreadPool(self.concurrency)
+        return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        """Run a function in the background.
+
+        Returns:
+          AsyncResult
+        """
+        return self.executor.apply_async(fn, args, kwargs)
+
+    def call_async(self, method, path, value=None, params=None):
+        """Call the Firebase API in the background.
+
+        Parameters:
+          method(str): HTTP method.
+          path(str): Request path.
+          value(dict): The value to send to Firebase.
+          params(dict): Query string parameters.
+
+        Returns:
+          AsyncResult
+        """
+        return self.submit(self.call, method, path, value, params)
+
+    def refresh_token_async(self):
+        """Refresh the access token in the background.
+
+        Returns:
+          AsyncResult
+        """
+        return self.submit(self.refresh_token)
+
+    def close(self):
+        """Wait for all background calls to finish and stop the workers.
+        """
+        with self._executor_mutex:
+            executor, self._executor = self._executor, None
+
+        if executor is not None:
+            executor.close()
+            executor.join()
+
+
+def _get_async_client(firebase_client):
+    client = firebase_client or get_client()
+    if not isinstance(client, AsyncFirebase):
+        raise TypeError("firebase_client must be an AsyncFirebase instance")
+    return client
+
+
+def create_channel_async(client_id=None, duration_minutes=60, firebase_client=None, topics=None):
+    """Create a channel in the background.  See `create_channel`.
+
+    Returns:
+      AsyncResult: Resolves to the channel's token.
+    """
+    client = _get_async_client(firebase_client)
+    return client.submit(create_channel, client_id, duration_minutes, firebase_client=client, topics=topics)
+
+
+def delete_channel_async(client_id, firebase_client=None):
+    """Delete a channel in the background.  See `delete_channel`.
+
+    Returns:
+      AsyncResult
+    """
+    client = _get_async_client(firebase_client)
+    return client.submit(delete_channel, client_id, firebase_client=client)
+
+
+def send_message_async(client_id, message, firebase_client=None):
+    """Send a message to a channel in the background.  See `send_message`.
+
+    Returns:
+      AsyncResult
+    """
+    client = _get_async_client(firebase_client)
+    return client.submit(send_message, client_id, message, firebase_client=client)
+
+
+def find_all_expired_channels_async(max_age=3600, firebase_client=None):
+    """Find all expired channels in the background.  See
+    `find_all_expired_channels`.
+
+    Returns:
+      AsyncResult: Resolves to a list of channel ids.
+    """
+    client = _get_async_client(firebase_client)
+    return client.submit(lambda: list(find_all_expired_channels(max_age=max_age, firebase_client=client)))
@@ -0,0 +1,49 @@
+import time
+
+from collections import OrderedDict
+from threading import Lock
+
+
+class TokenCache(object):
+    """A bounded LRU cache of decoded tokens.  Tokens are forgotten
+    once they expire, according to their ``exp`` claim.
+
+    Parameters:
+      max_size(int): The max number of tokens to hold on to.  A value
+        of 0 disables the cache.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.tokens = OrderedDict()
+        self._mutex = Lock()
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def get(self, token):
+        """Get the claims of a token.
+
+        Returns:
+          dict: Or None if the token isn't cached or if it has expired.
+        """
+        with self._mutex:
+            claims = self.tokens.pop(token, None)
+            if claims is None or claims.get("exp", 0) <= time.time():
+                return None
+
+            self.tokens[token] = claims
+            return claims
+
+    def set(self, token, claims):
+        """Cache the claims of a token.  Tokens without an ``exp``
+        claim or that have already expired aren't cached.
+        """
+        if not self.max_size or claims.get("exp", 0) <= time.time():
+            return
+
+        with self._mutex:
+            self.tokens.pop(token, None)
+            self.tokens[token] = claims
+            while len(self.tokens) > self.max_size:
+                self.tokens.popitem(last=False)
@@ -1,11 +1,20 @@
-import base64
+import hashlib
+import json
 import logging
 import string
 import time
 import uuid
 
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from operator import itemgetter
+
 from .credentials import build_token, decode_token
+from .encoding import DEFAULT_ENCODING
+from .errors import BadRequest, FirebaseError
 from .firebase import Firebase
+from .pushid import encode_timestamp, generate_push_id
+from .reservoir import TokenReservoir
 
 _client = None
 _logger = logging.getLogger("firechannel.channel")
@@ -13,6 +22,32 @@ _logger = logging.getLogger("firechannel.channel")
 #: Valid client id characters.
 VALID_CHARS = set(string.ascii_letters + string.digits + "-_")
 
+#: The max size in bytes of a single multi-location update.  The
+#: Firebase REST API rejects writes larger than 256MB, but we stay well
+#: below that so individual requests remain reasonably fast.
+MAX_BATCH_SIZE = 16 * 1024 * 1024
+
+#: The max number of channels deleted by a single multi-location update.
+MAX_DELETE_BATCH_SIZE = 1000
+
+#: The number of concurrent requests used to read channel timestamps
+#: when the timestamp index is missing.
+SCAN_CONCURRENCY = 8
+
+#: The default max number of messages kept in a channel's log.
+MAX_LOG_LENGTH = 100
+
+#: The max length of a custom token's JSON encoded claims.
+MAX_CLAIMS_SIZE = 1000
+
+#: Where the chunks of large messages are stored.
+CHUNKS_PATH = "firechannelchunks"
+
+#: The max number of concurrent requests used to write a message's chunks.
+CHUNK_CONCURRENCY = 8
+
+_missing = object()
+
 
 def get_client():
     """Get the current global client instance.
@@ -45,11 +80,43 @@ def set_client(client):
     _client = client
 
 
+def warm_up(firebase_client=None, connections=1, signing=True):
+    """Prepare a client for its first requests so that cold starts
+    don't slow down whoever sends the first message.  See
+    `Firebase.warm_up`.
+
+    Parameters:
+      firebase_client(Firebase): The Firebase client instance to
+        warm up.  This can be omitted on AppEngine, in which case
+        the default client is created and its credentials resolved.
+      connections(int): The number of connections to open to each
+        database.
+      signing(bool): Whether or not to warm up token signing.
+
+    Returns:
+      dict: The number of seconds each step took.
+    """
+    started_at = time.time()
+    client = firebase_client or get_client()
+    elapsed = time.time() - started_at
+
+    timings = client.warm_up(connections, signing)
+    timings["client"] = elapsed
+    return timings
+
+
 def decode_client_id(token, firebase_client=None):
-    """Given a token, decode and return its client id.
+    """Given a token, decode and return its client id.  Decoded tokens
+    are cached by the client until they expire.
     """
     client = firebase_client or get_client()
-    return decode_token(client.credentials, token)["uid"]
+    claims = client.token_cache.get(token)
+    if claims is None:
+        with client.sink.timer("channel.decode_token"):
+            claims = decode_token(client.signer, token, verifier=client.verifier)
+        client.token_cache.set(token, claims)
+
+    return claims["uid"]
 
 
 def _validate_client_id(client_id, firebase_client=None):
@@ -68,6 +135,12 @@ def _validate_client_id(client_id, firebase_client=None):
     return client_id
 
 
+def _generation(client):
+    # Messages are stamped using the clock of the server that sends
+    # them, which can lag behind the one creating the token.
+    return int((time.time() - client.fence_tolerance) * 1000)
+
+
 def _validate_duration(duration_minutes):
     if not isinstance(duration_minutes, int):
         raise TypeError("duration_minutes must be an integer")
@@ -76,7 +149,20 @@ def _validate_duration(duration_minutes):
         raise ValueError("duration_minutes must be a value between 1 and 1440")
 
 
-def create_channel(client_id=None, duration_minutes=60, firebase_client=None):
+def _validate_topic(topic):
+    if not isinstance(topic, basestring):
+        raise TypeError("topics must be strings")
+
+    elif not topic or len(topic) > 64:
+        raise ValueError("topics must be between 1 and 64 characters long")
+
+    elif set(topic) - VALID_CHARS:
+        raise ValueError("topic contains invalid characters")
+
+    return topic
+
+
+def create_channel(client_id=None, duration_minutes=60, firebase_client=None, topics=None):
     """Create a channel.
 
     Parameters:
@@ -85,25 +171,170 @@ def create_channel(client_id=None, duration_minutes=60, firebase_client=None):
         for which the returned should be valid.
       firebase_client(Firebase): The Firebase client instance to
         use. This can be omitted on AppEngine.
+      topics(list): The topics the client is allowed to subscribe to.
 
     Raises:
       FirebaseError: When Firebase is down.
-      TypeError: When client_id or duration_minutes have invalid types.
-      ValueError: When client_id or duration_minutes have invalid values.
+      TypeError: When client_id, duration_minutes or topics have invalid types.
+      ValueError: When client_id, duration_minutes or topics have invalid values.
 
     Returns:
       str: A token that the client can use to connect to the channel.
     """
+    client = firebase_client or get_client()
+    with client.sink.timer("channel.create_channel"):
+        return _create_channel(client, client_id, duration_minutes, topics)
+
+
+def _validate_claims(claims):
+    # Leave some room for the generation, which gets added last.
+    if len(json.dumps(claims)) + 24 > MAX_CLAIMS_SIZE:
+        raise ValueError("token claims must be shorter than {} characters".format(MAX_CLAIMS_SIZE))
+
+    return claims
+
+
+def _join_claim(values):
+    # Security rules can't iterate over lists so sets of values are
+    # granted as delimited strings that rules match against.
+    return u"|{}|".format(u"|".join(values))
+
+
+def _create_channel(client, client_id, duration_minutes, topics):
+    claims = {}
+    if topics:
+        claims["topics"] = _join_claim(_validate_topic(topic) for topic in topics)
+        _validate_claims(claims)
+
     if client_id is None:
-        client_id = str(uuid.uuid4())
+        _validate_duration(duration_minutes)
+
+        # Freshly generated channels can't have any old data so
+        # there's no need to delete them.
+        reservoir = client.token_reservoir
+        token = not claims and reservoir and reservoir.take(duration_minutes)
+        return token or _build_channel_token(client, str(uuid.uuid4()), duration_minutes, claims)
 
-    client = firebase_client or get_client()
     client_id = _validate_client_id(client_id, firebase_client=client)
     _validate_duration(duration_minutes)
 
+    if client.fence_channels:
+        # Clients ignore any data older than the token's generation so
+        # there's no need to delete the channel up front.
+        claims["gen"] = _generation(client)
+        return _build_channel_token(client, client_id, duration_minutes, claims)
+
     # Delete the channel so any old data isn't sent to the client.
-    delete_channel(client_id, firebase_client=client)
-    return build_token(client.credentials, {"uid": client_id}, duration_minutes)
+    index = client.expiry_index
+    if index is None:
+        delete_channel(client_id, firebase_client=client)
+    else:
+        # Record when the token expires in the same request.
+        expires_at = int((time.time() + duration_minutes * 60) * 1000)
+        update = index.entry(client_id, expires_at)
+        update.update(_channel_deletion(client, client_id))
+        client.shard_for(client_id).patch(u".json", update)
+
+    return _build_channel_token(client, client_id, duration_minutes, claims)
+
+
+def create_multiplexed_channel(client_ids, duration_minutes=60, firebase_client=None, topics=None):
+    """Create a token that grants access to many channels at once so
+    that clients can listen to all of them while only authenticating
+    once.  The token also has a channel of its own.
+
+    Parameters:
+      client_ids(list): The client ids of the channels to grant
+        access to.
+      duration_minutes(int): An int specifying the number of minutes
+        for which the returned should be valid.
+      firebase_client(Firebase): The Firebase client instance to
+        use. This can be omitted on AppEngine.
+      topics(list): The topics the client is allowed to subscribe to.
+
+    Raises:
+      FirebaseError: When Firebase is down.
+      TypeError: When an argument has an invalid type.
+      ValueError: When an argument has an invalid value, when the
+        token's claims would be too large or when the channels live
+        on different shards.
+
+    Returns:
+      str: A token that the client can use to connect to the channels.
+    """
+    client = firebase_client or get_client()
+    with client.sink.timer("channel.create_multiplexed_channel"):
+        client_ids = [_validate_client_id(client_id, firebase_client=client) for client_id in client_ids]
+        _validate_duration(duration_minutes)
+
+        shards = _group_by_shard(client, client_ids)
+        if len(shards) > 1:
+            raise ValueError("client_ids must all live on the same shard")
+
+        claims = {"channels": _join_claim(client_ids)}
+        if topics:
+            claims["topics"] = _join_claim(_validate_topic(topic) for topic in topics)
+
+        _validate_claims(claims)
+        if client.fence_channels:
+            claims["gen"] = _generation(client)
+
+        else:
+            for _, error in delete_channels(client_ids, firebase_client=client):
+                raise error
+
+        # The token's own channel has to live on the same shard as the
+        # others since clients only connect to one database.
+        shard = shards[0][0] if shards else client.shard_for(str(uuid.uuid4()))
+        client_id = str(uuid.uuid4())
+        while client.shard_for(client_id) is not shard:
+            client_id = str(uuid.uuid4())
+
+        return _build_channel_token(client, client_id, duration_minutes, claims)
+
+
+def _build_channel_token(client, client_id, duration_minutes, claims=None):
+    if client.sharded:
+        claims = dict(claims or {}, db=client.shard_for(client_id).database_url)
+
+    params = {"uid": client_id}
+    if claims:
+        params["claims"] = _validate_claims(claims)
+
+    with client.sink.timer("channel.build_token"):
+        return build_token(client.signer, params, duration_minutes)
+
+
+def start_token_reservoir(durations=(60,), size=100, low_watermark=None, max_age=None, firebase_client=None):
+    """Start minting tokens for anonymous channels in the background
+    so that ``create_channel(None)`` can return one immediately.
+
+    Parameters:
+      durations(tuple): The values of `duration_minutes` to keep
+        tokens ready for.  Other durations are minted on demand.
+      size(int): The max number of tokens to keep ready per duration.
+      low_watermark(int): The number of ready tokens at which more
+        tokens get minted.  Defaults to a quarter of `size`.
+      max_age(int): The max number of seconds to hold on to a ready
+        token.  Defaults to a sixtieth of its duration.
+      firebase_client(Firebase): The Firebase client instance to
+        use. This can be omitted on AppEngine.
+
+    Returns:
+      TokenReservoir: Call its `stop()` method to stop minting tokens.
+    """
+    client = firebase_client or get_client()
+    for duration_minutes in durations:
+        _validate_duration(duration_minutes)
+
+    def mint(duration_minutes):
+        return _build_channel_token(client, str(uuid.uuid4()), duration_minutes)
+
+    if client.token_reservoir is not None:
+        client.token_reservoir.stop()
+
+    client.token_reservoir = TokenReservoir(mint, durations, size, low_watermark, max_age).start()
+    return client.token_reservoir
 
 
 def delete_channel(client_id, firebase_client=None):
@@ -120,14 +351,66 @@ def delete_channel(client_id, firebase_client=None):
       ValueError: When client_id has an invalid value.
     """
     client = firebase_client or get_client()
-    client_id = _validate_client_id(client_id, firebase_client=client)
-    client.delete(u"firechannels/{}.json".format(client_id))
-    _logger.debug("Deleted channel %r.", client_id)
+    with client.sink.timer("channel.delete_channel"):
+        client_id = _validate_client_id(client_id, firebase_client=client)
+        shard = client.shard_for(client_id)
+        if client.chunk_size is None:
+            shard.delete(u"firechannels/{}.json".format(client_id))
+        else:
+            shard.patch(u".json", _channel_deletion(client, client_id))
+        _logger.debug("Deleted channel %r.", client_id)
+
+
+def delete_channels(client_ids, batch_size=MAX_DELETE_BATCH_SIZE, firebase_client=None):
+    """Delete many channels using as few requests as possible.
+
+    Channels are deleted by nulling out their paths in multi-location
+    updates against ``firechannels.json``.  A failing batch does not
+    prevent the remaining ones from being deleted.
+
+    Parameters:
+      client_ids(list): The client ids (or tokens) of the channels to
+        delete.
+      batch_size(int): The max number of channels to delete in a
+        single request.
+      firebase_client(Firebase): The Firebase client instance to
+        use. This can be omitted on AppEngine.
+
+    Raises:
+      TypeError: When a client_id has an invalid type.
+      ValueError: When a client_id has an invalid value.
+
+    Returns:
+      list: A list of (client_ids, error) tuples, one for each batch
+      that could not be deleted.  Empty if every channel was deleted.
+    """
+    client = firebase_client or get_client()
+    with client.sink.timer("channel.delete_channels"):
+        client_ids = [_validate_client_id(client_id, firebase_client=client) for client_id in client_ids]
+
+        failures = []
+        for shard, shard_client_ids in _group_by_shard(client, client_ids):
+            for i in range(0, len(shard_client_ids), batch_size):
+                batch = shard_client_ids[i:i + batch_size]
+                try:
+                    if client.chunk_size is None:
+                        shard.patch(u"firechannels.json", {client_id: None for client_id in batch})
+                    else:
+                        shard.patch(u".json", _merge(_channel_deletion(client, client_id) for client_id in batch))
+                    _logger.debug("Deleted %d channels.", len(batch))
+                except FirebaseError as e:
+                    _logger.warning("Failed to delete %d channels: %s", len(batch), e)
+                    failures.append((batch, e))
+
+        return failures
 
 
 def send_message(client_id, message, firebase_client=None):
     """Send a message to a channel.
 
+    Messages longer than the client's `chunk_size` are split into
+    chunks that are written in parallel before the message itself.
+
     Parameters:
       client_id(str): A string to identify this channel in Firebase.
       message(str): A string representing the message to send.
@@ -141,29 +424,522 @@ def send_message(client_id, message, firebase_client=None):
     """
     assert isinstance(message, basestring), "messages must be strings"
     client = firebase_client or get_client()
-    client_id = _validate_client_id(client_id, firebase_client=client)
-    client.patch(u"firechannels/{}.json".format(client_id), {
-        "message": base64.b64encode(message),
+    with client.sink.timer("channel.send_message"):
+        client_id = _validate_client_id(client_id, firebase_client=client)
+        update = _encode_message(client, message)
+        shard = client.shard_for(client_id)
+        cleanup = None
+        if _should_chunk(client, update):
+            cleanup = _write_chunks(shard, client_id, update, client.chunk_size)
+        elif client.chunk_size is not None:
+            cleanup = _stale_chunks(shard, client_id, generate_push_id())
+
+        if client.expiry_index is None and not cleanup:
+            shard.patch(u"firechannels/{}.json".format(client_id), update)
+        else:
+            _patch_channels(client, shard, [(client_id, update)], cleanup)
+
+
+def send_messages(messages, max_batch_size=MAX_BATCH_SIZE, firebase_client=None):
+    """Send many messages using as few requests as possible.
+
+    Messages are grouped into multi-location updates against
+    ``firechannels.json``, each of which is at most `max_batch_size`
+    bytes large.  A failing batch does not prevent the remaining ones
+    from being sent.
+
+    Parameters:
+      messages(dict): A mapping from client ids (or tokens) to the
+        message that should be sent to each of them.
+      max_batch_size(int): The max size in bytes of a single request.
+      firebase_client(Firebase): The Firebase client instance to
+        use. This can be omitted on AppEngine.
+
+    Raises:
+      TypeError: When a client_id has an invalid type.
+      ValueError: When a client_id has an invalid value.
+
+    Returns:
+      list: A list of (client_ids, error) tuples, one for each batch
+      that could not be sent.  Empty if every message was sent.
+    """
+    client = firebase_client or get_client()
+    with client.sink.timer("channel.send_messages"):
+        updates = []
+        for client_id, message in messages.items():
+            assert isinstance(message, basestring), "messages must be strings"
+            client_id = _validate_client_id(client_id, firebase_client=client)
+            updates.append((client_id, _encode_message(client, message)))
+
+        failures = []
+        for shard, shard_updates in _group_by_shard(client, updates, key=itemgetter(0)):
+            shard_updates, cleanups = _write_all_chunks(client, shard, shard_updates, failures)
+            for batch in _batch_updates(shard_updates, max_batch_size):
+                client_ids = [client_id for client_id, _ in batch]
+                cleanup = _merge(cleanups.get(client_id, {}) for client_id in client_ids)
+                try:
+                    _patch_channels(client, shard, batch, cleanup)
+                except FirebaseError as e:
+                    _logger.warning("Failed to send messages to %d channels: %s", len(client_ids), e)
+                    failures.append((client_ids, e))
+
+        return failures
+
+
+def publish(topic, message, firebase_client=None):
+    """Publish a message to every client subscribed to a topic using
+    a single write.
+
+    Parameters:
+      topic(str): The name of the topic.
+      message(str): A string representing the message to send.
+      firebase_client(Firebase): The Firebase client instance to
+        use. This can be omitted on AppEngine.
+
+    Raises:
+      FirebaseError: When Firebase is down.
+      TypeError: When topic has an invalid type.
+      ValueError: When topic has an invalid value.
+    """
+    assert isinstance(message, basestring), "messages must be strings"
+    client = firebase_client or get_client()
+    with client.sink.timer("channel.publish"):
+        topic = _validate_topic(topic)
+        client.patch(u"firetopics/{}.json".format(topic), _encode_message(client, message))
+
+
+def delete_topic(topic, firebase_client=None):
+    """Delete a topic's last message.
+
+    Parameters:
+      topic(str): The name of the topic.
+      firebase_client(Firebase): The Firebase client instance to
+        use. This can be omitted on AppEngine.
+
+    Raises:
+      FirebaseError: When Firebase is down.
+      TypeError: When topic has an invalid type.
+      ValueError: When topic has an invalid value.
+    """
+    client = firebase_client or get_client()
+    with client.sink.timer("channel.delete_topic"):
+        client.delete(u"firetopics/{}.json".format(_validate_topic(topic)))
+
+
+def append_message(client_id, message, firebase_client=None):
+    """Append a message to a channel's log.  Unlike with
+    `send_message`, every message appended to a channel is delivered
+    to clients that listen to it in log mode, no matter how quickly
+    they are sent.
+
+    Parameters:
+      client_id(str): A string to identify this channel in Firebase.
+      message(str): A string representing the message to send.
+      firebase_client(Firebase): The Firebase client instance to
+        use. This can be omitted on AppEngine.
+
+    Raises:
+      FirebaseError: When Firebase is down.
+      TypeError: When client_id has an invalid type.
+      ValueError: When client_id has an invalid value.
+
+    Returns:
+      str: The key of the message within the channel's log.
+    """
+    assert isinstance(message, basestring), "messages must be strings"
+    client = firebase_client or get_client()
+    with client.sink.timer("channel.append_message"):
+        client_id = _validate_client_id(client_id, firebase_client=client)
+        key, update = _encode_log_entry(client, message)
+        if client.expiry_index is None:
+            client.shard_for(client_id).patch(u"firechannels/{}.json".format(client_id), update)
+        else:
+            _patch_channels(client, client.shard_for(client_id), [(client_id, update)])
+        return key
+
+
+def append_messages(messages, max_batch_size=MAX_BATCH_SIZE, firebase_client=None):
+    """Append many messages to channel logs using as few requests as
+    possible.  Messages appended to the same channel keep their order.
+
+    Parameters:
+      messages(list): A list of (client_id, message) tuples.
+      max_batch_size(int): The max size in bytes of a single request.
+      firebase_client(Firebase): The Firebase client instance to
+        use. This can be omitted on AppEngine.
+
+    Raises:
+      TypeError: When a client_id has an invalid type.
+      ValueError: When a client_id has an invalid value.
+
+    Returns:
+      list: A list of (client_ids, error) tuples, one for each batch
+      that could not be sent.  Empty if every message was sent.
+    """
+    client = firebase_client or get_client()
+    with client.sink.timer("channel.append_messages"):
+        updates = []
+        for client_id, message in messages:
+            assert isinstance(message, basestring), "messages must be strings"
+            client_id = _validate_client_id(client_id, firebase_client=client)
+            updates.append((client_id, _encode_log_entry(client, message)[1]))
+
+        failures = []
+        for shard, shard_updates in _group_by_shard(client, updates, key=itemgetter(0)):
+            for batch in _batch_updates(shard_updates, max_batch_size):
+                client_ids = [client_id for client_id, _ in batch]
+                try:
+                    _patch_channels(client, shard, batch)
+                except FirebaseError as e:
+                    _logger.warning("Failed to append %d messages: %s", len(client_ids), e)
+                    failures.append((client_ids, e))
+
+        return failures
+
+
+def trim_channel_logs(client_ids, max_length=MAX_LOG_LENGTH, max_age=None, batch_size=MAX_DELETE_BATCH_SIZE,
+                      firebase_client=None):
+    """Delete old messages from channel logs.
+
+    Log keys are listed shallowly, so message bodies are never
+    downloaded, and old messages are deleted using multi-location
+    updates.
+
+    Parameters:
+      client_ids(list): The client ids (or tokens) of the channels to trim.
+      max_length(int): The max number of messages to keep per channel.
+        None means there is no limit.
+      max_age(int): Messages appended longer than this many seconds
+        ago are deleted.  None means there is no limit.
+      batch_size(int): The max number of messages to delete in a
+        single request.
+      firebase_client(Firebase): The Firebase client instance to
+        use. This can be omitted on AppEngine.
+
+    Raises:
+      FirebaseError: When listing a channel's log fails.
+      TypeError: When a client_id has an invalid type.
+      ValueError: When a client_id has an invalid value.
+
+    Returns:
+      list: A list of (paths, error) tuples, one for each batch that
+      could not be deleted.  Empty if every old message was deleted.
+    """
+    client = firebase_client or get_client()
+    with client.sink.timer("channel.trim_channel_logs"):
+        client_ids = [_validate_client_id(client_id, firebase_client=client) for client_id in client_ids]
+        cutoff = max_age is not None and encode_timestamp((time.time() - max_age) * 1000)
+
+        def find_old_entries(client_id):
+            path = u"firechannels/{}/log.json".format(client_id)
+            keys = sorted(client.shard_for(client_id).get(path, params={"shallow": "true"}) or ())
+            old_keys = set()
+            if max_length is not None:
+                old_keys.update(keys[:max(len(keys) - max_length, 0)])
+
+            # Push ids start with the time they were generated at.
+            if cutoff:
+                old_keys.update(key for key in keys if key < cutoff)
+
+            return [u"{}/log/{}".format(client_id, key) for key in sorted(old_keys)]
+
+        pool = ThreadPool(SCAN_CONCURRENCY)
+        try:
+            old_entries = pool.map(find_old_entries, client_ids)
+        finally:
+            pool.close()
+            pool.join()
+
+        failures = []
+        for shard, shard_entries in _group_by_shard(client, zip(client_ids, old_entries), key=itemgetter(0)):
+            paths = [path for _, entries in shard_entries for path in entries]
+            for i in range(0, len(paths), batch_size):
+                batch = paths[i:i + batch_size]
+                try:
+                    shard.patch(u"firechannels.json", {path: None for path in batch})
+                    _logger.debug("Trimmed %d messages.", len(batch))
+                except FirebaseError as e:
+                    _logger.warning("Failed to trim %d messages: %s", len(batch), e)
+                    failures.append((batch, e))
+
+        return failures
+
+
+def _encode_log_entry(client, message):
+    entry = _encode_message(client, message)
+    if entry["encoding"] is None:
+        del entry["encoding"]
+
+    # The channel's timestamp is kept up to date so that expired
+    # channels can still be found.
+    key = generate_push_id(entry["timestamp"])
+    return key, {u"log/" + key: entry, "timestamp": entry["timestamp"]}
+
+
+def _encode_message(client, message):
+    encoding, data = client.message_encoder.encode(message)
+    update = {
+        "message": data,
         "timestamp": int(time.time() * 1000),
-    })
+        # Base64 messages are stored without an encoding so that older
+        # clients can still read them.  Updates are merged, so the
+        # field has to be nulled out explicitly.
+        "encoding": encoding if encoding != DEFAULT_ENCODING else None,
+    }
+    if client.chunk_size is not None:
+        # Same goes for the manifest of a chunked message.
+        update["chunks"] = None
+    return update
+
+
+def _should_chunk(client, update):
+    return client.chunk_size is not None and len(update["message"]) > client.chunk_size
+
+
+def _write_chunks(shard, client_id, update, chunk_size):
+    """Write a message's data in chunks, in parallel, and turn its
+    update into a manifest.  The manifest must only be written once
+    this returns so that clients never see partial messages.
+
+    Returns:
+      dict: A multi-location update relative to the root that deletes
+      the chunks of the messages this one supersedes.
+    """
+    data = update["message"]
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    message_id = generate_push_id()
+    path = u"{}/{}".format(CHUNKS_PATH, client_id)
+
+    def write(i):
+        shard.put(u"{}/{}/{}.json".format(path, message_id, i), chunks[i])
+
+    pool = ThreadPool(min(CHUNK_CONCURRENCY, len(chunks)))
+    try:
+        pool.map(write, range(len(chunks)))
+    finally:
+        pool.close()
+        pool.join()
+
+    if isinstance(data, unicode):
+        data = data.encode("utf-8")
+
+    update["message"] = None
+    update["chunks"] = {
+        "id": message_id,
+        "count": len(chunks),
+        "size": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+    }
+
+    return _stale_chunks(shard, client_id, message_id)
+
+
+def _stale_chunks(shard, client_id, message_id):
+    """Find the chunks of the messages sent to a channel before the
+    one with the given id, including messages that aren't chunked.
+
+    Returns:
+      dict: A multi-location update relative to the root that deletes
+      those chunks.
+    """
+    # Push ids are chronological, so newer messages sent concurrently
+    # keep their chunks.
+    path = u"{}/{}".format(CHUNKS_PATH, client_id)
+    existing = shard.get(u"{}.json".format(path), params={"shallow": "true"}) or {}
+    return {u"{}/{}".format(path, key): None for key in existing if key < message_id}
+
+
+def _write_all_chunks(client, shard, updates, failures):
+    cleanups, chunked = {}, []
+    for client_id, update in updates:
+        if client.chunk_size is None:
+            chunked.append((client_id, update))
+            continue
+
+        try:
+            if _should_chunk(client, update):
+                cleanups[client_id] = _write_chunks(shard, client_id, update, client.chunk_size)
+            else:
+                cleanups[client_id] = _stale_chunks(shard, client_id, generate_push_id())
+            chunked.append((client_id, update))
+        except FirebaseError as e:
+            _logger.warning("Failed to write or clean up the chunks of a message to %r: %s", client_id, e)
+            failures.append(([client_id], e))
+
+    return chunked, cleanups
+
+
+def _channel_deletion(client, client_id):
+    update = {u"firechannels/{}".format(client_id): None}
+    if client.chunk_size is not None:
+        update[u"{}/{}".format(CHUNKS_PATH, client_id)] = None
+    return update
+
+
+def _merge(updates):
+    data = {}
+    for update in updates:
+        data.update(update)
+    return data
+
+
+def _group_by_shard(client, items, key=None):
+    if not client.sharded:
+        items = list(items)
+        return [(client, items)] if items else []
+
+    groups = OrderedDict()
+    for item in items:
+        shard = client.shard_for(key(item) if key else item)
+        groups.setdefault(shard, []).append(item)
+
+    return groups.items()
+
+
+def _patch_channels(client, shard, updates, extra=None):
+    index = client.expiry_index
+    if index is None and not extra:
+        return shard.patch(u"firechannels.json", _flatten_updates(updates))
+
+    # Channels are written together with their expiry entries and any
+    # other updates so the update has to be relative to the root.
+    data = dict(extra or {})
+    expires_at = index and index.expires_at()
+    for client_id, update in updates:
+        for key, value in update.items():
+            data[u"firechannels/{}/{}".format(client_id, key)] = value
+
+        if index is not None:
+            data[u"firechannels/{}/expiresAt".format(client_id)] = expires_at
+            data.update(index.entry(client_id, expires_at))
+
+    return shard.patch(u".json", data)
 
 
-def find_all_expired_channels(max_age=3600, firebase_client=None):
+def _flatten_updates(updates):
+    data = {}
+    for client_id, update in updates:
+        for key, value in update.items():
+            data[u"{}/{}".format(client_id, key)] = value
+
+    return data
+
+
+def _estimate_size(client_id, update):
+    return sum(len(client_id) + len(key) + len(json.dumps(value)) + 8 for key, value in update.items())
+
+
+def _batch_updates(updates, max_batch_size):
+    batch, batch_size = [], 2
+    for client_id, update in updates:
+        size = _estimate_size(client_id, update)
+        if batch and batch_size + size > max_batch_size:
+            yield batch
+            batch, batch_size = [], 2
+
+        batch.append((client_id, update))
+        batch_size += size
+
+    if batch:
+        yield batch
+
+
+def find_all_expired_channels(max_age=3600, page_size=1000, firebase_client=None):
     """Returns the ids of any channels to which the last message was
     sent over some number of seconds ago.
 
+    Expired channels are streamed a page at a time using a query
+    ordered by timestamp, which requires an ``.indexOn`` rule for
+    ``timestamp`` under ``firechannels``.  If that index is missing,
+    channel ids are listed shallowly and their timestamps are read in
+    batches instead.
+
+    Sharded clients list the expired channels on each shard in turn.
+
     Parameters:
       max_age(int): Channels that were last sent a message longer than
         this value ago are returned.  Defaults to an hour.
+      page_size(int): The max number of channels to fetch per request.
     """
     client = firebase_client or get_client()
     cutoff = (time.time() - max_age) * 1000
-    channels = client.get("firechannels.json") or {}
-    for client_id, channel in channels.items():
-        if not isinstance(channel, dict):
+    for shard in client.shards:
+        for client_id in _find_all_expired_channels(shard, cutoff, page_size):
             yield client_id
-            continue
 
-        timestamp = channel.get("timestamp", 0)
-        if timestamp <= cutoff:
+
+def _find_all_expired_channels(client, cutoff, page_size):
+    channels = _find_expired_channels_by_index(client, cutoff, page_size)
+    try:
+        first_channel = next(channels)
+    except StopIteration:
+        return
+
+    except BadRequest as e:
+        if "Index not defined" not in e.message:
+            raise
+
+        _logger.warning("Missing timestamp index on firechannels. Falling back to a shallow scan.")
+        channels = _find_expired_channels_by_scan(client, cutoff, page_size)
+        first_channel = next(channels, None)
+        if first_channel is None:
+            return
+
+    yield first_channel
+    for client_id in channels:
+        yield client_id
+
+
+def _get_timestamp(channel):
+    if not isinstance(channel, dict):
+        return None
+    return channel.get("timestamp")
+
+
+def _find_expired_channels_by_index(client, cutoff, page_size):
+    # Channels that share the timestamp at the end of the previous
+    # page are returned again by the next one so we skip those.
+    start, seen = _missing, set()
+    while True:
+        params = {"orderBy": '"timestamp"', "endAt": cutoff, "limitToFirst": page_size + len(seen)}
+        if start is not _missing:
+            params["startAt"] = json.dumps(start)
+
+        channels = client.get(u"firechannels.json", params=params) or {}
+        page = sorted((_get_timestamp(channel), client_id) for client_id, channel in channels.items())
+        for timestamp, client_id in page:
+            if timestamp == start and client_id in seen:
+                continue
+
             yield client_id
+
+        if len(page) < params["limitToFirst"]:
+            return
+
+        last_timestamp = page[-1][0]
+        if last_timestamp != start:
+            start, seen = last_timestamp, set()
+
+        seen.update(client_id for timestamp, client_id in page if timestamp == start)
+
+
+def _find_expired_channels_by_scan(client, cutoff, page_size):
+    channels = client.get(u"firechannels.json", params={"shallow": "true"}) or {}
+
+    def get_timestamp(client_id):
+        # Shallow reads return `true` for nested data and the value
+        # itself for anything else.
+        if channels[client_id] is not True:
+            return client_id, None
+        return client_id, client.get(u"firechannels/{}/timestamp.json".format(client_id))
+
+    pool = ThreadPool(SCAN_CONCURRENCY)
+    try:
+        client_ids = list(channels)
+        for i in range(0, len(client_ids), page_size):
+            for client_id, timestamp in pool.map(get_timestamp, client_ids[i:i + page_size]):
+                if not isinstance(timestamp, (int, long, float)) or timestamp <= cutoff:
+                    yield client_id
+    finally:
+        pool.close()
+        pool.join()
@@ -2,13 +2,12 @@ import hmac
 import json
 import time
 
-import google.auth
-import google.auth.credentials
-
-from google.oauth2 import service_account
-
 from base64 import b64encode, b64decode
+from threading import Lock
 
+# google.auth and its transports are imported where they're used
+# since importing them takes longer than importing the rest of the
+# library combined.  See `Firebase.warm_up`.
 
 try:
     from google.appengine.api import app_identity
@@ -18,8 +17,11 @@ except ImportError:
     ON_APPENGINE = False
 
 
+_encoder = json.JSONEncoder(separators=(",", ":"))
+
+
 def encode(data):
-    return b64encode(json.dumps(data, separators=(",", ":")))
+    return b64encode(_encoder.encode(data))
 
 
 def decode(data):
@@ -36,9 +38,16 @@ SCOPES = [
 IDENTITY_ENDPOINT = "https://identitytoolkit.googleapis.com/google.identity.identitytoolkit.v1.IdentityToolkit"
 
 
+#: The endpoint that serves the public certificates of service accounts.
+CERTIFICATES_ENDPOINT = "https://www.googleapis.com/robot/v1/metadata/x509/{email}"
+
+
 #: The standard token header.
 TOKEN_HEADER = encode({"typ": "JWT", "alg": "RS256"})
 
+#: The prefix shared by every token's signed payload.
+TOKEN_PREFIX = TOKEN_HEADER + "."
+
 
 def get_credentials():
     """Generates a credentials object for the current environment.
@@ -46,6 +55,9 @@ def get_credentials():
     Returns:
       google.auth.credentials.Credentials
     """
+    import google.auth
+    import google.auth.credentials
+
     credentials, _project_id = google.auth.default(scopes=SCOPES)
 
     # Credentials from the GCloud SDK, for example, do not implement Signing.
@@ -70,12 +82,222 @@ def get_service_key_credentials(key_file_path):
     Returns:
       google.auth.credentials.Credentials
     """
+    from google.oauth2 import service_account
+
     return service_account.Credentials.from_service_account_file(
         key_file_path,
         scopes=SCOPES,
     )
 
 
+class LocalSigner(object):
+    """Signs bytes in-process using a service account's private key,
+    which is parsed once up front.
+
+    Parameters:
+      signer_email(str): The email address of the service account.
+      signer(google.auth.crypt.Signer): The signer for its private key.
+    """
+
+    def __init__(self, signer_email, signer):
+        self.signer_email = signer_email
+        self.signer = signer
+
+    @classmethod
+    def from_service_account_info(cls, info):
+        """Build a signer from parsed service account key data.
+
+        Returns:
+          LocalSigner
+        """
+        import google.auth.crypt
+
+        return cls(info["client_email"], google.auth.crypt.RSASigner.from_service_account_info(info))
+
+    @classmethod
+    def from_service_account_file(cls, key_file_path):
+        """Build a signer from a service account key file.
+
+        Returns:
+          LocalSigner
+        """
+        with open(key_file_path) as f:
+            return cls.from_service_account_info(json.load(f))
+
+    @classmethod
+    def from_credentials(cls, credentials):
+        """Build a signer from a set of credentials that have access to
+        a private key.
+
+        Returns:
+          LocalSigner: Or None if the credentials sign bytes remotely.
+        """
+        signer = getattr(credentials, "signer", None)
+        if signer is None:
+            return None
+
+        import google.auth.crypt
+
+        if not isinstance(signer, google.auth.crypt.RSASigner):
+            return None
+        return cls(credentials.signer_email, signer)
+
+    def sign_bytes(self, message):
+        return self.signer.sign(message)
+
+
+def get_signer(credentials, key_file_path=None):
+    """Get the best available signer for a set of credentials.
+
+    Parameters:
+      credentials(Credentials): An OAuth2 credentials object.
+      key_file_path(str): An optional service account key file to sign
+        with locally.
+
+    Returns:
+      LocalSigner: If a private key is available.  Otherwise, the
+      credentials themselves are returned and bytes are signed using
+      them, which may require a remote call (eg. on GAE).
+    """
+    if key_file_path:
+        return LocalSigner.from_service_account_file(key_file_path)
+    return LocalSigner.from_credentials(credentials) or credentials
+
+
+class SignatureVerifier(object):
+    """Verifies token signatures by signing their payloads again and
+    comparing the results.  This requires a private key operation or a
+    remote call for every verification.
+
+    Parameters:
+      signer(LocalSigner): Anything that can sign bytes.
+    """
+
+    def __init__(self, signer):
+        self.signer = signer
+
+    def verify(self, payload, signature):
+        return hmac.compare_digest(signature, self.signer.sign_bytes(payload))
+
+
+class PublicKeyVerifier(object):
+    """Verifies token signatures using a service account's public
+    certificates.  The certificates are fetched the first time they're
+    needed and then cached.  They're refetched at most once every
+    `refresh_interval` seconds when a signature fails to verify, in
+    case the keys have been rotated.  Only one thread fetches them at
+    a time and failed fetches aren't retried for `retry_interval`
+    seconds.
+
+    Parameters:
+      signer_email(str): The email address of the service account.
+      certificates(dict): An optional mapping from key ids to PEM
+        encoded certificates.  Fetched from Google if not provided.
+    """
+
+    #: The min number of seconds between certificate fetches.
+    refresh_interval = 300
+
+    #: The min number of seconds between attempts to fetch the
+    #: certificates, successful or not.
+    retry_interval = 5
+
+    def __init__(self, signer_email, certificates=None):
+        self.signer_email = signer_email
+        self.verifiers = None
+        self.fetched_at = 0
+        self.attempted_at = 0
+        self._mutex = Lock()
+
+        if certificates is not None:
+            self._load(certificates)
+
+    def _load(self, certificates):
+        import google.auth.crypt
+
+        self.verifiers = [google.auth.crypt.RSAVerifier.from_string(cert) for cert in certificates.values()]
+        self.fetched_at = time.time()
+
+    def fetch_certificates(self):
+        import google.auth.exceptions
+        import google.auth.transport.requests
+
+        request = google.auth.transport.requests.Request()
+        response = request(CERTIFICATES_ENDPOINT.format(email=self.signer_email), method="GET")
+        if response.status != 200:
+            raise google.auth.exceptions.TransportError(
+                "Could not fetch certificates for {}".format(self.signer_email)
+            )
+
+        return json.loads(response.data.decode("utf-8"))
+
+    def refresh(self, force=False):
+        """Fetch the service account's certificates unless they were
+        fetched recently.  Even when `force` is True, they're fetched
+        at most once every `retry_interval` seconds.
+
+        Raises:
+          TransportError: When the certificates can't be fetched.
+        """
+        with self._mutex:
+            now = time.time()
+            if now - self.attempted_at < self.retry_interval:
+                return
+
+            if force or now - self.fetched_at >= self.refresh_interval:
+                self.attempted_at = now
+                self._load(self.fetch_certificates())
+
+    def _refresh(self, force=False):
+        import google.auth.exceptions
+
+        try:
+            self.refresh(force)
+        except google.auth.exceptions.TransportError as e:
+            raise ValueError("Could not fetch public certificates: {}".format(e))
+
+    def verify(self, payload, signature):
+        """Verify a signature.
+
+        Raises:
+          ValueError: When the certificates can't be fetched.
+
+        Returns:
+          bool: True if the signature is valid.
+        """
+        if self.verifiers is None:
+            self._refresh(force=True)
+            if self.verifiers is None:
+                raise ValueError("Public certificates are unavailable.")
+
+        for verifier in self.verifiers:
+            if verifier.verify(payload, signature):
+                return True
+
+        fetched_at = self.fetched_at
+        self._refresh()
+        if self.fetched_at == fetched_at:
+            return False
+
+        return self.verify(payload, signature)
+
+
+def get_verifier(signer):
+    """Get the best available token verifier for a signer.
+
+    Parameters:
+      signer(LocalSigner): Anything that can sign bytes.
+
+    Returns:
+      PublicKeyVerifier: If the signer is a service account whose
+      public certificates can be fetched from Google.  Otherwise, a
+      SignatureVerifier is returned.
+    """
+    if signer.signer_email.endswith(".gserviceaccount.com"):
+        return PublicKeyVerifier(signer.signer_email)
+    return SignatureVerifier(signer)
+
+
 def build_token(credentials, params, duration_minutes):
     issuer = credentials.signer_email
     issued_at = int(time.time())
@@ -89,12 +311,12 @@ def build_token(credentials, params, duration_minutes):
     }
     data.update(params)
 
-    payload = TOKEN_HEADER + "." + encode(data)
+    payload = TOKEN_PREFIX + encode(data)
     signature = credentials.sign_bytes(payload)
     return payload + "." + b64encode(signature)
 
 
-def _decode_token(credentials, token, verify):
+def _decode_token(credentials, token, verify, verifier=None):
     try:
         header, data, signature = map(str, token.split("."))
     except ValueError:
@@ -104,16 +326,14 @@ def _decode_token(credentials, token, verify):
         raise ValueError("Invalid token header.")
 
     if verify:
-        payload = header + "." + data
-        given_signature = b64decode(signature)
-        expected_signature = credentials.sign_bytes(payload)
-        if not hmac.compare_digest(given_signature, expected_signature):
+        verifier = verifier or SignatureVerifier(credentials)
+        if not verifier.verify(header + "." + data, b64decode(signature)):
             raise ValueError("Invalid token signature.")
 
     return decode(data)
 
 
-def decode_token_appengine(credentials, token, verify=False):
+def decode_token_appengine(credentials, token, verify=False, verifier=None):
     """Decode a token on AppEngine.
 
     Warning:
@@ -122,10 +342,18 @@ def decode_token_appengine(credentials, token, verify=False):
     return _decode_token(credentials, token, False)
 
 
-def decode_token_service_key(credentials, token, verify=True):
+def decode_token_service_key(credentials, token, verify=True, verifier=None):
     """Decode a token from a service account.
+
+    Parameters:
+      credentials(Credentials): The credentials the token was signed with.
+      token(str): The token to decode.
+      verify(bool): Whether or not to verify the token's signature.
+      verifier(PublicKeyVerifier): The object used to verify the
+        token's signature.  Defaults to signing the token's payload
+        again using the credentials.
     """
-    return _decode_token(credentials, token, verify)
+    return _decode_token(credentials, token, verify, verifier)
 
 
 if ON_APPENGINE:
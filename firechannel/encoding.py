@@ -0,0 +1,177 @@
+import base64
+import zlib
+
+from abc import ABCMeta, abstractmethod
+
+#: The encoding messages are stored with when they don't specify one.
+#: Older clients only understand this one.
+DEFAULT_ENCODING = "base64"
+
+
+class Codec(object):
+    """Base class for message codecs.  Each codec has a unique name
+    that's stored alongside the messages it encodes so that clients
+    know how to decode them.
+    """
+
+    __metaclass__ = ABCMeta
+
+    name = None
+
+    @abstractmethod
+    def encode(self, message):  # pragma: no cover
+        """Encode a message.
+
+        Parameters:
+          message(str)
+
+        Raises:
+          ValueError: When the message can't be encoded by this codec.
+
+        Returns:
+          unicode: A value that can be stored in a JSON string.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def decode(self, data):  # pragma: no cover
+        """Decode a message previously encoded by this codec.
+
+        Returns:
+          str
+        """
+        raise NotImplementedError
+
+
+class RawCodec(Codec):
+    """Stores messages as-is.  Only UTF-8 messages can be stored this way.
+    """
+
+    name = "raw"
+
+    def encode(self, message):
+        if isinstance(message, unicode):
+            return message
+        return message.decode("utf-8")
+
+    def decode(self, data):
+        return data.encode("utf-8")
+
+
+class Base64Codec(Codec):
+    """Stores messages as base64.  This is the default.
+    """
+
+    name = "base64"
+
+    def encode(self, message):
+        if isinstance(message, unicode):
+            message = message.encode("utf-8")
+        return base64.b64encode(message)
+
+    def decode(self, data):
+        return base64.b64decode(data)
+
+
+class DeflateCodec(Codec):
+    """Stores messages compressed using zlib's deflate format and then
+    base64 encoded.
+
+    Parameters:
+      level(int): The compression level, between 1 and 9.
+    """
+
+    name = "deflate"
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def encode(self, message):
+        if isinstance(message, unicode):
+            message = message.encode("utf-8")
+        return base64.b64encode(zlib.compress(message, self.level))
+
+    def decode(self, data):
+        return zlib.decompress(base64.b64decode(data))
+
+
+#: The codecs messages can be decoded with, by name.
+CODECS = {codec.name: codec for codec in (RawCodec(), Base64Codec(), DeflateCodec())}
+
+
+def register_codec(codec):
+    """Register a codec so that `decode_message` can decode messages
+    that were encoded using it.
+
+    Parameters:
+      codec(Codec)
+    """
+    CODECS[codec.name] = codec
+
+
+class MessageEncoder(object):
+    """Chooses how messages are encoded before they are sent.
+
+    Parameters:
+      codec(Codec): The codec used to encode messages.  Messages that
+        the codec can't encode are base64 encoded.
+      compress_threshold(int): Messages at least this many bytes long
+        are compressed, unless that doesn't make them any smaller.
+        None disables compression.
+      compressor(Codec): The codec used to compress messages.
+    """
+
+    def __init__(self, codec=None, compress_threshold=None, compressor=None):
+        self.codec = codec or CODECS[DEFAULT_ENCODING]
+        self.compress_threshold = compress_threshold
+        self.compressor = compressor or CODECS["deflate"]
+
+    def encode(self, message):
+        """Encode a message.
+
+        Parameters:
+          message(str)
+
+        Returns:
+          tuple: The name of the codec that was used and the encoded data.
+        """
+        data = None
+        try:
+            codec, data = self.codec, self.codec.encode(message)
+        except ValueError:
+            codec = CODECS[DEFAULT_ENCODING]
+
+        if self.compress_threshold is not None and len(message) >= self.compress_threshold:
+            compressed = self.compressor.encode(message)
+            if data is None or len(compressed) < len(data):
+                return self.compressor.name, compressed
+
+        if data is None:
+            data = codec.encode(message)
+        return codec.name, data
+
+
+#: The encoder used when clients don't specify one.  It's compatible
+#: with every version of firechannel.js.
+default_encoder = MessageEncoder()
+
+
+def decode_message(data):
+    """Decode a message as stored in Firebase.
+
+    Parameters:
+      data(dict): A channel's data.
+
+    Raises:
+      ValueError: When the message was encoded with an unknown codec.
+
+    Returns:
+      str
+    """
+    encoding = data.get("encoding", DEFAULT_ENCODING)
+    try:
+        codec = CODECS[encoding]
+    except KeyError:
+        raise ValueError("unknown message encoding {!r}".format(encoding))
+
+    return codec.decode(data["message"])
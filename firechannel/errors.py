@@ -33,3 +33,13 @@ class ConnectionError(FirebaseError):
 class Timeout(FirebaseError):
     """Raised on connect or read timeout.
     """
+
+
+class PoolTimeout(Timeout):
+    """Raised when a client can't be reserved from a pool in time.
+    """
+
+
+class CircuitOpen(FirebaseError):
+    """Raised when requests are rejected because of recent failures.
+    """
@@ -0,0 +1,102 @@
+import logging
+import time
+
+from multiprocessing.pool import ThreadPool
+
+_logger = logging.getLogger("firechannel.expiry")
+
+#: The number of concurrent requests used to verify expiry candidates.
+VERIFY_CONCURRENCY = 8
+
+
+class ExpiryIndex(object):
+    """A secondary index from expiry times to channels.
+
+    When a client has an expiry index, creating a channel or sending
+    it a message also records when the channel expires in a bucket
+    under ``firechannelexpiry``, in the same request.  Sweeps then only
+    read the buckets that are due instead of every channel.
+
+    Channels expire `ttl` seconds after they were last written to or,
+    if nothing's been written to them yet, when their token expires.
+
+    Parameters:
+      ttl(int): The number of seconds after the last write that a
+        channel expires.
+      bucket_size(int): The number of seconds covered by each bucket.
+      path(str): Where in the database buckets are stored.
+    """
+
+    def __init__(self, ttl=3600, bucket_size=300, path="firechannelexpiry"):
+        self.ttl = ttl
+        self.bucket_size = bucket_size
+        self.path = path
+
+    def bucket_key(self, expires_at):
+        """Get the key of the bucket for a given expiry time in milliseconds.
+        """
+        return "b%012d" % (expires_at // (self.bucket_size * 1000))
+
+    def expires_at(self, now=None):
+        """Get the expiry time in milliseconds of channels written to now.
+        """
+        return int(((now or time.time()) + self.ttl) * 1000)
+
+    def entry(self, client_id, expires_at):
+        """Get the update that records a channel's expiry time.
+
+        Returns:
+          dict: A multi-location update relative to the root.
+        """
+        return {u"{}/{}/{}".format(self.path, self.bucket_key(expires_at), client_id): expires_at}
+
+    def find_due_buckets(self, client, now=None):
+        """List the buckets whose channels have all expired.
+
+        Returns:
+          list: Bucket keys, oldest first.
+        """
+        now_ms = int((now or time.time()) * 1000)
+        buckets = client.get(u"{}.json".format(self.path), params={"shallow": "true"}) or {}
+
+        # The current bucket isn't due until all of it is in the past.
+        current = self.bucket_key(now_ms)
+        return sorted(bucket for bucket in buckets if bucket < current)
+
+    def find_expired_channels(self, client, bucket, now=None, pool=None):
+        """Get the channels in a bucket that have actually expired.
+
+        Channels that were written to after they were added to the
+        bucket have since moved to a later bucket, so each candidate's
+        current expiry time is checked before it is returned.
+
+        Parameters:
+          pool(ThreadPool): The pool to check candidates on.  Defaults
+            to a pool of `VERIFY_CONCURRENCY` threads.
+
+        Returns:
+          list: Client ids.
+        """
+        now_ms = int((now or time.time()) * 1000)
+        candidates = client.get(u"{}/{}.json".format(self.path, bucket)) or {}
+        if not candidates:
+            return []
+
+        def verify(client_id):
+            expires_at = client.get(u"firechannels/{}/expiresAt.json".format(client_id))
+            return client_id, expires_at is None or expires_at <= now_ms
+
+        if pool is not None:
+            return [client_id for client_id, expired in pool.map(verify, sorted(candidates)) if expired]
+
+        pool = ThreadPool(VERIFY_CONCURRENCY)
+        try:
+            return [client_id for client_id, expired in pool.map(verify, sorted(candidates)) if expired]
+        finally:
+            pool.close()
+            pool.join()
+
+    def delete_bucket(self, client, bucket):
+        """Delete a bucket once its channels have been swept.
+        """
+        client.delete(u"{}/{}.json".format(self.path, bucket))
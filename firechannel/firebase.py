@@ -1,21 +1,59 @@
+import json
 import logging
-import requests
+import time
 
+from datetime import datetime, timedelta
 from functools import partial
-from threading import Lock
+from multiprocessing.pool import ThreadPool
+from Queue import Empty, Queue
+from threading import Lock, Thread
 
-from google.auth.transport.requests import Request
-from google.auth.exceptions import GoogleAuthError
-
-from .credentials import ON_APPENGINE, get_credentials
-from .errors import BadRequest, ConnectionError, NotFound, ServerError, Timeout
+from .cache import TokenCache
+from .credentials import ON_APPENGINE, PublicKeyVerifier, get_credentials, get_signer, get_verifier
+from .encoding import default_encoder
+from .errors import BadRequest, FirebaseError, NotFound, PoolTimeout, ServerError
+from .instrumentation import NullSink
+from .latency import LatencyTracker
 from .pool import ThreadLocalPool
+from .retry import IDEMPOTENT_METHODS, is_transient
+from .transport import RequestsTransport
 
 _logger = logging.getLogger("firechannel.firebase")
 
 #: The max number of times Authorization errors are attempted.
 MAX_AUTH_ATTEMPTS = 3
 
+#: The number of seconds before they expire that access tokens get
+#: refreshed in the background.
+REFRESH_MARGIN = 300
+
+#: The min number of seconds between background refreshes and
+#: between refreshes caused by requests being rejected.
+MIN_REFRESH_INTERVAL = 30
+
+#: The latency percentile after which hedged requests are sent.
+HEDGE_PERCENTILE = 95
+
+#: The max number of hedged requests in flight at once when the
+#: client's pool doesn't have a max size.
+HEDGE_WORKERS = 16
+
+#: Adaptive read timeouts are this many times the p99 latency...
+ADAPTIVE_TIMEOUT_FACTOR = 3
+
+#: ...but never shorter than this many seconds.
+MIN_ADAPTIVE_TIMEOUT = 1.0
+
+#: The default number of seconds by which the clocks of the servers
+#: that create fenced channels and send them messages may disagree.
+FENCE_TOLERANCE = 5
+
+#: The path read to open connections when warming up.  Nothing is
+#: ever stored there so reading it is cheap.
+WARM_UP_PATH = "firechannelwarmup.json"
+
+_missing = object()
+
 
 class Firebase(object):
     """A simple firebase real time database client.
@@ -25,11 +63,64 @@ class Firebase(object):
       credentials(Credentials): An OAuth2 credentials object.
         Optional on Google App Engine.
       timeout(tuple): Connect and read timeout.
+      pool_factory(type): The session pool class to use.
+      transport(Transport): The HTTP transport requests are sent
+        over.  Defaults to `requests`.
+      chunk_size(int): Messages whose encoded data is longer than
+        this many characters are split into chunks of this size that
+        `firechannel.js` reassembles.  None disables chunking.
+      uri_template(str): The template used to build request URIs.
+        Defaults to `URI_TEMPLATE`.
+      signer(LocalSigner): The object used to sign channel tokens.
+        Defaults to signing locally if the credentials have access to
+        a private key and to signing with the credentials otherwise.
+      verifier(PublicKeyVerifier): The object used to verify channel
+        tokens.  Defaults to using the signer's public certificates.
+      token_cache_size(int): The max number of decoded channel tokens
+        to hold on to.
+      fence_channels(bool): When True, `create_channel` doesn't delete
+        existing channels.  Instead, tokens carry a generation and
+        clients ignore any data older than that.
+      fence_tolerance(float): The number of seconds before a fenced
+        token's creation from which data is still let through, so that
+        messages from servers whose clocks lag behind aren't dropped.
+      refresh_margin(int): The number of seconds before it expires
+        that the access token is refreshed in the background.  None
+        disables background refreshes.
+      retry_policy(RetryPolicy): Controls how requests that fail with
+        transient errors are retried.  Defaults to no retries.
+      circuit_breaker(CircuitBreaker): Fails requests fast after
+        sustained errors.  Disabled by default.
+      hedge(bool): When True, idempotent requests that take longer
+        than the observed p95 latency are sent a second time using
+        another session and whichever response comes back first is
+        used.
+      hedge_workers(int): The max number of hedged requests in flight
+        at once.  Requests made while they're all busy are sent
+        without hedging.  Defaults to the max size of the pool.
+      adaptive_timeout(bool): When True, read timeouts are derived
+        from the observed p99 latency, up to the configured timeout.
+        Latencies are tracked separately per method, top-level path
+        and whether or not the request is a query.
+      sink(Sink): Where request and channel metrics get reported.
+        Defaults to discarding them.
+      message_encoder(MessageEncoder): Controls how messages are
+        encoded.  Defaults to base64.
+      expiry_index(ExpiryIndex): When provided, writes to channels
+        also record when they expire so that sweeps only need to
+        look at channels that are due.
     """
 
     URI_TEMPLATE = u"https://{project}.firebaseio.com/{path}"
 
-    def __init__(self, project, credentials=None, timeout=(3.05, 15), pool_factory=ThreadLocalPool):
+    #: Whether or not channels are spread across many databases.
+    sharded = False
+
+    def __init__(self, project, credentials=None, timeout=(3.05, 15), pool_factory=ThreadLocalPool,
+                 uri_template=None, signer=None, verifier=None, token_cache_size=10000,
+                 fence_channels=False, fence_tolerance=FENCE_TOLERANCE, refresh_margin=REFRESH_MARGIN,
+                 retry_policy=None, circuit_breaker=None, hedge=False, hedge_workers=None, adaptive_timeout=False,
+                 sink=None, message_encoder=None, expiry_index=None, transport=None, chunk_size=None):
         if not credentials:
             if not ON_APPENGINE:
                 raise ValueError(
@@ -40,74 +131,418 @@ class Firebase(object):
             credentials = get_credentials()
 
         self.credentials = credentials
+        self.signer = signer or get_signer(credentials)
+        self.verifier = verifier or get_verifier(self.signer)
+        self.token_cache = TokenCache(token_cache_size)
+        self.token_reservoir = None
+        self.fence_channels = fence_channels
+        self.fence_tolerance = fence_tolerance
         self.project = project
         self.timeout = timeout
-        self.pool = pool_factory(requests.Session)
+        self.uri_template = uri_template or Firebase.URI_TEMPLATE
+        self.transport = transport or RequestsTransport()
+        self.pool = pool_factory(self.transport.create_session)
+        self.refresh_margin = refresh_margin
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.hedge = hedge
+        self.hedge_workers = hedge_workers or getattr(self.pool, "max_size", None) or HEDGE_WORKERS
+        self.adaptive_timeout = adaptive_timeout
+        self.latencies = {} if hedge or adaptive_timeout else None
+        self.hedged_count = 0
+        self.refresh_count = 0
+        self.refreshed_at = 0
+        self.unauthorized_refreshed_at = 0
+        self.sink = sink or NullSink()
+        self.message_encoder = message_encoder or default_encoder
+        self.expiry_index = expiry_index
+        self.chunk_size = chunk_size
+        self.shards = [self]
 
         self._access_token_mutex = Lock()
-
-    def __auth(self, request):
-        access_token = self.access_token
-        _logger.debug("Using access token %r.", access_token)
-        request.headers["Authorization"] = "Bearer " + access_token
-        return request
+        self._background_refresh = None
+        self._hedge_executor = None
+        self._hedge_in_flight = 0
+        self._hedge_mutex = Lock()
 
     def __build_uri(self, path):
-        return Firebase.URI_TEMPLATE.format(
+        return self.uri_template.format(
             project=self.project,
             path=path.lstrip("/"),
         )
 
-    def refresh_token(self):
+    @property
+    def database_url(self):
+        return self.__build_uri("").rstrip("/")
+
+    def shard_for(self, client_id):
+        """Get the client for the database a channel lives on.
+
+        Parameters:
+          client_id(str)
+
+        Returns:
+          Firebase
+        """
+        return self
+
+    def refresh_token(self, stale_token=_missing):
+        """Refresh the access token.
+
+        Parameters:
+          stale_token(str): When provided, the access token is only
+            refreshed if it's still equal to this value.  This way,
+            concurrent callers that ran into the same stale token share
+            a single refresh.
+        """
+        with self._access_token_mutex:
+            credentials = self.credentials
+            if stale_token is not _missing and credentials.token != stale_token and credentials.valid:
+                return
+
+            self._refresh_token()
+
+    def _refresh_token(self):
+        from google.auth.transport.requests import Request
+
+        self.credentials.refresh(Request())
+        self.refresh_count += 1
+        self.refreshed_at = time.time()
+        if self.sink.enabled:
+            self.sink.increment("firebase.token_refresh")
+
+    def _refresh_unauthorized_token(self, access_token):
+        """Refresh an access token that Firebase rejected.
+
+        Firebase also rejects requests that are denied by security
+        rules, so refreshes caused by rejected requests happen at most
+        once every `MIN_REFRESH_INTERVAL` seconds.
+
+        Raises:
+          GoogleAuthError: When the token can't be refreshed.
+
+        Returns:
+          bool: False if the request shouldn't be retried.
+        """
+        with self._access_token_mutex:
+            # Only the first request to fail with a given token
+            # refreshes it; everyone else reuses the result.
+            if self.credentials.token != access_token:
+                return True
+
+            if time.time() - self.unauthorized_refreshed_at < MIN_REFRESH_INTERVAL:
+                return False
+
+            self.unauthorized_refreshed_at = time.time()
+            self._refresh_token()
+            return True
+
+    def _refresh_in_background(self, stale_token):
         with self._access_token_mutex:
-            self.credentials.refresh(Request())
+            if self._background_refresh is not None or time.time() - self.refreshed_at < MIN_REFRESH_INTERVAL:
+                return
+
+            self._background_refresh = thread = Thread(
+                target=self._run_background_refresh,
+                args=(stale_token,),
+                name="firechannel-token-refresh",
+            )
+            thread.daemon = True
+
+        thread.start()
+
+    def _run_background_refresh(self, stale_token):
+        from google.auth.exceptions import GoogleAuthError
+
+        try:
+            self.refresh_token(stale_token)
+        except GoogleAuthError as e:
+            _logger.warning("Failed refreshing access token in the background: %s", e)
+        finally:
+            self._background_refresh = None
 
     @property
     def access_token(self):
-        if not self.credentials.valid:
-            self.refresh_token()
-        return self.credentials.token
+        credentials = self.credentials
+        token = credentials.token
+        if not credentials.valid:
+            self.refresh_token(token)
+            return self.credentials.token
 
-    def call(self, method, path, value=None):
+        expiry = credentials.expiry
+        if self.refresh_margin is not None and expiry is not None and \
+           expiry - datetime.utcnow() < timedelta(seconds=self.refresh_margin):
+            self._refresh_in_background(token)
+
+        return token
+
+    def warm_up(self, connections=1, signing=True):
+        """Do the work that would otherwise slow down this client's
+        first requests: fetch an access token, open connections to
+        Firebase and prepare to sign and verify channel tokens.
+
+        Sessions are reserved from the client's pool, so with the
+        default thread-local pool only the calling thread's session
+        is warmed up.  Use a `BoundedPool` to warm up more than one.
+
+        Parameters:
+          connections(int): The number of connections to open to each
+            database.
+          signing(bool): Whether or not to sign a throwaway payload
+            and fetch the certificates tokens are verified with.
+
+        Returns:
+          dict: The number of seconds each step took.
+        """
+        timings = {}
+        started_at = time.time()
+        self.access_token
+        timings["access_token"] = time.time() - started_at
+
+        started_at = time.time()
+        self._open_connections(connections)
+        timings["connections"] = time.time() - started_at
+
+        if signing:
+            started_at = time.time()
+            self.signer.sign_bytes(b"firechannel-warm-up")
+            if isinstance(self.verifier, PublicKeyVerifier) and self.verifier.verifiers is None:
+                self.verifier.refresh(force=True)
+            timings["signing"] = time.time() - started_at
+
+        if self.sink.enabled:
+            for step, elapsed in timings.items():
+                self.sink.timing("firebase.warm_up." + step, elapsed)
+
+        _logger.debug("Warmed up in %.03fs. %r", sum(timings.values()), timings)
+        return timings
+
+    def _open_connections(self, count):
+        # Sharded clients talk to the default database too, eg. to publish to topics.
+        databases = [self] + [shard for shard in self.shards if shard.database_url != self.database_url]
+        databases = [database for database in databases for _ in range(count)]
+        if len(databases) == 1:
+            return databases[0].get(WARM_UP_PATH)
+
+        # Requests have to be in flight at the same time for each of
+        # them to open a connection of its own.
+        pool = ThreadPool(len(databases))
+        try:
+            pool.map(lambda database: database.get(WARM_UP_PATH), databases)
+        finally:
+            pool.close()
+            pool.join()
+
+    def call(self, method, path, value=None, params=None):
         """Call the Firebase API.
 
         Parameters:
           method(str): HTTP method.
           path(str): Request path.
           value(dict): The value to send to Firebase.
+          params(dict): Query string parameters.
+
+        Raises:
+          CircuitOpen: When the circuit breaker is open.
+          FirebaseError: When the request fails.
         """
+        breaker, policy = self.circuit_breaker, self.retry_policy
+        started_at, attempt = time.time(), 1
+        while True:
+            if breaker is not None:
+                breaker.before_call()
+
+            try:
+                if self.hedge and method.upper() in IDEMPOTENT_METHODS:
+                    result = self._call_hedged(method, path, value, params)
+                else:
+                    result = self._call_once(method, path, value, params)
+            except FirebaseError as e:
+                transient = is_transient(e)
+                if breaker is not None and transient:
+                    breaker.record_failure()
+
+                # Any other error means Firebase responded.
+                elif breaker is not None and not isinstance(e, PoolTimeout):
+                    breaker.record_success()
+
+                delay = policy.next_delay(method, e, attempt, started_at) if policy and transient else None
+                if delay is None:
+                    raise
+
+                _logger.debug("Request failed with %r. Retrying in %.02fs. [%d]", e, delay, attempt)
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+    def _get_latency(self, method, path, params):
+        # Shallow scans and paged queries take much longer than reads
+        # and writes of single channels so they're tracked separately.
+        key = method.upper(), path.lstrip("/").split("/", 1)[0].split(".", 1)[0], bool(params)
+        latency = self.latencies.get(key)
+        if latency is None:
+            with self._hedge_mutex:
+                latency = self.latencies.setdefault(key, LatencyTracker())
+        return latency
+
+    def _get_timeout(self, latency):
+        if not self.adaptive_timeout:
+            return self.timeout
+
+        p99 = latency.percentile(99)
+        if p99 is None:
+            return self.timeout
+
+        connect_timeout, read_timeout = self.timeout if isinstance(self.timeout, tuple) else (None, self.timeout)
+        read_timeout = min(read_timeout, max(MIN_ADAPTIVE_TIMEOUT, p99 * ADAPTIVE_TIMEOUT_FACTOR))
+        return connect_timeout, read_timeout
+
+    def _reserve_hedge_worker(self):
+        with self._hedge_mutex:
+            if self._hedge_in_flight >= self.hedge_workers:
+                return False
+
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPool(self.hedge_workers)
+
+            self._hedge_in_flight += 1
+            return True
+
+    def _release_hedge_worker(self):
+        with self._hedge_mutex:
+            self._hedge_in_flight -= 1
+
+    def _call_hedged(self, method, path, value, params):
+        delay = self._get_latency(method, path, params).percentile(HEDGE_PERCENTILE)
+        if delay is None or not self._reserve_hedge_worker():
+            return self._call_once(method, path, value, params)
+
+        results = Queue()
+
+        def attempt():
+            try:
+                results.put((True, self._call_once(method, path, value, params)))
+            except Exception as e:
+                results.put((False, e))
+            finally:
+                self._release_hedge_worker()
+
+        self._hedge_executor.apply_async(attempt)
+        try:
+            succeeded, result = results.get(timeout=delay)
+        except Empty:
+            if not self._reserve_hedge_worker():
+                succeeded, result = results.get()
+            else:
+                _logger.debug("Request took longer than %.03fs. Hedging.", delay)
+                self.hedged_count += 1
+                self._hedge_executor.apply_async(attempt)
+                succeeded, result = results.get()
+
+                # If the first attempt to finish failed, wait for the other one.
+                if not succeeded:
+                    succeeded, other_result = results.get()
+                    if succeeded:
+                        result = other_result
+
+        if not succeeded:
+            raise result
+        return result
+
+    def _call_once(self, method, path, value, params):
+        sink = self.sink
+        if sink.enabled:
+            return self._call_instrumented(sink, method, path, value, params)
+
         with self.pool.reserve() as session:
-            call = getattr(session, method.lower())
-            endpoint = self.__build_uri(path)
-            attempts = 1
+            return self._send(session, method, path, value, params)[1]
 
+    def _call_instrumented(self, sink, method, path, value, params):
+        tags = {"method": method.upper()}
+        span = sink.start_span("firebase.request", tags)
+        started_at = time.time()
+        error = None
+
+        try:
+            with self.pool.reserve() as session:
+                sink.timing("firebase.pool_wait", time.time() - started_at)
+                response, result = self._send(session, method, path, value, params)
+                tags["status"] = response.status_code
+                return result
+
+        except FirebaseError as error:
+            if hasattr(error.cause, "status_code"):
+                tags["status"] = error.cause.status_code
+            sink.increment("firebase.error", tags={"error": type(error).__name__})
+            raise
+
+        finally:
+            sink.timing("firebase.request", time.time() - started_at, tags)
+            if "status" in tags:
+                sink.increment("firebase.status", tags={"status": tags["status"]})
+            sink.finish_span(span, error)
+
+    def _send(self, session, method, path, value, params):
+        from google.auth.exceptions import GoogleAuthError
+
+        transport = self.transport
+        endpoint = self.__build_uri(path)
+        latency = self._get_latency(method, path, params) if self.latencies is not None else None
+        timeout = self._get_timeout(latency)
+        started_at = time.time()
+        attempts = 1
+
+        data = None
+        if value is not None:
+            data = json.dumps(value)
+            if self.sink.enabled:
+                self.sink.increment("firebase.request_bytes", len(data), tags={"method": method.upper()})
+
+        while attempts <= MAX_AUTH_ATTEMPTS:
+            refresh_failed = False
             try:
-                while attempts <= MAX_AUTH_ATTEMPTS:
-                    response = call(endpoint, json=value, auth=self.__auth, timeout=self.timeout)
-                    if response.status_code != 401:
-                        break
+                access_token = self.access_token
+            except GoogleAuthError, e:
+                # The request is still made so that failing to refresh
+                # the token counts as one of the attempts.
+                _logger.warning("Failed refreshing access token: %s", e)
+                access_token, refresh_failed = self.credentials.token or "", True
 
-                    _logger.debug("Access token failed. Retrying. [%d/%d]", attempts, MAX_AUTH_ATTEMPTS)
-                    try:
-                        self.refresh_token()
-                    except GoogleAuthError, e:
-                        _logger.warning("Failed refreshing access token: %s", e)
-                    attempts += 1
+            headers = {"Authorization": "Bearer " + access_token, "Content-Type": "application/json"}
+            response = transport.request(
+                session, method, endpoint, data=data, params=params, headers=headers, timeout=timeout,
+            )
+            if response.status_code != 401:
+                break
+
+            _logger.debug("Access token failed. Retrying. [%d/%d]", attempts, MAX_AUTH_ATTEMPTS)
+            if not refresh_failed:
+                try:
+                    if not self._refresh_unauthorized_token(access_token):
+                        _logger.debug("Access token was refreshed recently. Not retrying.")
+                        break
+                except GoogleAuthError, e:
+                    _logger.warning("Failed refreshing access token: %s", e)
+            attempts += 1
 
-                if response.status_code >= 500:
-                    raise ServerError(response.text, cause=response)
-                elif response.status_code == 404:
-                    raise NotFound(response.text, cause=response)
-                elif response.status_code >= 400:
-                    raise BadRequest(response.text, cause=response)
+        if response.status_code >= 500:
+            raise ServerError(response.text, cause=response)
+        elif response.status_code == 404:
+            raise NotFound(response.text, cause=response)
+        elif response.status_code >= 400:
+            raise BadRequest(response.text, cause=response)
 
-                return response.json()
+        if latency is not None:
+            latency.record(time.time() - started_at)
 
-            except requests.exceptions.Timeout as e:
-                raise Timeout("timeout", cause=e)
+        if self.sink.enabled:
+            self.sink.increment("firebase.response_bytes", len(response.content), tags={"method": method.upper()})
 
-            except requests.exceptions.ConnectionError as e:
-                raise ConnectionError("connection error", cause=e)
+        return response, response.json()
 
     def __getattr__(self, name):
         if name in ("delete", "head", "get", "patch", "post", "put"):
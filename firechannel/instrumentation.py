@@ -0,0 +1,179 @@
+import logging
+import socket
+import time
+
+from collections import defaultdict, deque
+from functools import partial
+from threading import Lock
+
+_logger = logging.getLogger("firechannel.instrumentation")
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+class _Timer(object):
+    def __init__(self, sink, name, tags):
+        self.sink = sink
+        self.name = name
+        self.tags = tags
+
+    def __enter__(self):
+        self.span = self.sink.start_span(self.name, self.tags)
+        self.started_at = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.sink.timing(self.name, time.time() - self.started_at, self.tags)
+        if exc_type is not None:
+            self.sink.increment(self.name + ".error", tags={"error": exc_type.__name__})
+
+        self.sink.finish_span(self.span, exc_value)
+        return False
+
+
+class Sink(object):
+    """Base class for instrumentation sinks.  Every method is a no-op
+    so subclasses only need to implement the ones they care about.
+
+    Sinks must set `enabled` to True, otherwise firechannel skips
+    gathering measurements altogether.
+    """
+
+    enabled = False
+
+    def timing(self, name, seconds, tags=None):
+        """Record a duration.
+        """
+
+    def increment(self, name, value=1, tags=None):
+        """Increment a counter.
+        """
+
+    def start_span(self, name, tags=None):
+        """Called when a timed operation starts.  Override this to
+        integrate with a tracing system.
+
+        Returns:
+          object: A span that gets passed to `finish_span`.
+        """
+
+    def finish_span(self, span, error=None):
+        """Called when a timed operation finishes.
+        """
+
+    def timer(self, name, tags=None):
+        """Returns a context manager that times the block it wraps and
+        counts any errors raised from it.
+        """
+        if not self.enabled:
+            return _null_timer
+        return _Timer(self, name, tags)
+
+
+class NullSink(Sink):
+    """A sink that discards everything.  This is the default.
+    """
+
+
+class MemorySink(Sink):
+    """A sink that keeps measurements in memory.  Useful for tests
+    and for exposing measurements from a debug endpoint.
+
+    Only the most recent durations and spans are kept so that memory
+    use stays flat in long running processes.  Counters are kept for
+    every tag value, named ``<name>.<tag>.<value>``, or
+    ``<name>.<value>`` when the name already ends with the tag.
+
+    Parameters:
+      max_samples(int): The max number of durations to keep per name.
+      max_spans(int): The max number of finished spans to keep.
+    """
+
+    enabled = True
+
+    def __init__(self, max_samples=1000, max_spans=1000):
+        self.timings = defaultdict(partial(deque, maxlen=max_samples))
+        self.counters = defaultdict(int)
+        self.spans = deque(maxlen=max_spans)
+        self._mutex = Lock()
+
+    def timing(self, name, seconds, tags=None):
+        with self._mutex:
+            self.timings[name].append(seconds)
+
+    def increment(self, name, value=1, tags=None):
+        with self._mutex:
+            self.counters[name] += value
+            for tag, tag_value in (tags or {}).items():
+                if name == tag or name.endswith("." + tag):
+                    self.counters["{}.{}".format(name, tag_value)] += value
+                else:
+                    self.counters["{}.{}.{}".format(name, tag, tag_value)] += value
+
+    def start_span(self, name, tags=None):
+        return {"name": name, "tags": tags, "started_at": time.time()}
+
+    def finish_span(self, span, error=None):
+        span["finished_at"] = time.time()
+        span["error"] = error
+        with self._mutex:
+            self.spans.append(span)
+
+    def percentile(self, name, p):
+        """Get a percentile of the durations recorded for a name.
+
+        Returns:
+          float: Or None if nothing has been recorded.
+        """
+        with self._mutex:
+            samples = sorted(self.timings.get(name, ()))
+
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(p / 100.0 * len(samples)))]
+
+
+class StatsdSink(Sink):
+    """A sink that sends measurements to a StatsD server over UDP.
+    Tags are sent using the DogStatsD extension when `use_tags` is
+    True and dropped otherwise.
+
+    Parameters:
+      host(str): The StatsD server's host.
+      port(int): The StatsD server's port.
+      prefix(str): A prefix for every metric name.
+      use_tags(bool): Whether or not to send tags.
+    """
+
+    enabled = True
+
+    def __init__(self, host="127.0.0.1", port=8125, prefix="firechannel", use_tags=False):
+        self.address = (host, port)
+        self.prefix = prefix + "." if prefix else ""
+        self.use_tags = use_tags
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def timing(self, name, seconds, tags=None):
+        self.send(name, "{:.3f}".format(seconds * 1000), "ms", tags)
+
+    def increment(self, name, value=1, tags=None):
+        self.send(name, value, "c", tags)
+
+    def send(self, name, value, kind, tags=None):
+        packet = "{}{}:{}|{}".format(self.prefix, name, value, kind)
+        if self.use_tags and tags:
+            packet += "|#" + ",".join("{}:{}".format(*tag) for tag in sorted(tags.items()))
+
+        try:
+            self.socket.sendto(packet, self.address)
+        except socket.error as e:
+            _logger.debug("Failed to send metric %r: %s", packet, e)
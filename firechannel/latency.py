@@ -0,0 +1,52 @@
+from collections import deque
+from threading import Lock
+
+
+class LatencyTracker(object):
+    """Keeps track of the latencies of the most recent requests.
+
+    Percentiles are recomputed at most once every `refresh_every`
+    samples so that reading them stays cheap.
+
+    Parameters:
+      window(int): The number of samples to hold on to.
+      min_samples(int): The number of samples required before any
+        percentiles are reported.
+      refresh_every(int): The number of samples after which
+        percentiles are recomputed.
+    """
+
+    def __init__(self, window=1000, min_samples=50, refresh_every=50):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.refresh_every = refresh_every
+        self.sorted_samples = []
+        self.stale_samples = 0
+        self._mutex = Lock()
+
+    def record(self, seconds):
+        with self._mutex:
+            self.samples.append(seconds)
+            self.stale_samples += 1
+
+    def percentile(self, p):
+        """Get a percentile of the recorded latencies.
+
+        Parameters:
+          p(float): The percentile to get, between 0 and 100.
+
+        Returns:
+          float: A latency in seconds or None if there aren't enough
+          samples yet.
+        """
+        with self._mutex:
+            if len(self.samples) < self.min_samples:
+                return None
+
+            if self.stale_samples >= self.refresh_every or not self.sorted_samples:
+                self.sorted_samples = sorted(self.samples)
+                self.stale_samples = 0
+
+            samples = self.sorted_samples
+
+        return samples[min(len(samples) - 1, int(p / 100.0 * len(samples)))]
@@ -0,0 +1,375 @@
+import atexit
+import logging
+import sqlite3
+import time
+
+from Queue import Full
+from threading import Condition, Lock, Thread
+
+from .channel import _validate_client_id, delete_channel, delete_channels, get_client, send_message, send_messages
+from .errors import CircuitOpen, FirebaseError, PoolTimeout
+from .ratelimit import RateLimiter
+from .retry import is_transient
+
+_logger = logging.getLogger("firechannel.outbox")
+
+#: The operations an outbox can hold.
+SEND, DELETE = "send", "delete"
+
+#: The max number of seconds `close` waits for pending operations to
+#: be replayed by default.
+CLOSE_TIMEOUT = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS operations (
+  client_id TEXT PRIMARY KEY,
+  seq INTEGER NOT NULL,
+  kind TEXT NOT NULL,
+  message BLOB,
+  queued_at REAL NOT NULL
+)
+"""
+
+
+def _should_defer(error):
+    return is_transient(error) or isinstance(error, (CircuitOpen, PoolTimeout))
+
+
+class Outbox(object):
+    """A durable, on-disk queue for channel operations that couldn't
+    be performed because Firebase was unreachable.
+
+    Operations that fail with transient errors are spooled to a SQLite
+    database instead of raising and a background drainer replays them
+    in bulk once Firebase is healthy again.  The spool holds at most
+    one operation per channel: a newer message or deletion replaces
+    whatever was pending for that channel.  While operations are
+    pending, new ones are spooled straight away so that they can't
+    overtake older ones.  Operations left over from a previous process
+    are replayed as soon as the outbox is created.  Operations that
+    Firebase rejects outright (eg. with a 400) when they're replayed
+    are logged and dropped so that they can't hold up the rest.
+
+    Parameters:
+      path(str): The path to the SQLite database.
+      firebase_client(Firebase): The Firebase client instance to
+        use. This can be omitted on AppEngine.
+      max_pending(int): The max number of channels with pending
+        operations.  Spooling more raises `Queue.Full`.
+      max_bytes(int): The max combined size in bytes of pending
+        messages.  Spooling more raises `Queue.Full`.
+      batch_size(int): The max number of operations replayed per request.
+      drain_rate(float): The max number of operations replayed per
+        second.  Unlimited by default.
+      poll_interval(float): The number of seconds the drainer waits
+        between checks for pending operations.
+      max_backoff(float): The max number of seconds the drainer waits
+        after failing to replay operations.
+    """
+
+    def __init__(self, path, firebase_client=None, max_pending=100000, max_bytes=64 * 1024 * 1024, batch_size=500,
+                 drain_rate=None, poll_interval=1, max_backoff=60):
+        self.path = path
+        self.client = firebase_client or get_client()
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.limiter = drain_rate and RateLimiter(drain_rate, max(drain_rate, batch_size))
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.running = False
+        self.spooled = 0
+        self.replayed = 0
+        self.failures = 0
+        self.dropped = 0
+
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(_SCHEMA)
+        self._mutex = Lock()
+        self._drain_mutex = Lock()
+        self._condition = Condition(Lock())
+        self._thread = None
+        self._atexit_registered = False
+        self._seq, self._bytes = self._execute(
+            "SELECT COALESCE(MAX(seq), 0), COALESCE(SUM(LENGTH(message)), 0) FROM operations",
+        ).fetchone()
+
+        # Replay anything left over from a previous process.
+        if self.pending:
+            self.start()
+
+    def _execute(self, query, params=()):
+        with self._mutex:
+            return self._connection.execute(query, params)
+
+    def start(self):
+        """Start replaying pending operations in the background.
+        """
+        with self._condition:
+            if self.running:
+                return self
+
+            self.running = True
+            self._thread = Thread(target=self._run, name="firechannel-outbox")
+            self._thread.daemon = True
+            self._thread.start()
+
+        # Pending operations are kept on disk so there's no need to
+        # wait on Firebase when the process exits.
+        if not self._atexit_registered:
+            self._atexit_registered = True
+            atexit.register(self.close, 0)
+        return self
+
+    def send_message(self, client_id, message):
+        """Send a message to a channel, spooling it if Firebase is
+        unreachable.  See `send_message`.
+
+        Raises:
+          FirebaseError: When the request fails for any other reason.
+          Queue.Full: When the spool is full.
+          TypeError: When client_id has an invalid type.
+          ValueError: When client_id has an invalid value.
+
+        Returns:
+          bool: True if the message was sent and False if it was spooled.
+        """
+        assert isinstance(message, basestring), "messages must be strings"
+        client_id = _validate_client_id(client_id, firebase_client=self.client)
+        return self._perform(SEND, client_id, message)
+
+    def delete_channel(self, client_id):
+        """Delete a channel, spooling the deletion if Firebase is
+        unreachable.  See `delete_channel`.
+
+        Raises:
+          FirebaseError: When the request fails for any other reason.
+          Queue.Full: When the spool is full.
+          TypeError: When client_id has an invalid type.
+          ValueError: When client_id has an invalid value.
+
+        Returns:
+          bool: True if the channel was deleted and False if the
+          deletion was spooled.
+        """
+        client_id = _validate_client_id(client_id, firebase_client=self.client)
+        return self._perform(DELETE, client_id)
+
+    def _perform(self, kind, client_id, message=None):
+        if not self.pending:
+            try:
+                if kind == SEND:
+                    send_message(client_id, message, firebase_client=self.client)
+                else:
+                    delete_channel(client_id, firebase_client=self.client)
+                return True
+            except FirebaseError as e:
+                if not _should_defer(e):
+                    raise
+
+                _logger.warning("Failed to %s channel %r. Spooling it. (%s)", kind, client_id, e)
+
+        self.spool(kind, client_id, message)
+        return False
+
+    def spool(self, kind, client_id, message=None):
+        """Add an operation to the spool, replacing any operation that
+        was pending for the same channel.
+
+        Raises:
+          Queue.Full: When the spool is full.
+        """
+        if isinstance(message, unicode):
+            message = message.encode("utf-8")
+
+        size = len(message or "")
+        with self._mutex:
+            existing = self._connection.execute(
+                "SELECT COALESCE(LENGTH(message), 0) FROM operations WHERE client_id = ?", (client_id,),
+            ).fetchone()
+            if not existing and self._count() >= self.max_pending:
+                raise Full("too many pending operations")
+
+            replaced_size = existing[0] if existing else 0
+            if self._bytes - replaced_size + size > self.max_bytes:
+                raise Full("too many pending bytes")
+
+            self._seq += 1
+            self._connection.execute(
+                "INSERT OR REPLACE INTO operations (client_id, seq, kind, message, queued_at) VALUES (?, ?, ?, ?, ?)",
+                (client_id, self._seq, kind, None if message is None else sqlite3.Binary(message), time.time()),
+            )
+            self._bytes += size - replaced_size
+            self.spooled += 1
+
+        if not self.running:
+            self.start()
+
+    def _count(self):
+        return self._connection.execute("SELECT COUNT(*) FROM operations").fetchone()[0]
+
+    @property
+    def pending(self):
+        """The number of channels with pending operations.
+        """
+        with self._mutex:
+            return self._count()
+
+    def stats(self):
+        """Returns a dict with information about the outbox.
+        """
+        return {
+            "pending": self.pending,
+            "pending_bytes": self._bytes,
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }
+
+    def drain(self):
+        """Replay a single batch of pending operations.
+
+        Returns:
+          tuple: The number of operations that were replayed and the
+          number that failed.
+        """
+        with self._drain_mutex:
+            return self._drain()
+
+    def _drain(self):
+        rows = self._execute(
+            "SELECT client_id, seq, kind, message FROM operations ORDER BY seq LIMIT ?", (self.batch_size,),
+        ).fetchall()
+        if not rows:
+            return 0, 0
+
+        if self.limiter:
+            self.limiter.acquire(len(rows))
+
+        messages = {client_id: str(message) for client_id, _, kind, message in rows if kind == SEND}
+        deletions = [client_id for client_id, _, kind, _ in rows if kind == DELETE]
+        failed, dropped = set(), set()
+
+        def replay_one(client_id):
+            if client_id in messages:
+                send_message(client_id, messages[client_id], firebase_client=self.client)
+            else:
+                delete_channel(client_id, firebase_client=self.client)
+
+        failures = send_messages(messages, firebase_client=self.client)
+        failures.extend(delete_channels(deletions, firebase_client=self.client))
+        for client_ids, error in failures:
+            if _should_defer(error):
+                failed.update(client_ids)
+            elif len(client_ids) == 1:
+                self._drop(client_ids[0], error, dropped)
+            else:
+                # A single bad operation fails its whole batch, so
+                # the batch is replayed one operation at a time to
+                # find out which ones to drop.
+                for client_id in client_ids:
+                    try:
+                        replay_one(client_id)
+                    except FirebaseError as e:
+                        if _should_defer(e):
+                            failed.add(client_id)
+                        else:
+                            self._drop(client_id, e, dropped)
+
+        # Operations that were replaced while they were being replayed
+        # stay in the spool.
+        with self._mutex:
+            for client_id, seq, _, message in rows:
+                if client_id not in failed:
+                    deleted = self._connection.execute(
+                        "DELETE FROM operations WHERE client_id = ? AND seq = ?", (client_id, seq),
+                    ).rowcount
+                    if deleted:
+                        self._bytes -= len(message or "")
+
+        replayed = len(rows) - len(failed) - len(dropped)
+        self.replayed += replayed
+        self.failures += len(failed)
+        self.dropped += len(dropped)
+        return replayed, len(failed)
+
+    def _drop(self, client_id, error, dropped):
+        _logger.error("Dropping pending operation for channel %r after it was rejected. (%s)", client_id, error)
+        dropped.add(client_id)
+
+    def flush(self, timeout=None):
+        """Replay pending operations until there are none left.
+
+        Parameters:
+          timeout(float): The max number of seconds to wait.  None
+            means wait until Firebase is back, however long that takes.
+
+        Returns:
+          bool: False if some operations were still pending after
+          `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while self.pending:
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                return False
+
+            # Don't wait on a batch the drainer is in the middle of.
+            if not self._drain_mutex.acquire(False):
+                time.sleep(min(0.01, remaining or 0.01))
+                continue
+
+            try:
+                replayed, failed = self._drain()
+            finally:
+                self._drain_mutex.release()
+
+            if failed and not replayed:
+                time.sleep(self.poll_interval if remaining is None else min(self.poll_interval, remaining))
+
+        return True
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """Stop the drainer after trying to replay every pending
+        operation for up to `timeout` seconds.  Operations that are
+        still pending are kept on disk and replayed by the next outbox
+        that uses the same path.
+
+        Returns:
+          bool: False if some operations are still pending.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            running, self.running = self.running, False
+            self._condition.notify_all()
+
+        if running:
+            self._thread.join(None if deadline is None else max(0, deadline - time.time()))
+
+        return self.flush(None if deadline is None else max(0, deadline - time.time()))
+
+    def _run(self):
+        backoff = self.poll_interval
+        while True:
+            with self._condition:
+                if not self.running:
+                    return
+
+                self._condition.wait(backoff)
+                if not self.running:
+                    return
+
+            try:
+                replayed, failed = self.drain()
+                while replayed and not failed:
+                    replayed, failed = self.drain()
+            except Exception:
+                _logger.exception("Failed to replay pending operations.")
+                replayed, failed = 0, 1
+
+            if failed:
+                backoff = min(backoff * 2, self.max_backoff)
+            else:
+                backoff = self.poll_interval
@@ -1,6 +1,12 @@
+import os
+import time
+
 from abc import ABCMeta, abstractmethod
+from collections import deque
 from contextlib import contextmanager
-from threading import local
+from threading import Condition, Lock, local
+
+from .errors import PoolTimeout
 
 
 class Pool(object):
@@ -14,6 +20,9 @@ class Pool(object):
         self.client_args = client_args
         self.client_kwargs = client_kwargs
 
+    def create_client(self):
+        return self.client_factory(*self.client_args, **self.client_kwargs)
+
     @abstractmethod
     @contextmanager
     def reserve(self):  # pragma: no cover
@@ -24,14 +33,172 @@ class ThreadLocalPool(Pool):
     """A pool whose clients are thread-mapped.
     """
 
-    state = local()
+    def __init__(self, client_factory, *client_args, **client_kwargs):
+        super(ThreadLocalPool, self).__init__(client_factory, *client_args, **client_kwargs)
+        self.state = local()
 
     @contextmanager
     def reserve(self):
         client = getattr(self.state, "client", None)
         if client is None:
-            self.state.client = client = self.client_factory(
-                *self.client_args, **self.client_kwargs
-            )
+            self.state.client = client = self.create_client()
 
         yield client
+
+
+class BoundedPool(Pool):
+    """A pool that holds on to at most `max_size` clients.
+
+    Reserving a client when all of them are in use blocks until one is
+    released or until `timeout` seconds pass.  Clients that sit idle
+    for longer than `max_idle` seconds are closed and dropped.  The
+    pool resets itself when it's used from a forked process.
+
+    Use `BoundedPool.configure` to build a pool factory with custom
+    settings, for example::
+
+      Firebase(project, credentials, pool_factory=BoundedPool.configure(max_size=20))
+    """
+
+    #: The max number of clients in this pool.
+    max_size = 10
+
+    #: The max number of seconds to wait for a client to be released.
+    #: None means wait forever.
+    timeout = 30
+
+    #: The number of seconds after which idle clients are dropped.
+    #: None means never.
+    max_idle = 300
+
+    def __init__(self, client_factory, *client_args, **client_kwargs):
+        super(BoundedPool, self).__init__(client_factory, *client_args, **client_kwargs)
+        self._condition = Condition(Lock())
+        self._reset()
+
+    @classmethod
+    def configure(cls, max_size=None, timeout=None, max_idle=None):
+        """Build a subclass of this pool with the given settings.
+
+        Returns:
+          type: A BoundedPool subclass that can be passed to Firebase
+          as a `pool_factory`.
+        """
+        settings = {"__module__": cls.__module__}
+        if max_size is not None:
+            settings["max_size"] = max_size
+        if timeout is not None:
+            settings["timeout"] = timeout
+        if max_idle is not None:
+            settings["max_idle"] = max_idle
+
+        return type(cls.__name__, (cls,), settings)
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.idle = deque()
+        self.in_use = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def reset(self):
+        """Drop all the clients in this pool without closing them.
+        This is called automatically after a fork.
+        """
+        with self._condition:
+            self._reset()
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, timeout=None):
+        """Reserve a client from the pool.
+
+        Parameters:
+          timeout(float): The max number of seconds to wait for a
+            client.  Defaults to the pool's timeout.
+
+        Raises:
+          PoolTimeout: When no client becomes available in time.
+        """
+        client = self._acquire(timeout if timeout is not None else self.timeout)
+        try:
+            yield client
+        finally:
+            self._release(client)
+
+    def stats(self):
+        """Returns a dict of statistics about this pool.
+        """
+        with self._condition:
+            return {
+                "max_size": self.max_size,
+                "in_use": self.in_use,
+                "idle": len(self.idle),
+                "waits": self.waits,
+                "wait_time": self.wait_time,
+                "max_wait_time": self.max_wait_time,
+            }
+
+    def _acquire(self, timeout):
+        started_at = time.time()
+        with self._condition:
+            if self.pid != os.getpid():
+                self._reset()
+
+            evicted = self._evict(started_at)
+            while not self.idle and self.in_use >= self.max_size:
+                remaining = None
+                if timeout is not None:
+                    remaining = started_at + timeout - time.time()
+                    if remaining <= 0:
+                        raise PoolTimeout("timed out waiting for a client")
+
+                self._condition.wait(remaining)
+
+            client = None
+            if self.idle:
+                client, _ = self.idle.pop()
+
+            self.in_use += 1
+            waited = time.time() - started_at
+            if waited > 0.001:
+                self.waits += 1
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+        self._close(evicted)
+        if client is None:
+            try:
+                client = self.create_client()
+            except Exception:
+                self._release(None)
+                raise
+
+        return client
+
+    def _release(self, client):
+        with self._condition:
+            if self.pid != os.getpid():
+                return
+
+            if client is not None:
+                self.idle.append((client, time.time()))
+
+            self.in_use -= 1
+            self._condition.notify()
+
+    def _evict(self, now):
+        evicted = []
+        if self.max_idle is not None:
+            while self.idle and self.idle[0][1] < now - self.max_idle:
+                client, _ = self.idle.popleft()
+                evicted.append(client)
+
+        return evicted
+
+    def _close(self, clients):
+        for client in clients:
+            close = getattr(client, "close", None)
+            if close is not None:
+                close()
@@ -0,0 +1,65 @@
+import random
+import time
+
+from threading import Lock
+
+#: The characters push ids are made of, in lexicographical order.
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+_random = random.SystemRandom()
+_mutex = Lock()
+_last_timestamp = 0
+_last_random = []
+
+
+def encode_timestamp(timestamp):
+    """Encode a timestamp in milliseconds the way it's encoded at the
+    start of push ids.  Push ids generated before that time sort
+    before the returned value.
+
+    Parameters:
+      timestamp(int)
+
+    Returns:
+      str
+    """
+    chars = []
+    for _ in range(8):
+        timestamp, remainder = divmod(int(timestamp), 64)
+        chars.append(PUSH_CHARS[remainder])
+
+    return "".join(reversed(chars))
+
+
+def generate_push_id(timestamp=None):
+    """Generate a chronologically ordered id in the same format as the
+    ones Firebase generates for pushed children.  Ids generated by the
+    same process are strictly increasing, even within a millisecond.
+
+    Parameters:
+      timestamp(int): The time in milliseconds to generate an id for.
+        Defaults to now.
+
+    Returns:
+      str
+    """
+    global _last_timestamp, _last_random
+
+    if timestamp is None:
+        timestamp = int(time.time() * 1000)
+
+    with _mutex:
+        if timestamp <= _last_timestamp:
+            # Increment the random part of the previous id instead of
+            # going back in time.
+            timestamp = _last_timestamp
+            for i in reversed(range(12)):
+                if _last_random[i] != 63:
+                    _last_random[i] += 1
+                    break
+                _last_random[i] = 0
+        else:
+            _last_random = [_random.randrange(64) for _ in range(12)]
+
+        _last_timestamp = timestamp
+        return encode_timestamp(timestamp) + "".join(PUSH_CHARS[i] for i in _last_random)
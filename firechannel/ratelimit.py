@@ -0,0 +1,45 @@
+import time
+
+from threading import Lock
+
+
+class RateLimiter(object):
+    """A token bucket that limits how many operations may be performed
+    per second across threads.
+
+    Parameters:
+      rate(float): The max number of operations per second.
+      burst(float): The max number of operations that may be performed
+        at once.  Defaults to `rate`.
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("rate must be a positive number")
+
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.updated_at = time.time()
+        self._mutex = Lock()
+
+    def acquire(self, amount=1):
+        """Block until `amount` operations may be performed.
+
+        Requests larger than the burst size are allowed through once
+        the bucket is full, after which the bucket goes into debt.
+        """
+        while True:
+            with self._mutex:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                needed = min(amount, self.burst)
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return
+
+                delay = (needed - self.tokens) / self.rate
+
+            time.sleep(delay)
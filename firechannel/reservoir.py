@@ -0,0 +1,135 @@
+import logging
+import time
+
+from collections import deque
+from threading import Condition, Thread
+
+_logger = logging.getLogger("firechannel.reservoir")
+
+#: The fraction of their lifetime ready tokens are held on to for by
+#: default.  This is a minute for tokens that last an hour.
+MAX_AGE_FRACTION = 1 / 60.0
+
+
+class TokenReservoir(object):
+    """Keeps a number of pre-minted tokens ready for each of a set of
+    token durations.  A background thread refills each reservoir up to
+    `size` tokens whenever it drops to `low_watermark` tokens.
+
+    Tokens that have been waiting around for longer than `max_age`
+    seconds are discarded so that handed out tokens are never more
+    than `max_age` seconds short of their requested duration.
+
+    Parameters:
+      mint(callable): A function that takes a duration in minutes and
+        returns a new token.
+      durations(tuple): The token durations to keep tokens ready for.
+      size(int): The max number of tokens to keep ready per duration.
+      low_watermark(int): The number of tokens at which a reservoir
+        gets refilled.  Defaults to a quarter of `size`.
+      max_age(int): The max number of seconds to hold on to a token.
+        Defaults to `MAX_AGE_FRACTION` of each token's duration.
+    """
+
+    def __init__(self, mint, durations=(60,), size=100, low_watermark=None, max_age=None):
+        self.mint = mint
+        self.size = size
+        self.low_watermark = low_watermark if low_watermark is not None else size // 4
+        self.max_age = max_age
+        self.tokens = {duration: deque() for duration in durations}
+        self.max_ages = {
+            duration: max_age if max_age is not None else duration * 60 * MAX_AGE_FRACTION
+            for duration in durations
+        }
+        self.running = False
+        self._condition = Condition()
+        self._thread = None
+
+    def start(self):
+        """Start minting tokens in the background.
+        """
+        with self._condition:
+            if self.running:
+                return self
+
+            self.running = True
+            self._thread = Thread(target=self._run, name="firechannel-token-reservoir")
+            self._thread.daemon = True
+            self._thread.start()
+            return self
+
+    def stop(self):
+        """Stop minting tokens and drop any that are ready.
+        """
+        with self._condition:
+            self.running = False
+            for tokens in self.tokens.values():
+                tokens.clear()
+            self._condition.notify_all()
+
+        if self._thread is not None:
+            self._thread.join()
+
+    def put(self, duration_minutes, token):
+        """Add a ready token for the given duration.
+
+        Raises:
+          KeyError: When tokens aren't kept for that duration.
+        """
+        with self._condition:
+            self.tokens[duration_minutes].append((time.time(), token))
+
+    def take(self, duration_minutes):
+        """Take a ready token for the given duration.
+
+        Returns:
+          str: Or None if there aren't any ready tokens for that duration.
+        """
+        tokens = self.tokens.get(duration_minutes)
+        if tokens is None:
+            return None
+
+        with self._condition:
+            self._discard_stale(duration_minutes, tokens)
+            token = tokens.popleft()[1] if tokens else None
+            if len(tokens) <= self.low_watermark:
+                self._condition.notify()
+
+            return token
+
+    def _discard_stale(self, duration, tokens):
+        cutoff = time.time() - self.max_ages[duration]
+        while tokens and tokens[0][0] < cutoff:
+            tokens.popleft()
+
+    def _needs_refill(self):
+        for duration, tokens in self.tokens.items():
+            self._discard_stale(duration, tokens)
+            if len(tokens) <= self.low_watermark:
+                return duration
+        return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                duration = self._needs_refill()
+                while self.running and duration is None:
+                    self._condition.wait(min(self.max_ages.values()) / 2.0)
+                    duration = self._needs_refill()
+
+                if not self.running:
+                    return
+
+                missing = self.size - len(self.tokens[duration])
+
+            try:
+                minted = [(time.time(), self.mint(duration)) for _ in range(missing)]
+            except Exception:
+                _logger.exception("Failed to mint tokens.")
+                with self._condition:
+                    self._condition.wait(1)
+                continue
+
+            with self._condition:
+                if self.running:
+                    self.tokens[duration].extend(minted)
@@ -0,0 +1,152 @@
+import logging
+import random
+import time
+
+from threading import Lock
+
+from .errors import CircuitOpen, ConnectionError, PoolTimeout, ServerError, Timeout
+
+_logger = logging.getLogger("firechannel.retry")
+
+#: The HTTP methods that are safe to retry.
+IDEMPOTENT_METHODS = frozenset(("GET", "PUT", "PATCH", "DELETE"))
+
+#: The errors that are considered transient.
+TRANSIENT_ERRORS = (ServerError, Timeout, ConnectionError)
+
+
+def is_transient(error):
+    """Returns True if an error signals a problem with Firebase rather
+    than with the request or with the client.
+    """
+    return isinstance(error, TRANSIENT_ERRORS) and not isinstance(error, PoolTimeout)
+
+
+class RetryPolicy(object):
+    """Retries idempotent requests that fail with transient errors.
+
+    Retries are delayed using exponential backoff with full jitter and
+    are abandoned once `deadline` seconds have passed since the first
+    attempt.
+
+    Parameters:
+      max_attempts(int): The max number of attempts per request.
+      backoff(float): The max delay in seconds before the first retry.
+        This doubles with each subsequent retry.
+      max_backoff(float): The max delay in seconds between attempts.
+      deadline(float): The max number of seconds to spend on a request
+        across all attempts.
+      methods(set): The HTTP methods that may be retried.
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.1, max_backoff=2.0, deadline=10.0, methods=IDEMPOTENT_METHODS):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.methods = frozenset(method.upper() for method in methods)
+        self.retries = 0
+        self.giveups = 0
+        self._mutex = Lock()
+
+    def next_delay(self, method, error, attempt, started_at):
+        """Get the number of seconds to wait before retrying a request.
+
+        Parameters:
+          method(str): The HTTP method of the failed request.
+          error(FirebaseError): The error the request failed with.
+          attempt(int): The number of attempts made so far.
+          started_at(float): The time of the first attempt.
+
+        Returns:
+          float: Or None if the request shouldn't be retried.
+        """
+        if method.upper() not in self.methods or not is_transient(error):
+            return None
+
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+        with self._mutex:
+            if attempt >= self.max_attempts or time.time() + delay - started_at >= self.deadline:
+                self.giveups += 1
+                return None
+
+            self.retries += 1
+            return delay
+
+    def stats(self):
+        """Returns a dict of statistics about this policy.
+        """
+        return {"retries": self.retries, "giveups": self.giveups}
+
+
+class CircuitBreaker(object):
+    """Fails requests fast after a number of consecutive transient
+    errors.
+
+    After `failure_threshold` consecutive failures, the circuit opens
+    and every request is rejected with a `CircuitOpen` error for
+    `cooldown` seconds.  After that, a single trial request is let
+    through: if it succeeds, the circuit closes again, otherwise it
+    reopens for another cooldown period.
+
+    Parameters:
+      failure_threshold(int): The number of consecutive failures after
+        which the circuit opens.
+      cooldown(float): The number of seconds the circuit stays open.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold=5, cooldown=30):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.trial_started_at = 0
+        self.times_opened = 0
+        self.rejected = 0
+        self._mutex = Lock()
+
+    def before_call(self):
+        """Raises CircuitOpen if a request may not be made right now.
+        """
+        with self._mutex:
+            if self.state == CircuitBreaker.CLOSED:
+                return
+
+            # Trial requests that never report back are given up on
+            # after a cooldown period.
+            now = time.time()
+            if now - max(self.opened_at, self.trial_started_at) >= self.cooldown:
+                self.state = CircuitBreaker.HALF_OPEN
+                self.trial_started_at = now
+                return
+
+            self.rejected += 1
+            raise CircuitOpen("circuit open after {} consecutive failures".format(self.failures))
+
+    def record_success(self):
+        with self._mutex:
+            self.state = CircuitBreaker.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._mutex:
+            self.failures += 1
+            if self.state == CircuitBreaker.HALF_OPEN or \
+               (self.state == CircuitBreaker.CLOSED and self.failures >= self.failure_threshold):
+                _logger.warning("Opening circuit after %d consecutive failures.", self.failures)
+                self.state = CircuitBreaker.OPEN
+                self.opened_at = time.time()
+                self.times_opened += 1
+
+    def stats(self):
+        """Returns a dict describing the state of this circuit breaker.
+        """
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
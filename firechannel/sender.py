@@ -0,0 +1,237 @@
+import atexit
+import logging
+import time
+
+from collections import OrderedDict
+from Queue import Full
+from threading import Condition, Thread
+
+from .channel import _validate_client_id, append_messages, get_client, send_messages, trim_channel_logs
+
+_logger = logging.getLogger("firechannel.sender")
+
+
+class BackgroundSender(object):
+    """Sends messages from a background thread so that callers don't
+    have to wait on Firebase.
+
+    Since channels only ever expose their latest message, pending
+    messages are coalesced per channel so that only the last message
+    sent to each channel is written.  Pending messages are flushed
+    using multi-location updates once `batch_size` channels have
+    pending messages or `flush_interval` seconds after the first
+    message is queued, whichever comes first.
+
+    In log mode, messages are appended to channel logs instead (see
+    `append_message`) so none of them are coalesced.  Messages sent to
+    the same channel are written in order and, if `max_log_length` or
+    `max_log_age` are set, the logs of the channels that were written
+    to are trimmed every `trim_interval` seconds.
+
+    Parameters:
+      firebase_client(Firebase): The Firebase client instance to
+        use. This can be omitted on AppEngine.
+      max_pending(int): The max number of channels with pending
+        messages (or of pending messages in log mode).  Sending blocks
+        once this limit is reached.
+      batch_size(int): The number of pending channels (or messages in
+        log mode) that triggers an immediate flush.
+      flush_interval(float): The max number of seconds a message
+        waits before being flushed.
+      on_error(callable): Called with a list of client ids and an
+        error whenever a batch fails.  Failures are logged by default.
+      log(bool): Whether or not to append messages to channel logs.
+      max_log_length(int): The max number of messages to keep in each
+        channel's log.
+      max_log_age(int): The max age in seconds of messages in logs.
+      trim_interval(float): The min number of seconds between trims.
+    """
+
+    def __init__(self, firebase_client=None, max_pending=10000, batch_size=500, flush_interval=0.05,
+                 on_error=None, log=False, max_log_length=None, max_log_age=None, trim_interval=60):
+        self.client = firebase_client or get_client()
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_error = on_error or self._log_error
+        self.log = log
+        self.max_log_length = max_log_length
+        self.max_log_age = max_log_age
+        self.trim_interval = trim_interval
+        self.pending = OrderedDict()
+        self.pending_count = 0
+        self.untrimmed = set()
+        self.trimmed_at = time.time()
+        self.pending_since = None
+        self.in_flight = 0
+        self.running = False
+        self._condition = Condition()
+        self._thread = None
+
+    def start(self):
+        """Start sending messages in the background.  Pending messages
+        are flushed when the process exits.
+        """
+        with self._condition:
+            if self.running:
+                return self
+
+            self.running = True
+            self._thread = Thread(target=self._run, name="firechannel-sender")
+            self._thread.daemon = True
+            self._thread.start()
+
+        atexit.register(self.close)
+        return self
+
+    def send(self, client_id, message, timeout=None):
+        """Queue a message to be sent to a channel.
+
+        Parameters:
+          client_id(str): A string to identify this channel in Firebase.
+          message(str): A string representing the message to send.
+          timeout(float): The max number of seconds to wait for room in
+            the queue.  None means wait forever.
+
+        Raises:
+          Queue.Full: When the queue is still full after `timeout` seconds.
+          TypeError: When client_id has an invalid type.
+          ValueError: When client_id has an invalid value.
+        """
+        assert isinstance(message, basestring), "messages must be strings"
+        client_id = _validate_client_id(client_id, firebase_client=self.client)
+        if not self.running:
+            self.start()
+
+        deadline = timeout is not None and time.time() + timeout
+        with self._condition:
+            while (self.log or client_id not in self.pending) and self.pending_count >= self.max_pending:
+                remaining = deadline and deadline - time.time()
+                if deadline and remaining <= 0:
+                    raise Full("too many pending messages")
+
+                self._condition.wait(remaining or None)
+
+            if self.log:
+                self.pending.setdefault(client_id, []).append(message)
+                self.pending_count += 1
+
+            else:
+                self.pending_count += client_id not in self.pending
+                self.pending[client_id] = message
+
+            if self.pending_since is None:
+                self.pending_since = time.time()
+                self._condition.notify_all()
+
+            elif self.pending_count >= self.batch_size:
+                self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait for all pending messages to be written.
+
+        Returns:
+          bool: False if some messages were still pending after
+          `timeout` seconds.
+        """
+        deadline = timeout is not None and time.time() + timeout
+        with self._condition:
+            if self.pending:
+                self.pending_since = 0
+                self._condition.notify_all()
+
+            while self.pending or self.in_flight:
+                remaining = deadline and deadline - time.time()
+                if deadline and remaining <= 0:
+                    return False
+
+                self._condition.wait(remaining or None)
+
+            return True
+
+    def close(self, timeout=None):
+        """Flush all pending messages and stop the background thread.
+
+        Returns:
+          bool: False if some messages were still pending after
+          `timeout` seconds.
+        """
+        if not self.running:
+            return not self.pending
+
+        flushed = self.flush(timeout)
+        with self._condition:
+            self.running = False
+            self._condition.notify_all()
+
+        self._thread.join(timeout)
+        return flushed
+
+    def _take_batch(self):
+        with self._condition:
+            while self.running or self.pending:
+                if self.pending:
+                    delay = self.pending_since + self.flush_interval - time.time()
+                    if delay <= 0 or self.pending_count >= self.batch_size or not self.running:
+                        break
+                else:
+                    delay = None
+
+                self._condition.wait(delay)
+            else:
+                return None
+
+            batch, self.pending = self.pending, OrderedDict()
+            self.pending_count = 0
+            self.pending_since = None
+            self.in_flight += 1
+            self._condition.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+
+            try:
+                if self.log:
+                    messages = [(client_id, message) for client_id, messages in batch.items() for message in messages]
+                    failures = append_messages(messages, firebase_client=self.client)
+                else:
+                    failures = send_messages(batch, firebase_client=self.client)
+
+                for client_ids, error in failures:
+                    self.on_error(client_ids, error)
+            except Exception as e:
+                self.on_error(list(batch), e)
+            finally:
+                with self._condition:
+                    self.in_flight -= 1
+                    self._condition.notify_all()
+
+            if self.log:
+                self._trim(batch)
+
+    def _trim(self, batch):
+        if self.max_log_length is None and self.max_log_age is None:
+            return
+
+        self.untrimmed.update(batch)
+        if time.time() - self.trimmed_at < self.trim_interval:
+            return
+
+        client_ids, self.untrimmed = list(self.untrimmed), set()
+        self.trimmed_at = time.time()
+        try:
+            failures = trim_channel_logs(
+                client_ids, max_length=self.max_log_length, max_age=self.max_log_age,
+                firebase_client=self.client,
+            )
+            for paths, error in failures:
+                _logger.warning("Failed to trim %d messages: %s", len(paths), error)
+        except Exception as e:
+            _logger.warning("Failed to trim %d channel logs: %s", len(client_ids), e)
+
+    def _log_error(self, client_ids, error):
+        _logger.error("Failed to send messages to %d channels: %s", len(client_ids), error)
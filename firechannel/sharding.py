@@ -0,0 +1,84 @@
+import hashlib
+
+from .firebase import Firebase
+
+
+class ShardedFirebase(Firebase):
+    """A Firebase client that spreads channels across many Realtime
+    Database instances.
+
+    Each channel is mapped to one of the instances using rendezvous
+    hashing, so the mapping is stable and adding an instance only
+    moves the channels that end up on it.  Tokens carry the URL of
+    the instance their channel lives on in their ``db`` claim.
+    Requests that aren't about a specific channel, such as publishing
+    to a topic, go to the project's default database.
+
+    Parameters:
+      project(str): The name of the project.
+      databases(list): The names (or URLs) of the database instances
+        to spread channels across.
+      uri_template(str): The template used to build request URIs for
+        the default database and for databases given by name.
+      credentials(Credentials): An OAuth2 credentials object.
+        Optional on Google App Engine.
+      circuit_breaker_factory(callable): Called with no arguments to
+        build a separate `CircuitBreaker` for each database so that
+        one instance failing doesn't cut off the others.
+      **options: Any other options are passed to each of the
+        underlying `Firebase` clients.
+
+    Raises:
+      ValueError: When no databases are given or when a single
+        `circuit_breaker` is given instead of a factory.
+    """
+
+    sharded = True
+
+    def __init__(self, project, databases, credentials=None, uri_template=None, circuit_breaker_factory=None,
+                 **options):
+        if not databases:
+            raise ValueError("databases must contain at least one database")
+
+        if options.pop("circuit_breaker", None) is not None:
+            raise ValueError(
+                "Sharded clients can't share a circuit breaker between databases. "
+                "Pass a circuit_breaker_factory instead, eg. circuit_breaker_factory=CircuitBreaker."
+            )
+
+        def build_breaker():
+            return circuit_breaker_factory() if circuit_breaker_factory is not None else None
+
+        super(ShardedFirebase, self).__init__(
+            project, credentials, uri_template=uri_template, circuit_breaker=build_breaker(), **options
+        )
+        options.update(
+            credentials=self.credentials, signer=self.signer, verifier=self.verifier, transport=self.transport,
+        )
+        self.shards = [
+            self._build_shard(database, uri_template, dict(options, circuit_breaker=build_breaker()))
+            for database in databases
+        ]
+        self._shard_keys = [shard.database_url.encode("utf-8") for shard in self.shards]
+
+        for shard in self.shards:
+            shard.token_cache = self.token_cache
+
+    @staticmethod
+    def _build_shard(database, uri_template, options):
+        if "://" in database:
+            return Firebase(database, uri_template=database.rstrip("/") + "/{path}", **options)
+        return Firebase(database, uri_template=uri_template, **options)
+
+    def shard_for(self, client_id):
+        """Get the client for the database a channel lives on.
+
+        Parameters:
+          client_id(str)
+
+        Returns:
+          Firebase
+        """
+        client_id = client_id.encode("utf-8")
+        scores = [hashlib.md5(key + b"/" + client_id).digest() for key in self._shard_keys]
+        return self.shards[scores.index(max(scores))]
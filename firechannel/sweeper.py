@@ -0,0 +1,181 @@
+import logging
+import time
+
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+from threading import BoundedSemaphore
+
+from .channel import MAX_DELETE_BATCH_SIZE, _validate_client_id, delete_channels, find_all_expired_channels, get_client
+from .ratelimit import RateLimiter
+
+_logger = logging.getLogger("firechannel.sweeper")
+
+#: The result of a sweep.
+SweepResult = namedtuple("SweepResult", ("deleted", "failed", "elapsed"))
+
+
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def _valid_client_ids(client, client_ids):
+    # Channels written by something other than firechannel can have
+    # ids it would refuse, which mustn't stop the rest from being swept.
+    for client_id in client_ids:
+        try:
+            yield _validate_client_id(client_id, firebase_client=client)
+        except (TypeError, ValueError) as e:
+            _logger.warning("Skipping channel %r with an invalid id: %s", client_id, e)
+
+
+def _delete_in_batches(pool, slots, client, client_ids, limiter, batch_size):
+    """Delete channels in batches on a pool, with at most as many
+    batches in flight as there are `slots`.
+
+    Returns:
+      list: One AsyncResult per batch, each holding the number of
+      channels that were deleted and the number that failed.
+    """
+    def delete_batch(batch):
+        try:
+            if limiter:
+                limiter.acquire(len(batch))
+
+            failures = delete_channels(batch, batch_size=batch_size, firebase_client=client)
+            failed = sum(len(failed_batch) for failed_batch, _ in failures)
+            return len(batch) - failed, failed
+        finally:
+            slots.release()
+
+    results = []
+    for batch in _chunked(client_ids, batch_size):
+        slots.acquire()
+        results.append(pool.apply_async(delete_batch, (batch,)))
+
+    return results
+
+
+def sweep_expired_channels(max_age=3600, concurrency=4, max_rate=None,
+                           batch_size=MAX_DELETE_BATCH_SIZE, firebase_client=None):
+    """Delete all channels to which the last message was sent over
+    some number of seconds ago.
+
+    Expired channels are deleted in batches using `delete_channels`,
+    with up to `concurrency` batches in flight at a time.  Sharded
+    clients sweep every shard in parallel, each with its own
+    `concurrency` and `max_rate`.
+
+    Clients with an expiry index only look at the buckets that are
+    due, in which case `max_age` is ignored in favor of the index's
+    `ttl`.  The candidates in each bucket are checked on the same
+    `concurrency` threads the deletes are sent from.
+
+    Parameters:
+      max_age(int): Channels that were last sent a message longer than
+        this value ago are deleted.  Defaults to an hour.
+      concurrency(int): The max number of concurrent delete requests.
+      max_rate(float): The max number of channels to delete per
+        second.  Unlimited by default.
+      batch_size(int): The max number of channels to delete per request.
+      firebase_client(Firebase): The Firebase client instance to
+        use. This can be omitted on AppEngine.
+
+    Returns:
+      SweepResult: The number of channels that were deleted, the
+      number of channels that couldn't be deleted and the number of
+      seconds the sweep took.
+    """
+    client = firebase_client or get_client()
+    if client.sharded:
+        return _sweep_shards(client, max_age, concurrency, max_rate, batch_size)
+
+    limiter = max_rate and RateLimiter(max_rate)
+    if client.expiry_index is not None:
+        return _sweep_expiry_index(client, limiter, concurrency, batch_size)
+
+    slots = BoundedSemaphore(concurrency)
+    started_at = time.time()
+    pool = ThreadPool(concurrency)
+    try:
+        expired_channels = find_all_expired_channels(max_age=max_age, firebase_client=client)
+        results = _delete_in_batches(
+            pool, slots, client, _valid_client_ids(client, expired_channels), limiter, batch_size,
+        )
+        counts = [result.get() for result in results]
+    finally:
+        pool.close()
+        pool.join()
+
+    deleted = sum(batch_deleted for batch_deleted, _ in counts)
+    failed = sum(batch_failed for _, batch_failed in counts)
+    result = SweepResult(deleted, failed, time.time() - started_at)
+    _logger.info(
+        "Deleted %d expired channels in %.02f seconds (%d failed).",
+        result.deleted, result.elapsed, result.failed,
+    )
+    return result
+
+
+def _sweep_shards(client, max_age, concurrency, max_rate, batch_size):
+    def sweep(shard):
+        return sweep_expired_channels(max_age, concurrency, max_rate, batch_size, firebase_client=shard)
+
+    started_at = time.time()
+    pool = ThreadPool(len(client.shards))
+    try:
+        results = pool.map(sweep, client.shards)
+    finally:
+        pool.close()
+        pool.join()
+
+    return SweepResult(
+        sum(result.deleted for result in results),
+        sum(result.failed for result in results),
+        time.time() - started_at,
+    )
+
+
+def _sweep_expiry_index(client, limiter, concurrency, batch_size):
+    index, deleted, failed = client.expiry_index, 0, 0
+    slots = BoundedSemaphore(concurrency)
+    started_at = time.time()
+    pool = ThreadPool(concurrency)
+    try:
+        # The next bucket's candidates are checked while the previous
+        # bucket's channels are being deleted.
+        buckets = []
+        for bucket in index.find_due_buckets(client, started_at):
+            client_ids = index.find_expired_channels(client, bucket, started_at, pool=pool)
+            results = _delete_in_batches(
+                pool, slots, client, _valid_client_ids(client, client_ids), limiter, batch_size,
+            )
+            buckets.append((bucket, results))
+
+        for bucket, results in buckets:
+            counts = [result.get() for result in results]
+            bucket_failed = sum(batch_failed for _, batch_failed in counts)
+            deleted += sum(batch_deleted for batch_deleted, _ in counts)
+            failed += bucket_failed
+
+            # Buckets are kept around until all of their channels are
+            # deleted so that failed channels are retried by the next sweep.
+            if not bucket_failed:
+                index.delete_bucket(client, bucket)
+    finally:
+        pool.close()
+        pool.join()
+
+    result = SweepResult(deleted, failed, time.time() - started_at)
+    _logger.info(
+        "Deleted %d expired channels from the expiry index in %.02f seconds (%d failed).",
+        result.deleted, result.elapsed, result.failed,
+    )
+    return result
@@ -0,0 +1,392 @@
+"""An in-process stand-in for the Firebase Realtime Database REST API.
+
+It supports GET, PUT, PATCH, POST and DELETE, multi-location updates,
+``shallow`` reads and ordered queries, which is enough to exercise
+firechannel without a real Firebase project::
+
+  with FakeFirebaseServer(latency=0.01) as server:
+      client = server.client()
+      token = create_channel(firebase_client=client)
+"""
+import datetime
+import hashlib
+import hmac
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from urlparse import parse_qs, urlparse
+
+import google.auth.credentials
+
+from .firebase import Firebase
+
+#: The email address fake credentials sign tokens as.
+SIGNER_EMAIL = "firechannel@fake-firebase.test"
+
+
+class FakeCredentials(google.auth.credentials.Credentials, google.auth.credentials.Signing):
+    """Credentials that get their access tokens from a fake server and
+    sign bytes using HMAC.
+
+    Parameters:
+      server(FakeFirebaseServer)
+    """
+
+    def __init__(self, server):
+        super(FakeCredentials, self).__init__()
+        self.server = server
+        self.secret = server.secret
+        self.refresh_count = 0
+
+    def refresh(self, request):
+        self.token, self.expiry = self.server.issue_token()
+        self.refresh_count += 1
+
+    def sign_bytes(self, message):
+        return hmac.new(self.secret, message, hashlib.sha256).digest()
+
+    @property
+    def signer_email(self):
+        return SIGNER_EMAIL
+
+    @property
+    def signer(self):
+        return None
+
+
+def _rank(value):
+    if value is None:
+        return 0, None
+    elif value is False or value is True:
+        return 1, value
+    elif isinstance(value, (int, long, float)):
+        return 2, value
+    elif isinstance(value, basestring):
+        return 3, value
+    return 4, None
+
+
+def _sort_key(order_by, key, value):
+    if order_by == "$key":
+        return _rank(key), key
+
+    elif order_by == "$value":
+        return _rank(value), key
+
+    child = value.get(order_by) if isinstance(value, dict) else None
+    return _rank(child), key
+
+
+class Store(object):
+    """A thread-safe JSON tree.
+    """
+
+    def __init__(self, data=None):
+        self.data = data or {}
+        self.mutex = threading.Lock()
+
+    @staticmethod
+    def split(path):
+        return [segment for segment in path.split("/") if segment]
+
+    def get(self, path):
+        with self.mutex:
+            node = self.data
+            for segment in self.split(path):
+                if not isinstance(node, dict) or segment not in node:
+                    return None
+                node = node[segment]
+            return json.loads(json.dumps(node))
+
+    def set(self, path, value):
+        with self.mutex:
+            self._set(self.split(path), value)
+
+    def update(self, path, values):
+        with self.mutex:
+            for key, value in values.items():
+                self._set(self.split(path) + self.split(key), value)
+
+    def _set(self, segments, value):
+        if value in (None, {}):
+            return self._delete(segments)
+
+        if not segments:
+            self.data = value
+            return
+
+        node = self.data
+        for segment in segments[:-1]:
+            if not isinstance(node.get(segment), dict):
+                node[segment] = {}
+            node = node[segment]
+
+        node[segments[-1]] = value
+
+    def _delete(self, segments):
+        if not segments:
+            self.data = {}
+            return
+
+        parents, node = [], self.data
+        for segment in segments[:-1]:
+            if not isinstance(node.get(segment), dict):
+                return
+            parents.append((node, segment))
+            node = node[segment]
+
+        node.pop(segments[-1], None)
+        for parent, segment in reversed(parents):
+            if parent[segment]:
+                break
+            del parent[segment]
+
+
+class FakeFirebaseServer(ThreadingMixIn, HTTPServer):
+    """A fake Firebase Realtime Database server that runs on a
+    background thread.
+
+    Parameters:
+      latency(float): The number of seconds to wait before handling
+        each request.  May also be a callable returning that number.
+      error_rate(float): The fraction of requests that fail with a 503.
+      token_ttl(int): The number of seconds access tokens are valid for.
+      indexes(dict): A mapping from paths to the children that are
+        indexed under them.  Ordered queries on children that aren't
+        indexed fail the same way they do on Firebase.  When None,
+        every child is considered indexed.
+      host(str): The host to listen on.
+      port(int): The port to listen on.  Defaults to a random port.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency=0, error_rate=0, token_ttl=3600, indexes=None, host="127.0.0.1", port=0):
+        HTTPServer.__init__(self, (host, port), _RequestHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.token_ttl = token_ttl
+        self.indexes = indexes
+        self.secret = uuid.uuid4().hex
+        self.store = Store()
+        self.tokens = {}
+        self.requests = []
+        self.connections = set()
+        self.thread = None
+        self._mutex = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://{}:{}".format(*self.server_address)
+
+    @property
+    def uri_template(self):
+        return self.url + "/{path}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="fake-firebase")
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+        with self._mutex:
+            connections, self.connections = self.connections, set()
+
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def get_request(self):
+        request, client_address = HTTPServer.get_request(self)
+        with self._mutex:
+            self.connections.add(request)
+        return request, client_address
+
+    def shutdown_request(self, request):
+        with self._mutex:
+            self.connections.discard(request)
+        HTTPServer.shutdown_request(self, request)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def credentials(self):
+        """Returns a new set of credentials that are valid for this server.
+        """
+        return FakeCredentials(self)
+
+    def client(self, **options):
+        """Returns a new Firebase client that talks to this server.
+        """
+        options.setdefault("uri_template", self.uri_template)
+        return Firebase("fake", self.credentials(), **options)
+
+    def issue_token(self):
+        token = uuid.uuid4().hex
+        expires_at = time.time() + self.token_ttl
+        with self._mutex:
+            self.tokens[token] = expires_at
+        return token, datetime.datetime.utcfromtimestamp(expires_at)
+
+    def expire_tokens(self):
+        """Expire every access token issued so far so that the next
+        request made with each of them fails with a 401.
+        """
+        with self._mutex:
+            self.tokens.clear()
+
+    def is_authorized(self, header):
+        if not header or not header.startswith("Bearer "):
+            return False
+
+        with self._mutex:
+            return self.tokens.get(header[len("Bearer "):], 0) > time.time()
+
+    def is_indexed(self, path, order_by):
+        if self.indexes is None or order_by in ("$key", "$value"):
+            return True
+        return order_by in self.indexes.get("/".join(Store.split(path)), ())
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request(self.handle_get)
+
+    def do_PUT(self):
+        self.handle_request(self.handle_put)
+
+    def do_PATCH(self):
+        self.handle_request(self.handle_patch)
+
+    def do_POST(self):
+        self.handle_request(self.handle_post)
+
+    def do_DELETE(self):
+        self.handle_request(self.handle_delete)
+
+    def handle_request(self, handler):
+        server = self.server
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        body = self.rfile.read(int(self.headers.getheader("content-length") or 0))
+        server.requests.append((self.command, url.path))
+
+        latency = server.latency() if callable(server.latency) else server.latency
+        if latency:
+            time.sleep(latency)
+
+        if server.error_rate and random.random() < server.error_rate:
+            return self.respond(503, {"error": "Service Unavailable"})
+
+        if not server.is_authorized(self.headers.getheader("authorization")):
+            return self.respond(401, {"error": "Unauthorized request."})
+
+        if not url.path.endswith(".json"):
+            return self.respond(404, {"error": "Not Found"})
+
+        try:
+            value = json.loads(body) if body else None
+            status, data = handler(url.path[:-len(".json")], value, params)
+        except ValueError as e:
+            status, data = 400, {"error": str(e)}
+
+        self.respond(status, data)
+
+    def handle_get(self, path, value, params):
+        data = self.server.store.get(path)
+        if params.get("shallow") == "true":
+            if params.keys() != ["shallow"]:
+                raise ValueError("Mixing 'shallow' and querying parameters is not supported")
+
+            if isinstance(data, dict):
+                data = {key: True if isinstance(child, dict) else child for key, child in data.items()}
+            return 200, data
+
+        if "orderBy" in params:
+            return 200, self.query(path, data, params)
+
+        return 200, data
+
+    def query(self, path, data, params):
+        order_by = json.loads(params["orderBy"])
+        if not self.server.is_indexed(path, order_by):
+            raise ValueError('Index not defined, add ".indexOn": "{}", for path "/{}", to the rules'.format(
+                order_by, "/".join(Store.split(path)),
+            ))
+
+        if not isinstance(data, dict):
+            return {}
+
+        children = sorted(data.items(), key=lambda item: _sort_key(order_by, *item))
+        if "startAt" in params:
+            start = (_rank(json.loads(params["startAt"])), "")
+            children = [item for item in children if _sort_key(order_by, *item) >= start]
+
+        if "endAt" in params:
+            end = (_rank(json.loads(params["endAt"])), u"\uffff")
+            children = [item for item in children if _sort_key(order_by, *item) <= end]
+
+        if "limitToFirst" in params:
+            children = children[:int(params["limitToFirst"])]
+
+        if "limitToLast" in params:
+            children = children[-int(params["limitToLast"]):]
+
+        return dict(children)
+
+    def handle_put(self, path, value, params):
+        self.server.store.set(path, value)
+        return 200, value
+
+    def handle_patch(self, path, value, params):
+        if not isinstance(value, dict):
+            raise ValueError("Invalid data; couldn't parse JSON object.")
+
+        paths = sorted("/".join(Store.split(key)) for key in value)
+        for parent, child in zip(paths, paths[1:]):
+            if child.startswith(parent + "/"):
+                raise ValueError("Invalid data; path {} is an ancestor of {}".format(parent, child))
+
+        self.server.store.update(path, value)
+        return 200, value
+
+    def handle_post(self, path, value, params):
+        name = "-" + uuid.uuid4().hex
+        self.server.store.set(path + "/" + name, value)
+        return 200, {"name": name}
+
+    def handle_delete(self, path, value, params):
+        self.server.store.set(path, None)
+        return 200, None
+
+    def respond(self, status, data):
+        body = json.dumps(data)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
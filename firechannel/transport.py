@@ -0,0 +1,263 @@
+import json
+import socket
+
+from abc import ABCMeta, abstractmethod
+from itertools import count
+from threading import Lock
+from urllib import urlencode
+from urlparse import urlsplit
+
+from .errors import ConnectionError, Timeout
+
+
+class Response(object):
+    """A minimal HTTP response returned by transports that don't have
+    a response type of their own.
+
+    Parameters:
+      status_code(int)
+      content(str): The raw response body.
+    """
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class _SharedSession(object):
+    """The session of transports that share their connections between
+    every request.  Closing it, as pools do when it's evicted, leaves
+    the transport and its connections alone.
+    """
+
+    def close(self):
+        pass
+
+
+class Transport(object):
+    """Base class for the HTTP transports `Firebase` clients send
+    requests over.
+
+    Transports must be safe to use from many threads at once.  The
+    sessions they create are held in the client's pool and each one
+    is only ever used by a single request at a time.
+    """
+
+    __metaclass__ = ABCMeta
+
+    def create_session(self):
+        """Create a session for the client's pool to hold on to.
+        Pools close the sessions they evict, so transports whose
+        sessions own connections must override this.
+        """
+        return _SharedSession()
+
+    @abstractmethod
+    def request(self, session, method, url, data=None, params=None, headers=None, timeout=None):  # pragma: no cover
+        """Send a request.
+
+        Parameters:
+          session(object): A session created by `create_session`.
+          method(str): HTTP method.
+          url(str): The URL to send the request to.
+          data(str): The request body.
+          params(dict): Query string parameters.
+          headers(dict): Request headers.
+          timeout(tuple): Connect and read timeout.
+
+        Raises:
+          ConnectionError: When the server can't be reached.
+          Timeout: When connecting or reading times out.
+
+        Returns:
+          Response: Any object with `status_code`, `content` and
+          `text` attributes and a `json()` method.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Close any connections held by this transport.
+        """
+
+
+def _split_timeout(timeout):
+    if isinstance(timeout, tuple):
+        return timeout
+    return timeout, timeout
+
+
+class RequestsTransport(Transport):
+    """Sends requests using one `requests.Session` per pooled session.
+    This is the default.
+    """
+
+    def __init__(self):
+        import requests
+
+        self.session_factory = requests.Session
+        self.exceptions = requests.exceptions
+
+    def create_session(self):
+        return self.session_factory()
+
+    def request(self, session, method, url, data=None, params=None, headers=None, timeout=None):
+        try:
+            return session.request(method.upper(), url, data=data, params=params, headers=headers, timeout=timeout)
+        except self.exceptions.Timeout as e:
+            raise Timeout("timeout", cause=e)
+        except self.exceptions.ConnectionError as e:
+            raise ConnectionError("connection error", cause=e)
+
+
+class Urllib3Transport(Transport):
+    """Sends requests straight through a shared urllib3 connection
+    pool, skipping the hooks, cookie handling and adapters `requests`
+    runs on every call.
+
+    Parameters:
+      maxsize(int): The max number of connections kept open per host.
+      num_pools(int): The max number of hosts to keep connections to.
+      block(bool): When True, requests wait for a connection to free
+        up instead of opening more than `maxsize` connections per host.
+      keep_alive(bool): When True, TCP keep-alive is enabled on every
+        connection so that idle connections aren't silently dropped
+        by proxies and load balancers.
+    """
+
+    def __init__(self, maxsize=10, num_pools=10, block=False, keep_alive=True):
+        import urllib3
+        import urllib3.connection
+
+        self.urllib3 = urllib3
+        socket_options = list(urllib3.connection.HTTPConnection.default_socket_options)
+        if keep_alive:
+            socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+
+        self.manager = urllib3.PoolManager(
+            num_pools=num_pools,
+            maxsize=maxsize,
+            block=block,
+            retries=False,
+            socket_options=socket_options,
+        )
+
+    def request(self, session, method, url, data=None, params=None, headers=None, timeout=None):
+        if params:
+            url += "?" + urlencode(params)
+
+        urllib3 = self.urllib3
+        connect_timeout, read_timeout = _split_timeout(timeout)
+        try:
+            response = self.manager.urlopen(
+                method.upper(), url, body=data, headers=headers,
+                timeout=urllib3.Timeout(connect=connect_timeout, read=read_timeout),
+            )
+        except urllib3.exceptions.NewConnectionError as e:
+            # This is a subclass of ConnectTimeoutError for historical reasons.
+            raise ConnectionError("connection error", cause=e)
+        except urllib3.exceptions.TimeoutError as e:
+            raise Timeout("timeout", cause=e)
+        except (urllib3.exceptions.HTTPError, socket.error) as e:
+            raise ConnectionError("connection error", cause=e)
+
+        return Response(response.status, response.data)
+
+    def close(self):
+        self.manager.clear()
+
+
+class HTTP2Transport(Transport):
+    """Sends requests over HTTP/2, multiplexing concurrent requests
+    to the same host as streams on a small number of connections.
+
+    This transport requires the `hyper` package.
+
+    Since concurrent requests share connections, timeouts are set per
+    connection rather than per request: every request sent over a
+    connection is subject to the timeout it was opened with and the
+    client's adaptive timeouts don't apply.
+
+    Parameters:
+      connections_per_host(int): The number of connections requests
+        to each host are spread across.
+      ssl_context(SSLContext): The SSL context used for secure connections.
+      timeout(tuple): The connect and read timeout of every connection.
+        Defaults to the timeout of the request that opens each one.
+    """
+
+    def __init__(self, connections_per_host=1, ssl_context=None, timeout=None):
+        try:
+            import hyper
+            from hyper.common.exceptions import ConnectionResetError
+            from hyper.http20.exceptions import HTTP20Error
+        except ImportError:
+            raise RuntimeError("HTTP2Transport requires the 'hyper' package.")
+
+        self.hyper = hyper
+        self._errors = (socket.error, ConnectionResetError, HTTP20Error)
+        self.connections_per_host = connections_per_host
+        self.ssl_context = ssl_context
+        self.timeout = timeout
+        self._connections = {}
+        self._counter = count()
+        self._mutex = Lock()
+
+    def _get_connection(self, scheme, netloc, timeout):
+        with self._mutex:
+            connections = self._connections.get((scheme, netloc))
+            if connections is None:
+                connections = self._connections[(scheme, netloc)] = [None] * self.connections_per_host
+
+            index = next(self._counter) % self.connections_per_host
+            connection = connections[index]
+            if connection is None:
+                connection = connections[index] = self.hyper.HTTP20Connection(
+                    netloc, secure=scheme == "https", ssl_context=self.ssl_context,
+                    timeout=self.timeout if self.timeout is not None else timeout,
+                )
+
+            return index, connection
+
+    def _drop_connection(self, scheme, netloc, index, connection):
+        with self._mutex:
+            connections = self._connections.get((scheme, netloc))
+            if connections is not None and connections[index] is connection:
+                connections[index] = None
+
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def request(self, session, method, url, data=None, params=None, headers=None, timeout=None):
+        scheme, netloc, path, query, _ = urlsplit(url)
+        if params:
+            query = "&".join(part for part in (query, urlencode(params)) if part)
+        if query:
+            path += "?" + query
+
+        index, connection = self._get_connection(scheme, netloc, timeout)
+        try:
+            stream_id = connection.request(method.upper(), path, body=data, headers=headers)
+            response = connection.get_response(stream_id)
+            return Response(response.status, response.read())
+        except socket.timeout as e:
+            self._drop_connection(scheme, netloc, index, connection)
+            raise Timeout("timeout", cause=e)
+        except self._errors as e:
+            self._drop_connection(scheme, netloc, index, connection)
+            raise ConnectionError("connection error", cause=e)
+
+    def close(self):
+        with self._mutex:
+            connections, self._connections = self._connections, {}
+
+        for connection in (c for host_connections in connections.values() for c in host_connections if c):
+            connection.close()
@@ -3,13 +3,29 @@ window.Firechannel = (function() {
    * Firechannels are used to connect to Firebase.
    *
    * @param token The auth token from the server.
+   * @param options An optional object.  Set `log` to true to receive
+   *   every message appended to the channel's log instead of only the
+   *   latest message sent to the channel.
    */
-  var Firechannel = function(token) {
+  var Firechannel = function(token, options) {
     var segments = token.split(".");
     var params = JSON.parse(atob(segments[1]));
+    var claims = params.claims || {};
 
     this.channelId = params.uid;
+    this.channelIds = (claims.channels || "").split("|").filter(Boolean);
+    this.generation = claims.gen || 0;
+    // The URL of the database the channel lives on when channels are
+    // sharded across many databases.
+    this.databaseUrl = claims.db;
+    this.issuedAt = (params.iat || 0) * 1000;
+    this.topics = (claims.topics || "").split("|").filter(Boolean);
     this.token = token;
+    this.log = !!(options && options.log);
+
+    // The key of the last log entry that was received.  Sockets
+    // opened later on pick up right after it.
+    this.lastKey = null;
   };
 
   /**
@@ -19,42 +35,313 @@ window.Firechannel = (function() {
    * @return Socket
    */
   Firechannel.prototype.open = function(handler) {
-    return new Socket(
-      this.token,
-      this.channelId,
-      handler || {}
-    );
+    return new Socket(this, handler || {});
+  };
+
+  /**
+   * Multiplexers open sockets to every channel a multiplexed token
+   * grants access to while only authenticating once.  The connection
+   * is closed once every socket opened through it has been closed.
+   *
+   * Each multiplexer signs in through a Firebase app of its own, built
+   * from the default app's options, so that signing out and going
+   * offline doesn't affect anything else on the page.
+   *
+   * @param token A multiplexed auth token from the server.
+   * @param options An optional object.  See Firechannel.
+   */
+  var nextMultiplexerId = 0;
+
+  var Multiplexer = function(token, options) {
+    this.channel = new Firechannel(token, options);
+    this.channels = {};
+    this.app = firebase.initializeApp(firebase.app().options, "firechannel-multiplexer-" + nextMultiplexerId++);
+    this.refCount = 0;
+    this.signedIn = null;
+  };
+
+  /**
+   * Open a socket to one of the channels this token grants access to.
+   *
+   * @param channelId The channel to listen on.  Defaults to the
+   *   token's own channel, which also receives its topics.
+   * @param handler An optional object with handlers for Socket callbacks.
+   * @return Socket
+   */
+  Multiplexer.prototype.open = function(channelId, handler) {
+    var base = this.channel;
+    channelId = channelId || base.channelId;
+    if (channelId !== base.channelId && base.channelIds.indexOf(channelId) === -1) {
+      throw new Error("This token doesn't grant access to channel " + channelId);
+    }
+
+    // Each channel keeps track of its own position in its log.
+    var channel = this.channels[channelId];
+    if (!channel) {
+      channel = this.channels[channelId] = Object.create(base);
+      channel.channelId = channelId;
+      channel.lastKey = null;
+      if (channelId !== base.channelId) {
+        channel.topics = [];
+      }
+    }
+
+    if (this.refCount++ === 0) {
+      this.databases().forEach(function(database) {
+        database.goOnline();
+      });
+      this.signedIn = firebase.auth(this.app).signInWithCustomToken(base.token);
+    }
+
+    return new Socket(channel, handler || {}, {
+      app: this.app,
+      signedIn: this.signedIn,
+      release: this.release.bind(this)
+    });
+  };
+
+  /**
+   * Get the databases this multiplexer's sockets connect to.
+   */
+  Multiplexer.prototype.databases = function() {
+    var databases = [this.app.database()];
+    if (this.channel.databaseUrl) {
+      databases.push(this.app.database(this.channel.databaseUrl));
+    }
+    return databases;
+  };
+
+  /**
+   * Called whenever a socket opened through this multiplexer is closed.
+   */
+  Multiplexer.prototype.release = function() {
+    if (--this.refCount === 0) {
+      this.databases().forEach(function(database) {
+        database.goOffline();
+      });
+      firebase.auth(this.app).signOut();
+      this.signedIn = null;
+    }
+  };
+
+  Firechannel.Multiplexer = Multiplexer;
+
+  /**
+   * Decode a message as stored in Firebase.  Messages without an
+   * encoding are base64 encoded and are decoded to binary strings
+   * as they always have been.
+   *
+   * @param data A channel's data.
+   * @return A Promise of the message.
+   */
+  var decodeMessage = function(data) {
+    var encoding = data.encoding || "base64";
+    if (encoding === "base64") {
+      return Promise.resolve(atob(data.message));
+    } else if (encoding === "raw") {
+      return Promise.resolve(data.message);
+    } else if (encoding === "deflate") {
+      return inflate(atob(data.message));
+    }
+
+    return Promise.reject(new Error("Unknown message encoding: " + encoding));
   };
 
   /**
-   * Sockets receive data in real time form Firebase.
+   * Decompress zlib deflate data using pako if it's loaded and the
+   * Compression Streams API otherwise.
    *
-   * @param token An auth token.
-   * @param channelId The channel to listen on.
+   * @param binary A binary string.
+   * @return A Promise of the decompressed UTF-8 text.
+   */
+  var inflate = function(binary) {
+    var bytes = new Uint8Array(binary.length);
+    for (var i = 0; i < binary.length; i++) {
+      bytes[i] = binary.charCodeAt(i);
+    }
+
+    if (window.pako) {
+      return Promise.resolve(window.pako.inflate(bytes, {to: "string"}));
+    }
+
+    var stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("deflate"));
+    return new Response(stream).text();
+  };
+
+  /**
+   * Read the chunks of a chunked message and reassemble them,
+   * verifying the result against the message's manifest.
+   *
+   * @param ref The ref under which the channel's chunks are stored.
+   * @param data A channel's data, whose `chunks` field is a manifest.
+   * @return A Promise of the channel's data with the reassembled message.
+   */
+  var reassemble = function(ref, data) {
+    var manifest = data.chunks;
+    return ref.child(manifest.id).once("value").then(function(snapshot) {
+      // Firebase turns objects with numeric keys into arrays, so the
+      // chunks can come back either way.
+      var chunks = snapshot.val() || {};
+      var parts = [];
+      for (var i = 0; i < manifest.count; i++) {
+        if (typeof chunks[i] !== "string") {
+          throw new Error("Missing chunk " + i + " of message " + manifest.id);
+        }
+        parts.push(chunks[i]);
+      }
+
+      var message = parts.join("");
+      return verifyChunks(message, manifest).then(function() {
+        return {message: message, encoding: data.encoding};
+      });
+    });
+  };
+
+  /**
+   * Check a reassembled message's size and, where the Web Crypto API
+   * is available, its SHA-256 digest.
+   *
+   * @param message The reassembled message.
+   * @param manifest The message's manifest.
+   * @return A Promise that's rejected if the message doesn't match.
+   */
+  var verifyChunks = function(message, manifest) {
+    var bytes = new TextEncoder().encode(message);
+    if (bytes.length !== manifest.size) {
+      return Promise.reject(new Error("Message " + manifest.id + " has the wrong size"));
+    }
+
+    // crypto.subtle is only available in secure contexts.
+    if (!window.crypto || !window.crypto.subtle) {
+      return Promise.resolve();
+    }
+
+    return window.crypto.subtle.digest("SHA-256", bytes).then(function(digest) {
+      var hex = Array.prototype.map.call(new Uint8Array(digest), function(b) {
+        return ("0" + b.toString(16)).slice(-2);
+      }).join("");
+      if (hex !== manifest.sha256) {
+        throw new Error("Message " + manifest.id + " failed verification");
+      }
+    });
+  };
+
+  /**
+   * Sockets receive data in real time form Firebase.  Besides the
+   * channel itself, sockets listen to every topic the token grants
+   * access to.
+   *
+   * @param channel The Firechannel to listen on.  In log mode, its
+   *   `lastKey` tracks the last log entry that was received.
    * @param handler An optional object with handlers for the callbacks.
+   * @param session An optional object used by multiplexers to share a
+   *   single sign in between sockets.  Its `signedIn` Promise resolves
+   *   once authenticated and its `release` function is called on close.
   */
-  var Socket = function(token, channelId, handler) {
+  var Socket = function(channel, handler, session) {
+    var channelId = channel.channelId;
+    var generation = channel.generation;
+    var cursor = channel.log ? channel : null;
+
     // Apps must be scoped so that multiple channel ids can be used
     // since channels are scoped by auth.
-    var firebaseApp = firebase.app();
+    var firebaseApp = session ? session.app : firebase.app();
+    var signedIn = session ? session.signedIn : firebase.auth(firebaseApp).signInWithCustomToken(channel.token);
 
-    firebase
-      .auth(firebaseApp)
-      .signInWithCustomToken(token)
+    this.handler = handler;
+    this.session = session;
+    this.closed = false;
+
+    signedIn
       .then(function() {
-        this.handler = handler;
-        this.ref = firebaseApp.database().ref("firechannels/" + channelId);
-        this.ref.on("value", function(ref) {
-          try {
-            var data = ref.val();
-            if (data === null) return;
-
-            var message = atob(data.message);
-            handler.onmessage ? handler.onmessage(message) : this.onmessage(message);
-          } catch (e) {
-            handler.onerror ? handler.onerror(e) : this.onerror(e);
+        if (this.closed) return;
+
+        var database = firebaseApp.database(channel.databaseUrl);
+        this.ref = database.ref("firechannels/" + channelId);
+        var chunksRef = database.ref("firechannelchunks/" + channelId);
+        // Decoding compressed and chunked messages is asynchronous so
+        // messages are delivered through a chain to preserve their order.
+        var delivered = Promise.resolve();
+        var latestChunks = null;
+        var onerror = function(e) {
+          handler.onerror ? handler.onerror(e) : this.onerror(e);
+        }.bind(this);
+
+        var deliver = function(data, topic) {
+          if (data === null) return;
+          if ((data.timestamp || 0) < generation) return;
+
+          var decoded;
+          if (data.chunks) {
+            latestChunks = data.chunks.id;
+            decoded = reassemble(chunksRef, data).then(decodeMessage);
+          } else {
+            if (!topic) latestChunks = null;
+            decoded = decodeMessage(data);
+          }
+
+          delivered = delivered.then(function() {
+            return decoded;
+          }).then(function(message) {
+            handler.onmessage ? handler.onmessage(message, topic) : this.onmessage(message, topic);
+          }.bind(this)).catch(function(e) {
+            // Sending a message deletes the chunks of the ones before
+            // it, so messages that have been superseded can fail to
+            // be reassembled.
+            if (data.chunks && data.chunks.id !== latestChunks) return;
+
+            onerror(e);
+          });
+        }.bind(this);
+
+        if (cursor) {
+          this.query = this.ref.child("log").orderByKey();
+          if (cursor.lastKey !== null) {
+            this.query = this.query.startAt(cursor.lastKey);
           }
-        }.bind(this));
+
+          this.query.on("child_added", function(snapshot) {
+            try {
+              // startAt is inclusive so the last entry comes up again.
+              if (snapshot.key === cursor.lastKey) return;
+
+              // Entries appended concurrently can arrive out of key
+              // order, so they're delivered even if they sort before
+              // the last one.
+              if (cursor.lastKey === null || snapshot.key > cursor.lastKey) {
+                cursor.lastKey = snapshot.key;
+              }
+              deliver(snapshot.val());
+            } catch (e) {
+              onerror(e);
+            }
+          });
+        } else {
+          this.ref.on("value", function(ref) {
+            try {
+              deliver(ref.val());
+            } catch (e) {
+              onerror(e);
+            }
+          });
+        }
+
+        // Messages published to a topic before the token was issued
+        // are stale so they're ignored.
+        this.topicRefs = channel.topics.map(function(topic) {
+          var ref = firebaseApp.database().ref("firetopics/" + topic);
+          ref.on("value", function(snapshot) {
+            try {
+              var data = snapshot.val();
+              if (data === null || (data.timestamp || 0) < channel.issuedAt) return;
+
+              deliver(data, topic);
+            } catch (e) {
+              onerror(e);
+            }
+          });
+          return ref;
+        });
 
         handler.onopen ? handler.onopen() : this.onopen();
       }.bind(this))
@@ -73,8 +360,9 @@ window.Firechannel = (function() {
    * Called when the socket receives a message.
    *
    * @param data The data sent from the server.
+   * @param topic The topic the message was published to, if any.
    */
-  Socket.prototype.onmessage = function(data) {};
+  Socket.prototype.onmessage = function(data, topic) {};
 
   /**
    * Called when an error occurs on the socket.
@@ -94,10 +382,19 @@ window.Firechannel = (function() {
    * Close the socket.
    */
   Socket.prototype.close = function() {
+    if (this.closed) return;
+
+    this.closed = true;
     if (this.ref) {
+      if (this.query) this.query.off();
       this.ref.off();
-      this.handler.onclose ? this.handler.onclose() : this.onclose();
+      this.topicRefs.forEach(function(ref) {
+        ref.off();
+      });
     }
+
+    if (this.session) this.session.release();
+    this.handler.onclose ? this.handler.onclose() : this.onclose();
   };
 
   return Firechannel;
@@ -0,0 +1,52 @@
+import os
+import pytest
+
+from base64 import b64decode
+from firechannel import AsyncFirebase, create_channel_async, delete_channel_async, send_message_async
+from firechannel.channel import decode_client_id
+from firechannel.errors import BadRequest
+
+
+@pytest.fixture(scope="module")
+def async_client(credentials):
+    client = AsyncFirebase(os.getenv("FIREBASE_PROJECT"), credentials, concurrency=8)
+    yield client
+    client.close()
+
+
+def test_can_send_messages_in_the_background(client, async_client):
+    # Given that I have a few channels created in the background
+    results = [create_channel_async(firebase_client=async_client) for _ in range(10)]
+    channel_ids = [decode_client_id(result.get()) for result in results]
+
+    try:
+        # If I send each of them a message in the background
+        results = [send_message_async(channel_id, "hello!", firebase_client=async_client) for channel_id in channel_ids]
+        for result in results:
+            result.get()
+
+        # I expect every channel to be updated in Firebase
+        for channel_id in channel_ids:
+            data = client.get("firechannels/" + channel_id + ".json")
+            assert b64decode(data["message"]) == "hello!"
+    finally:
+        for result in [delete_channel_async(channel_id, firebase_client=async_client) for channel_id in channel_ids]:
+            result.get()
+
+
+def test_background_calls_raise_firebase_errors(async_client):
+    # Given that I have an async client
+    # If I make a request that fails in the background
+    result = async_client.call_async("GET", "firechannels.json", params={"orderBy": '"$invalid"'})
+
+    # I expect the error to be raised when I get its result
+    with pytest.raises(BadRequest):
+        result.get()
+
+
+def test_async_functions_require_async_clients(client):
+    # Given that I have a regular client
+    # If I attempt to send a message in the background with it
+    # I expect a TypeError to be raised
+    with pytest.raises(TypeError):
+        send_message_async("test-channel", "hello!", firebase_client=client)
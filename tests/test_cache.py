@@ -0,0 +1,32 @@
+import time
+
+from firechannel.cache import TokenCache
+
+
+def test_token_caches_evict_least_recently_used_tokens():
+    # Given that I have a token cache that can hold two tokens
+    cache = TokenCache(max_size=2)
+    expires_at = time.time() + 60
+    cache.set("a", {"uid": "a", "exp": expires_at})
+    cache.set("b", {"uid": "b", "exp": expires_at})
+
+    # If I use the first token and then cache a third one
+    assert cache.get("a")["uid"] == "a"
+    cache.set("c", {"uid": "c", "exp": expires_at})
+
+    # I expect the least recently used token to have been evicted
+    assert cache.get("b") is None
+    assert cache.get("a")["uid"] == "a"
+    assert cache.get("c")["uid"] == "c"
+
+
+def test_token_caches_forget_expired_tokens():
+    # Given that I have a token cache
+    cache = TokenCache()
+
+    # If I cache a token that has already expired
+    cache.set("a", {"uid": "a", "exp": time.time() - 1})
+
+    # I expect it not to be returned
+    assert cache.get("a") is None
+    assert len(cache) == 0
@@ -1,9 +1,19 @@
+import hashlib
 import json
+import os
 import pytest
+import time
 
 from base64 import b64decode
-from firechannel import create_channel, delete_channel, send_message, find_all_expired_channels
+from firechannel import (
+    Firebase, create_channel, delete_channel, delete_channels, send_message, send_messages,
+    find_all_expired_channels, start_token_reservoir, sweep_expired_channels,
+    append_message, append_messages, trim_channel_logs, publish, create_multiplexed_channel
+)
 from firechannel.channel import decode_client_id
+from firechannel.pushid import encode_timestamp
+from firechannel.testing import FakeFirebaseServer
+from mock import patch
 
 
 def decode(blob):
@@ -114,6 +124,88 @@ def test_can_send_messages_on_anon_channels(credentials, client):
         delete_channel(channel_id)
 
 
+def test_can_send_many_messages_at_once(client):
+    # Given that I have a few channels
+    channel_ids = ["test-batch-channel-{}".format(i) for i in range(10)]
+
+    try:
+        # If I send each of them a message in a single call using tiny batches
+        failures = send_messages(
+            {channel_id: "hello " + channel_id for channel_id in channel_ids},
+            max_batch_size=256,
+        )
+
+        # I expect no batches to have failed
+        assert failures == []
+
+        # And every channel to have received its message
+        for channel_id in channel_ids:
+            data = client.get("firechannels/" + channel_id + ".json")
+            assert b64decode(data["message"]) == "hello " + channel_id
+    finally:
+        for channel_id in channel_ids:
+            delete_channel(channel_id)
+
+
+def test_can_create_anon_channels_from_a_token_reservoir(client):
+    # Given that I've started a token reservoir
+    reservoir = start_token_reservoir(durations=(60,), size=5)
+    try:
+        # And replaced the tokens it minted with one of my own
+        reservoir.stop()
+        reservoir.put(60, "a-ready-token")
+
+        # If I create an anonymous channel
+        token = create_channel(None, duration_minutes=60)
+
+        # I expect to get back a ready token
+        assert token == "a-ready-token"
+
+        # And tokens for other durations to be minted on demand
+        assert decode_client_id(create_channel(None, duration_minutes=30))
+    finally:
+        reservoir.stop()
+        client.token_reservoir = None
+
+
+def test_can_create_fenced_channels_without_deleting_them(credentials):
+    # Given that I have a client that fences channels
+    client = Firebase(os.getenv("FIREBASE_PROJECT"), credentials, fence_channels=True)
+
+    # And a channel with some old data in it
+    send_message("test-fenced-channel", "old!", firebase_client=client)
+
+    try:
+        # If I create that channel again
+        token = create_channel("test-fenced-channel", firebase_client=client)
+
+        # I expect its token to carry a generation newer than the old data
+        data = client.get("firechannels/test-fenced-channel.json")
+        generation = decode(token.split(".")[1])["claims"]["gen"]
+        assert generation >= data["timestamp"]
+
+        # And the old data not to have been deleted
+        assert b64decode(data["message"]) == "old!"
+    finally:
+        delete_channel("test-fenced-channel", firebase_client=client)
+
+
+def test_fenced_channels_tolerate_senders_whose_clocks_lag_behind():
+    with FakeFirebaseServer() as server:
+        # Given that I have a fenced channel
+        client = server.client(fence_channels=True)
+        token = create_channel("test-fenced-channel", firebase_client=client)
+        generation = decode(token.split(".")[1])["claims"]["gen"]
+
+        # If a server whose clock lags two seconds behind sends it a message
+        with patch("firechannel.channel.time") as time_mock:
+            time_mock.time.return_value = time.time() - 2
+            send_message("test-fenced-channel", "hello!", firebase_client=client)
+
+        # I expect the message not to be fenced off
+        assert client.get("firechannels/test-fenced-channel.json")["timestamp"] >= generation
+
+
 def test_can_clean_up_old_channels(client):
     # Given that I have a few channels
     channel_ids = []
@@ -169,6 +261,65 @@ def test_can_clean_up_broken_channels(client):
     assert "timestamp" not in channels
 
 
+def test_can_find_expired_channels_a_page_at_a_time(client):
+    # Given that I have a few channels
+    channel_ids = []
+    for _ in range(10):
+        token = create_channel()
+        channel_ids.append(decode_client_id(token))
+        send_message(token, "hello!")
+
+    try:
+        # If I find all expired channels using tiny pages
+        expired_channels = list(find_all_expired_channels(max_age=0, page_size=3))
+
+        # I expect each of my channels to be returned exactly once
+        for channel_id in channel_ids:
+            assert expired_channels.count(channel_id) == 1
+    finally:
+        delete_channels(channel_ids)
+
+
+def test_can_delete_many_channels_at_once(client):
+    # Given that I have a few channels
+    channel_ids = []
+    for _ in range(10):
+        token = create_channel()
+        channel_ids.append(decode_client_id(token))
+        send_message(token, "hello!")
+
+    # If I delete all of them at once using tiny batches
+    failures = delete_channels(channel_ids, batch_size=3)
+
+    # I expect no batches to have failed
+    assert failures == []
+
+    # And all of them to have been deleted
+    channels = client.get("firechannels.json") or {}
+    for channel_id in channel_ids:
+        assert channel_id not in channels
+
+
+def test_can_sweep_expired_channels(client):
+    # Given that I have a few channels
+    channel_ids = []
+    for _ in range(10):
+        token = create_channel()
+        channel_ids.append(decode_client_id(token))
+        send_message(token, "hello!")
+
+    # If I sweep all expired channels concurrently
+    result = sweep_expired_channels(max_age=0, concurrency=4, batch_size=3)
+
+    # I expect at least those channels to have been deleted
+    assert result.deleted >= len(channel_ids)
+    assert result.failed == 0
+
+    channels = client.get("firechannels.json") or {}
+    for channel_id in channel_ids:
+        assert channel_id not in channels
+
+
 def test_find_all_expired_channels_can_return_no_results(client):
     # Given that I have no channels older than 365 days
     # If I try to find all channels that have last received a message longer than 365 days ago
@@ -176,3 +327,194 @@ def test_find_all_expired_channels_can_return_no_results(client):
 
     # I expect to get back an empty generator
     assert not list(expired_channels)
+
+
+def test_sweeps_skip_channels_with_invalid_ids():
+    with FakeFirebaseServer() as server:
+        # Given that I have an expired channel and one whose id firechannel wouldn't accept
+        client = server.client()
+        send_message("test-channel", "hello!", firebase_client=client)
+        server.store.set("firechannels/" + "a" * 65, {"timestamp": 0})
+
+        # If I sweep all expired channels
+        result = sweep_expired_channels(max_age=-1, firebase_client=client)
+
+        # I expect the valid channel to have been deleted and the other one to have been skipped
+        assert result.deleted == 1
+        assert server.store.get("firechannels").keys() == ["a" * 65]
+
+
+def test_can_append_messages_to_channel_logs():
+    with FakeFirebaseServer() as server:
+        # Given that I have a channel
+        client = server.client()
+
+        # If I append many messages to it in quick succession
+        append_message("test-log-channel", "first", firebase_client=client)
+        failures = append_messages(
+            [("test-log-channel", "message {}".format(i)) for i in range(20)],
+            max_batch_size=256, firebase_client=client,
+        )
+
+        # I expect none of them to have been lost
+        assert failures == []
+        data = client.get("firechannels/test-log-channel.json")
+        messages = [b64decode(data["log"][key]["message"]) for key in sorted(data["log"])]
+        assert messages == ["first"] + ["message {}".format(i) for i in range(20)]
+
+        # And the channel's timestamp to have been updated
+        assert data["timestamp"] == max(entry["timestamp"] for entry in data["log"].values())
+
+
+def test_can_trim_channel_logs():
+    with FakeFirebaseServer() as server:
+        # Given that I have a channel with a few messages in its log
+        client = server.client()
+        append_messages([("test-log-channel", str(i)) for i in range(10)], firebase_client=client)
+
+        # If I trim it to 3 messages
+        assert trim_channel_logs(["test-log-channel"], max_length=3, firebase_client=client) == []
+
+        # I expect only the last 3 messages to be left
+        log = client.get("firechannels/test-log-channel/log.json")
+        assert [b64decode(log[key]["message"]) for key in sorted(log)] == ["7", "8", "9"]
+
+        # If I trim messages older than a second after waiting a bit
+        time.sleep(1.1)
+        append_message("test-log-channel", "new", firebase_client=client)
+        assert trim_channel_logs(["test-log-channel"], max_age=1, firebase_client=client) == []
+
+        # I expect only the new message to be left
+        log = client.get("firechannels/test-log-channel/log.json")
+        assert [b64decode(entry["message"]) for entry in log.values()] == ["new"]
+
+
+def test_can_create_channels_that_subscribe_to_topics():
+    with FakeFirebaseServer() as server:
+        # Given that I have a client
+        client = server.client()
+
+        # If I create a channel with access to a couple of topics
+        token = create_channel("test-channel", topics=["news", "updates"], firebase_client=client)
+
+        # I expect its token to grant access to both of them
+        assert decode(token.split(".")[1])["claims"]["topics"] == "|news|updates|"
+
+        # If I publish a message to one of those topics
+        publish("news", "hello everyone!", firebase_client=client)
+
+        # I expect it to have been written once under the topic
+        data = client.get("firetopics/news.json")
+        assert b64decode(data["message"]) == "hello everyone!"
+        assert server.requests.count(("PATCH", "/firetopics/news.json")) == 1
+
+
+@pytest.mark.parametrize("topics,error", (
+    ([50], TypeError),
+    (["a|b"], ValueError),
+    ([""], ValueError),
+))
+def test_cant_create_channels_with_invalid_topics(topics, error):
+    with FakeFirebaseServer() as server:
+        # If I try to create a channel with an invalid topic
+        # I expect it to fail
+        with pytest.raises(error):
+            create_channel("test-channel", topics=topics, firebase_client=server.client())
+
+
+def test_can_create_multiplexed_channels():
+    with FakeFirebaseServer() as server:
+        # Given that I have a couple of channels with old data in them
+        client = server.client()
+        send_messages({"channel-a": "old!", "channel-b": "old!"}, firebase_client=client)
+
+        # If I create a token that covers both of them
+        token = create_multiplexed_channel(["channel-a", "channel-b"], firebase_client=client)
+
+        # I expect it to grant access to both channels
+        claims = decode(token.split(".")[1])
+        assert claims["claims"]["channels"] == "|channel-a|channel-b|"
+
+        # And the channels to have been cleared using a single request
+        assert client.get("firechannels.json") is None
+        assert server.requests.count(("PATCH", "/firechannels.json")) == 2
+
+
+def test_cant_create_multiplexed_channels_with_oversized_claims():
+    with FakeFirebaseServer() as server:
+        # If I try to create a token that covers too many channels
+        # I expect it to fail
+        with pytest.raises(ValueError):
+            create_multiplexed_channel(["channel-{}".format(i) for i in range(100)], firebase_client=server.client())
+
+        # Without deleting any of them
+        assert server.requests == []
+
+
+def reassemble(client, client_id, manifest):
+    chunks = client.get("firechannelchunks/{}/{}.json".format(client_id, manifest["id"]))
+    data = "".join(chunks[str(i)] for i in range(manifest["count"]))
+    assert hashlib.sha256(data).hexdigest() == manifest["sha256"]
+    return b64decode(data)
+
+
+def test_can_send_large_messages_in_chunks():
+    with FakeFirebaseServer() as server:
+        # Given that I have a client that chunks large messages
+        client = server.client(chunk_size=100)
+
+        # If I send a large message
+        message = os.urandom(1000)
+        send_message("test-channel", message, firebase_client=client)
+
+        # I expect it to have been split into chunks
+        data = client.get("firechannels/test-channel.json")
+        assert data.get("message") is None
+        assert data["chunks"]["count"] == 14
+        assert reassemble(client, "test-channel", data["chunks"]) == message
+
+        # If I send a few more large messages
+        message = os.urandom(500)
+        send_message("test-channel", os.urandom(500), firebase_client=client)
+        send_messages({"test-channel": message, "other-channel": "hello!"}, firebase_client=client)
+
+        # I expect only the latest message's chunks to be kept
+        data = client.get("firechannels/test-channel.json")
+        assert client.get("firechannelchunks/test-channel.json", params={"shallow": "true"}).keys() == [
+            data["chunks"]["id"],
+        ]
+        assert reassemble(client, "test-channel", data["chunks"]) == message
+
+        # And small messages not to be chunked
+        assert b64decode(client.get("firechannels/other-channel/message.json")) == "hello!"
+
+        # If I send a small message to the chunked channel
+        send_message("test-channel", "hello!", firebase_client=client)
+
+        # I expect its manifest and the chunks it pointed to to have been cleared
+        data = client.get("firechannels/test-channel.json")
+        assert "chunks" not in data
+        assert b64decode(data["message"]) == "hello!"
+        assert client.get("firechannelchunks/test-channel.json") is None
+
+        # If I send a large message and then a small one in bulk
+        send_message("test-channel", os.urandom(500), firebase_client=client)
+        send_messages({"test-channel": "hello!"}, firebase_client=client)
+
+        # I expect the large message's chunks to have been cleared as well
+        assert client.get("firechannelchunks/test-channel.json") is None
+
+        # If a newer large message's chunks are being written while I send a small message
+        newer_id = encode_timestamp(int(time.time() * 1000) + 60000) + "-" * 12
+        client.put("firechannelchunks/test-channel/{}/0.json".format(newer_id), "chunk")
+        send_message("test-channel", "hello!", firebase_client=client)
+
+        # I expect its chunks to have been kept
+        assert client.get("firechannelchunks/test-channel.json", params={"shallow": "true"}).keys() == [newer_id]
+
+        # If I delete the channel
+        send_message("test-channel", os.urandom(500), firebase_client=client)
+        delete_channel("test-channel", firebase_client=client)
+
+        # I expect its chunks to have been deleted as well
+        assert client.get("firechannelchunks/test-channel.json") is None
@@ -0,0 +1,110 @@
+import os
+import pytest
+import time
+
+from base64 import b64encode
+from firechannel.credentials import LocalSigner, PublicKeyVerifier, build_token, decode_token, get_signer
+from google.auth.exceptions import TransportError
+from threading import Thread
+
+
+def test_can_build_and_decode_tokens_with_local_signers():
+    # Given that I have a local signer for my service account
+    signer = LocalSigner.from_service_account_file(os.getenv("GOOGLE_APPLICATION_CREDENTIALS"))
+
+    # If I attempt to build a token
+    token = build_token(signer, {"uid": "hello"}, 60)
+
+    # Then decode it
+    decoded_params = decode_token(signer, token)
+
+    # I expect the data I put in to still be there
+    assert decoded_params["uid"] == "hello"
+
+
+def test_service_account_credentials_sign_locally(credentials):
+    # Given that I have service account credentials
+    # If I get a signer for them
+    signer = get_signer(credentials)
+
+    # I expect it to sign locally
+    assert isinstance(signer, LocalSigner)
+
+    # And to produce the same signatures as the credentials
+    assert signer.sign_bytes(b"hello") == credentials.sign_bytes(b"hello")
+
+
+def test_clients_fall_back_to_signing_with_credentials():
+    # Given that I have credentials that can't sign locally
+    class RemoteCredentials(object):
+        signer = None
+
+    credentials = RemoteCredentials()
+
+    # If I get a signer for them
+    # I expect to get back the credentials themselves
+    assert get_signer(credentials) is credentials
+
+
+def test_can_verify_tokens_using_public_certificates(credentials):
+    # Given that I have a token signed with my service account
+    token = build_token(credentials, {"uid": "hello"}, 60)
+
+    # If I decode it using the service account's public certificates
+    verifier = PublicKeyVerifier(credentials.signer_email)
+    decoded_params = decode_token(credentials, token, verifier=verifier)
+
+    # I expect the data I put in to still be there
+    assert decoded_params["uid"] == "hello"
+
+
+def test_tokens_with_invalid_signatures_fail_verification(credentials):
+    # Given that I have a token whose signature has been tampered with
+    token = build_token(credentials, {"uid": "hello"}, 60)
+    header, payload, _ = token.split(".")
+    token = ".".join((header, payload, b64encode(b"invalid")))
+
+    # If I decode it using the service account's public certificates
+    # I expect a ValueError to be raised
+    with pytest.raises(ValueError):
+        decode_token(credentials, token, verifier=PublicKeyVerifier(credentials.signer_email))
+
+
+def test_public_key_verifiers_fetch_certificates_once_at_a_time():
+    # Given that I have a verifier whose certificates take a while to fetch
+    verifier = PublicKeyVerifier("someone@example.iam.gserviceaccount.com")
+    fetches = []
+
+    def fetch_certificates():
+        fetches.append(time.time())
+        time.sleep(0.1)
+        raise TransportError("Could not fetch certificates.")
+
+    verifier.fetch_certificates = fetch_certificates
+
+    # If many threads verify signatures at once
+    errors = []
+
+    def verify():
+        try:
+            verifier.verify(b"payload", b"signature")
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [Thread(target=verify) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # I expect the certificates to have been fetched only once
+    assert len(fetches) == 1
+
+    # And every thread to have gotten a ValueError
+    assert len(errors) == 5
+
+    # If I verify another signature right away
+    # I expect a ValueError to be raised without fetching them again
+    with pytest.raises(ValueError):
+        verifier.verify(b"payload", b"signature")
+    assert len(fetches) == 1
@@ -0,0 +1,54 @@
+import json
+
+from firechannel import MessageEncoder, send_message
+from firechannel.encoding import CODECS, decode_message
+from firechannel.testing import FakeFirebaseServer
+
+
+def test_messages_are_base64_encoded_by_default():
+    # Given that I have a client with the default encoder
+    with FakeFirebaseServer() as server:
+        client = server.client()
+
+        # If I send a large message
+        message = json.dumps([{"id": i, "name": "some name"} for i in range(1000)])
+        send_message("some-client", message, firebase_client=client)
+
+        # I expect it to have been stored as base64 without an encoding
+        data = server.store.get("firechannels/some-client")
+        assert "encoding" not in data
+        assert decode_message(data) == message
+
+
+def test_large_messages_are_compressed_above_the_threshold():
+    # Given that I have a client that compresses messages over 1KB
+    with FakeFirebaseServer() as server:
+        client = server.client(message_encoder=MessageEncoder(compress_threshold=1024))
+
+        # If I send a large, repetitive message
+        message = json.dumps([{"id": i, "name": "some name"} for i in range(1000)])
+        send_message("some-client", message, firebase_client=client)
+
+        # I expect it to have been compressed
+        data = server.store.get("firechannels/some-client")
+        assert data["encoding"] == "deflate"
+        assert len(data["message"]) < len(message) / 4
+        assert decode_message(data) == message
+
+        # If I then send a small message
+        send_message("some-client", "hello!", firebase_client=client)
+
+        # I expect the encoding to have been cleared
+        data = server.store.get("firechannels/some-client")
+        assert "encoding" not in data
+        assert decode_message(data) == "hello!"
+
+
+def test_raw_encoders_fall_back_to_base64_for_binary_messages():
+    # Given that I have an encoder that stores messages as-is
+    encoder = MessageEncoder(codec=CODECS["raw"])
+
+    # If I encode a text message and a binary one
+    # I expect only the text message to be stored as-is
+    assert encoder.encode("hello!") == ("raw", u"hello!")
+    assert encoder.encode("\xff\xfe") == ("base64", "//4=")
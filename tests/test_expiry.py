@@ -0,0 +1,68 @@
+import time
+
+from firechannel import ExpiryIndex, create_channel, send_message, send_messages, sweep_expired_channels
+from firechannel.testing import FakeFirebaseServer
+from threading import Lock
+
+
+def test_sweeps_only_read_due_buckets_from_expiry_indexes():
+    with FakeFirebaseServer() as server:
+        # Given that I have a client with an expiry index
+        client = server.client(expiry_index=ExpiryIndex(ttl=1, bucket_size=1))
+
+        # And a channel that was just created
+        create_channel("new-channel", firebase_client=client)
+
+        # And a few channels that were sent messages
+        send_messages({"channel-{}".format(i): "hello!" for i in range(5)}, firebase_client=client)
+
+        # If I sweep right away
+        # I expect nothing to be deleted
+        assert sweep_expired_channels(firebase_client=client).deleted == 0
+
+        # If I wait for the channels to expire, except for one that's sent another message
+        time.sleep(2.1)
+        send_message("channel-0", "hello again!", firebase_client=client)
+        result = sweep_expired_channels(firebase_client=client)
+
+        # I expect only the expired channels to have been deleted
+        assert result.deleted == 4
+        assert sorted(client.get("firechannels.json", params={"shallow": "true"})) == ["channel-0"]
+
+        # Without every channel having been read
+        assert ("GET", "/firechannels.json") not in server.requests[:-1]
+
+        # And the swept buckets to have been deleted
+        buckets = client.get("firechannelexpiry.json", params={"shallow": "true"})
+        assert len(buckets) == 2
+
+
+def test_expiry_index_sweeps_use_the_given_concurrency():
+    # Given that I have a server that keeps track of how many requests are in flight
+    in_flight, max_in_flight, mutex = [0], [0], Lock()
+
+    def latency():
+        with mutex:
+            in_flight[0] += 1
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+        time.sleep(0.02)
+        with mutex:
+            in_flight[0] -= 1
+        return 0
+
+    with FakeFirebaseServer() as server:
+        # And a client with an expiry index whose channels have all expired
+        client = server.client(expiry_index=ExpiryIndex(ttl=1, bucket_size=1))
+        send_messages({"channel-{}".format(i): "hello!" for i in range(30)}, firebase_client=client)
+        time.sleep(2.1)
+
+        # If I sweep them using 3 concurrent requests
+        server.latency = latency
+        result = sweep_expired_channels(concurrency=3, batch_size=5, firebase_client=client)
+
+        # I expect every channel to have been deleted
+        assert result.deleted == 30
+        assert client.get("firechannels.json") is None
+
+        # Using at most 3 requests at a time, but more than one
+        assert 1 < max_in_flight[0] <= 3
@@ -1,7 +1,13 @@
 import pytest
+import subprocess
+import sys
+import time
 
+from firechannel import BoundedPool, warm_up
 from firechannel.errors import BadRequest
+from firechannel.testing import FakeFirebaseServer
 from mock import Mock, patch
+from threading import Thread
 
 
 @patch("requests.Session.request")
@@ -26,3 +32,152 @@ def test_firebase_client_retries_failed_access_tokens(request_mock, client):
     assert request_count_by_method.count("GET") == 3
     # And 3 times for the requests to refresh auth tokens.
     assert request_count_by_method.count("POST") == 3
+
+
+def test_firebase_client_refreshes_expired_access_tokens_once():
+    # Given that I have a client for a fake server that has made a request
+    with FakeFirebaseServer() as server:
+        client = server.client()
+        client.get("firechannels.json")
+
+        # If its access token expires while many threads make requests
+        server.expire_tokens()
+        threads = [Thread(target=client.get, args=("firechannels.json",)) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # I expect the token to have been refreshed only once
+        assert client.credentials.refresh_count == 2
+
+
+def test_firebase_client_limits_refreshes_caused_by_rejected_requests():
+    with FakeFirebaseServer() as server:
+        # Given that I have a client that has made a request
+        client = server.client()
+        client.get("firechannels.json")
+
+        # And the server has started rejecting every request, eg. because of its rules
+        server.is_authorized = lambda header: False
+
+        # If I make a few requests
+        # I expect them to fail
+        for _ in range(3):
+            with pytest.raises(BadRequest):
+                client.get("firechannels.json")
+
+        # And the access token to have been refreshed only once
+        assert client.credentials.refresh_count == 2
+
+        # And only the first rejected request to have been retried
+        assert len(server.requests) == 5
+
+
+def test_firebase_client_refreshes_access_tokens_before_they_expire():
+    # Given that I have a client whose access token is about to expire
+    with FakeFirebaseServer(token_ttl=60) as server:
+        client = server.client(refresh_margin=300)
+        client.get("firechannels.json")
+        access_token, client.refreshed_at = client.credentials.token, 0
+
+        # If I make a request
+        client.get("firechannels.json")
+
+        # I expect the token to be refreshed in the background
+        for _ in range(100):
+            if client.credentials.token != access_token:
+                break
+            time.sleep(0.01)
+
+        assert client.credentials.token != access_token
+
+
+def test_firebase_client_hedges_slow_requests():
+    # Given that I have a server on which every 20th request is slow
+    request_count = [0]
+
+    def latency():
+        request_count[0] += 1
+        return 0.5 if request_count[0] % 20 == 0 else 0
+
+    with FakeFirebaseServer(latency=latency) as server:
+        # And a client that hedges requests and has seen enough requests to estimate their latency
+        client = server.client(hedge=True)
+        for _ in range(60):
+            client.put("firechannels/test.json", {"timestamp": 0})
+
+        # If I make more requests
+        started_at = time.time()
+        for _ in range(40):
+            client.put("firechannels/test.json", {"timestamp": 0})
+
+        # I expect the slow ones to have been hedged
+        assert client.hedged_count >= 1
+        assert time.time() - started_at < 0.5
+
+
+def test_firebase_client_sends_requests_without_hedging_when_every_hedge_worker_is_busy():
+    # Given that I have a client that hedges requests using a single worker
+    with FakeFirebaseServer() as server:
+        client = server.client(hedge=True, hedge_workers=1)
+        for _ in range(60):
+            client.put("firechannels/test.json", {"timestamp": 0})
+
+        # If I make slow requests from many threads at once
+        server.latency = 0.3
+        threads = [Thread(target=client.get, args=("firechannels/test.json",)) for _ in range(4)]
+        started_at = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # I expect them not to have been queued up behind each other
+        assert time.time() - started_at < 0.9
+
+
+def test_firebase_client_tracks_latencies_per_kind_of_request():
+    # Given that I have a client with adaptive timeouts that has seen many fast writes
+    with FakeFirebaseServer() as server:
+        client = server.client(adaptive_timeout=True)
+        for _ in range(60):
+            client.put("firechannels/test.json", {"timestamp": 0})
+
+        # If I make a slow shallow scan
+        server.latency = 1.2
+
+        # I expect it not to time out
+        assert client.get("firechannels.json", params={"shallow": "true"}) == {"test": True}
+
+
+def test_importing_firechannel_does_not_import_http_or_auth_libraries():
+    # Given that I've imported firechannel in a fresh interpreter
+    # If I list the modules that were imported
+    output = subprocess.check_output([
+        sys.executable, "-c", "import sys, firechannel; print(' '.join(sorted(sys.modules)))",
+    ])
+
+    # I expect requests and google.auth not to be among them
+    modules = output.split()
+    assert "requests" not in modules
+    assert "google.auth" not in modules
+
+
+def test_clients_can_be_warmed_up():
+    with FakeFirebaseServer() as server:
+        # Given that I have a client with a bounded pool
+        client = server.client(pool_factory=BoundedPool.configure(max_size=4))
+
+        # If I warm it up
+        timings = warm_up(firebase_client=client, connections=4)
+
+        # I expect each step to have been timed
+        assert sorted(timings) == ["access_token", "client", "connections", "signing"]
+
+        # And an access token to have been fetched
+        assert client.credentials.refresh_count == 1
+
+        # And connections to have been opened
+        assert server.requests.count(("GET", "/firechannelwarmup.json")) == 4
+        assert client.pool.stats()["idle"] >= 1
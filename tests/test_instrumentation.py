@@ -0,0 +1,104 @@
+import pytest
+import socket
+
+from firechannel import MemorySink, NullSink, StatsdSink, create_channel, delete_topic, publish, send_message
+from firechannel.errors import NotFound
+from firechannel.testing import FakeFirebaseServer
+
+
+def test_clients_discard_metrics_by_default():
+    # Given that I have a client without a sink
+    with FakeFirebaseServer() as server:
+        client = server.client()
+
+        # I expect it to use the null sink
+        assert isinstance(client.sink, NullSink)
+        assert not client.sink.enabled
+
+
+def test_memory_sinks_record_request_and_operation_metrics():
+    # Given that I have a client with a memory sink
+    with FakeFirebaseServer() as server:
+        sink = MemorySink()
+        client = server.client(sink=sink)
+
+        # If I create a channel and send it a message
+        token = create_channel("some-client", firebase_client=client)
+        send_message(token, "hello", firebase_client=client)
+
+        # I expect requests to have been timed and counted
+        assert len(sink.timings["firebase.request"]) == 2
+        assert sink.counters["firebase.status.200"] == 2
+        assert sink.counters["firebase.request_bytes"] > 0
+        assert sink.counters["firebase.token_refresh"] == 1
+        assert sink.timings["firebase.pool_wait"]
+
+        # I expect operations and token handling to have been timed
+        assert len(sink.timings["channel.create_channel"]) == 1
+        assert len(sink.timings["channel.send_message"]) == 1
+        assert len(sink.timings["channel.build_token"]) == 1
+        assert len(sink.timings["channel.decode_token"]) == 1
+
+        # And I expect spans to have been recorded
+        assert [span["name"] for span in sink.spans if span["name"] == "firebase.request"] == ["firebase.request"] * 2
+
+
+def test_memory_sinks_record_topic_operations():
+    # Given that I have a client with a memory sink
+    with FakeFirebaseServer() as server:
+        sink = MemorySink()
+        client = server.client(sink=sink)
+
+        # If I publish a message to a topic and then delete it
+        publish("news", "hello everyone!", firebase_client=client)
+        delete_topic("news", firebase_client=client)
+
+        # I expect both operations to have been timed
+        assert len(sink.timings["channel.publish"]) == 1
+        assert len(sink.timings["channel.delete_topic"]) == 1
+
+
+def test_memory_sinks_count_errors():
+    # Given that I have a client with a memory sink
+    with FakeFirebaseServer() as server:
+        sink = MemorySink()
+        client = server.client(sink=sink)
+
+        # If a request fails
+        with pytest.raises(NotFound):
+            client.get("not-json")
+
+        # I expect the error and its status code to have been counted
+        assert sink.counters["firebase.error.NotFound"] == 1
+        assert sink.counters["firebase.status.404"] == 1
+        assert sink.percentile("firebase.request", 50) is not None
+
+
+def test_memory_sinks_only_keep_recent_measurements():
+    # Given that I have a memory sink that keeps a few measurements
+    sink = MemorySink(max_samples=3, max_spans=2)
+
+    # If I time many operations
+    for i in range(10):
+        with sink.timer("operation", tags={"index": i}):
+            pass
+
+    # I expect only the most recent ones to have been kept
+    assert len(sink.timings["operation"]) == 3
+    assert [span["tags"]["index"] for span in sink.spans] == [8, 9]
+
+
+def test_statsd_sinks_send_metrics_over_udp():
+    # Given that I have a UDP socket
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(1)
+
+    # And a statsd sink that sends metrics to it
+    sink = StatsdSink(*receiver.getsockname(), use_tags=True)
+
+    # If I increment a counter
+    sink.increment("firebase.status", tags={"status": 200})
+
+    # I expect the socket to receive it
+    assert receiver.recv(1024) == "firechannel.firebase.status:1|c|#status:200"
@@ -0,0 +1,124 @@
+import pytest
+
+from Queue import Full
+from base64 import b64decode
+from firechannel import Outbox
+from firechannel.testing import FakeFirebaseServer
+
+
+@pytest.fixture()
+def spool_path(tmpdir):
+    return str(tmpdir.join("outbox.db"))
+
+
+def test_outboxes_send_messages_directly_when_firebase_is_healthy(spool_path):
+    # Given that I have an outbox
+    with FakeFirebaseServer() as server:
+        client = server.client()
+        outbox = Outbox(spool_path, client)
+
+        # If I send a message
+        # I expect it to have been sent right away
+        assert outbox.send_message("channel-a", "hello!")
+        assert b64decode(client.get("firechannels/channel-a.json")["message"]) == "hello!"
+        assert outbox.pending == 0
+
+
+def test_outboxes_spool_and_replay_operations_during_outages(spool_path):
+    # Given that I have an outbox for a server that's down
+    with FakeFirebaseServer(error_rate=1) as server:
+        client = server.client()
+        outbox = Outbox(spool_path, client, poll_interval=0.05)
+
+        # If I send a few messages and delete a channel
+        assert not outbox.send_message("channel-a", "first")
+        assert not outbox.send_message("channel-a", "second")
+        assert not outbox.send_message("channel-b", "hello!")
+        assert not outbox.delete_channel("channel-c")
+
+        # I expect them to have been spooled, compacted per channel
+        assert outbox.pending == 3
+
+        # If the server comes back up
+        server.error_rate = 0
+
+        # I expect the operations to be replayed in bulk
+        assert outbox.close(timeout=5)
+        assert b64decode(client.get("firechannels/channel-a.json")["message"]) == "second"
+        assert b64decode(client.get("firechannels/channel-b.json")["message"]) == "hello!"
+        assert outbox.stats()["replayed"] == 3
+
+
+def test_outboxes_persist_pending_operations(spool_path):
+    # Given that I have an outbox with some pending messages
+    with FakeFirebaseServer(error_rate=1) as server:
+        client = server.client()
+        outbox = Outbox(spool_path, client, max_pending=2)
+        outbox.send_message("channel-a", "hello!")
+        outbox.send_message("channel-b", "hello!")
+
+        # If I send a message to another channel
+        # I expect the spool to be full
+        with pytest.raises(Full):
+            outbox.send_message("channel-c", "hello!")
+
+        # If I close it while the server is still down
+        assert not outbox.close(timeout=0)
+
+        # And open it again once the server comes back up
+        server.error_rate = 0
+        outbox = Outbox(spool_path, client, poll_interval=0.05)
+
+        # I expect the pending messages to be replayed
+        assert outbox.close(timeout=5)
+        assert b64decode(client.get("firechannels/channel-b.json")["message"]) == "hello!"
+
+
+def test_outboxes_drop_operations_that_firebase_rejects(spool_path):
+    # Given that I have an outbox with some pending messages
+    with FakeFirebaseServer(error_rate=1) as server:
+        client = server.client()
+        outbox = Outbox(spool_path, client, poll_interval=0.05)
+        outbox.send_message("channel-a", "hello!")
+        outbox.send_message("channel-bad", "hello!")
+        outbox.send_message("channel-b", "hello!")
+
+        # And a server that rejects updates to one of the channels
+        update = server.store.update
+
+        def reject_bad_channel(path, values):
+            if any("channel-bad" in key for key in [path] + list(values)):
+                raise ValueError("Invalid data.")
+            return update(path, values)
+
+        server.store.update = reject_bad_channel
+
+        # If the server comes back up
+        server.error_rate = 0
+
+        # I expect the other messages to be replayed and the rejected one to be dropped
+        assert outbox.close(timeout=5)
+        assert b64decode(client.get("firechannels/channel-a.json")["message"]) == "hello!"
+        assert b64decode(client.get("firechannels/channel-b.json")["message"]) == "hello!"
+        assert outbox.stats()["replayed"] == 2
+        assert outbox.stats()["dropped"] == 1
+
+
+def test_outboxes_limit_the_size_of_pending_messages(spool_path):
+    # Given that I have an outbox with a byte limit for a server that's down
+    with FakeFirebaseServer(error_rate=1) as server:
+        client = server.client()
+        outbox = Outbox(spool_path, client, max_bytes=1024)
+        outbox.send_message("channel-a", "a" * 600)
+
+        # If I spool a message that goes over the limit
+        # I expect the spool to be full
+        with pytest.raises(Full):
+            outbox.send_message("channel-b", "b" * 600)
+
+        # If I replace the pending message with a smaller one
+        # I expect there to be room for the other message
+        outbox.send_message("channel-a", "a" * 100)
+        outbox.send_message("channel-b", "b" * 600)
+        assert outbox.pending == 2
+        assert not outbox.close(timeout=0)
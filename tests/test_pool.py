@@ -0,0 +1,69 @@
+import pytest
+
+from firechannel.errors import PoolTimeout
+from firechannel.pool import BoundedPool, ThreadLocalPool
+
+
+class Client(object):
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_thread_local_pools_do_not_share_clients():
+    # Given that I have two thread local pools
+    pool_a, pool_b = ThreadLocalPool(Client), ThreadLocalPool(Client)
+
+    # If I reserve a client from each of them on the same thread
+    with pool_a.reserve() as client_a, pool_b.reserve() as client_b:
+        # I expect them to be different
+        assert client_a is not client_b
+
+
+def test_bounded_pools_reuse_clients():
+    # Given that I have a bounded pool
+    pool = BoundedPool(Client)
+
+    # If I reserve a client twice in a row
+    with pool.reserve() as client_a:
+        pass
+
+    with pool.reserve() as client_b:
+        pass
+
+    # I expect to get back the same client
+    assert client_a is client_b
+    assert pool.stats()["idle"] == 1
+
+
+def test_bounded_pools_time_out_when_exhausted():
+    # Given that I have a bounded pool of size 1
+    pool = BoundedPool.configure(max_size=1)(Client)
+
+    # And its only client is in use
+    with pool.reserve():
+        # If I try to reserve another client
+        # I expect a PoolTimeout error to be raised
+        with pytest.raises(PoolTimeout):
+            with pool.reserve(timeout=0.01):
+                pass
+
+    # And the pool to track the in-use client
+    assert pool.stats()["in_use"] == 0
+
+
+def test_bounded_pools_evict_idle_clients():
+    # Given that I have a bounded pool whose clients expire immediately
+    pool = BoundedPool.configure(max_idle=0)(Client)
+    with pool.reserve() as client_a:
+        pass
+
+    # If I reserve a client again
+    with pool.reserve() as client_b:
+        pass
+
+    # I expect the old client to have been closed and replaced
+    assert client_a.closed
+    assert client_a is not client_b
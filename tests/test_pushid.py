@@ -0,0 +1,21 @@
+import time
+
+from firechannel.pushid import encode_timestamp, generate_push_id
+
+
+def test_push_ids_are_strictly_increasing():
+    # Given that I generate many push ids for the same millisecond
+    push_ids = [generate_push_id(1500000000000) for _ in range(1000)]
+
+    # I expect them to be unique and in order
+    assert push_ids == sorted(set(push_ids))
+    assert all(len(push_id) == 20 for push_id in push_ids)
+
+
+def test_push_ids_start_with_their_timestamp():
+    # Given that I generate a push id
+    now = int(time.time() * 1000)
+    push_id = generate_push_id()
+
+    # I expect it to sort between the encoded timestamps around it
+    assert encode_timestamp(now - 1000) < push_id < encode_timestamp(now + 1000)
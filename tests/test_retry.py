@@ -0,0 +1,57 @@
+import pytest
+import time
+
+from firechannel import CircuitBreaker, RetryPolicy
+from firechannel.errors import CircuitOpen, ServerError
+from firechannel.testing import FakeFirebaseServer
+
+
+def test_retry_policies_retry_transient_errors():
+    # Given that I have a client with a retry policy for a flaky server
+    with FakeFirebaseServer(error_rate=0.5) as server:
+        client = server.client(retry_policy=RetryPolicy(max_attempts=20, backoff=0.001))
+
+        # If I make a few requests
+        for _ in range(10):
+            client.get("firechannels.json")
+
+        # I expect some of them to have been retried
+        assert client.retry_policy.stats()["retries"] > 0
+
+
+def test_retry_policies_do_not_retry_non_idempotent_requests():
+    # Given that I have a client with a retry policy for a broken server
+    with FakeFirebaseServer(error_rate=1) as server:
+        client = server.client(retry_policy=RetryPolicy(backoff=0.001))
+
+        # If I make a POST request
+        # I expect it to fail without being retried
+        with pytest.raises(ServerError):
+            client.post("firechannels.json", {})
+
+        assert client.retry_policy.stats()["retries"] == 0
+
+
+def test_circuit_breakers_fail_fast_after_consecutive_errors():
+    # Given that I have a client with a circuit breaker for a broken server
+    with FakeFirebaseServer(error_rate=1) as server:
+        client = server.client(circuit_breaker=CircuitBreaker(failure_threshold=2, cooldown=0.1))
+
+        # If a couple of requests fail
+        for _ in range(2):
+            with pytest.raises(ServerError):
+                client.get("firechannels.json")
+
+        # I expect the next one to be rejected without hitting the server
+        request_count = len(server.requests)
+        with pytest.raises(CircuitOpen):
+            client.get("firechannels.json")
+
+        assert len(server.requests) == request_count
+        assert client.circuit_breaker.stats()["state"] == "open"
+
+        # And the circuit to close again once the server recovers
+        server.error_rate = 0
+        time.sleep(0.1)
+        client.get("firechannels.json")
+        assert client.circuit_breaker.stats()["state"] == "closed"
@@ -0,0 +1,67 @@
+import pytest
+
+from Queue import Full
+from base64 import b64decode
+from firechannel import BackgroundSender
+from firechannel.testing import FakeFirebaseServer
+
+
+@pytest.fixture()
+def fake_server():
+    with FakeFirebaseServer() as server:
+        yield server
+
+
+def test_background_senders_coalesce_messages_per_channel(fake_server):
+    # Given that I have a background sender
+    client = fake_server.client()
+    sender = BackgroundSender(client, flush_interval=1)
+
+    # If I send many messages to a few channels
+    for i in range(100):
+        sender.send("channel-{}".format(i % 5), "message {}".format(i))
+
+    # And then flush the sender
+    assert sender.close()
+
+    # I expect every channel to have received its last message
+    for i in range(95, 100):
+        data = client.get("firechannels/channel-{}.json".format(i % 5))
+        assert b64decode(data["message"]) == "message {}".format(i)
+
+    # Using a single write
+    assert fake_server.requests.count(("PATCH", "/firechannels.json")) == 1
+
+
+def test_background_senders_apply_backpressure(fake_server):
+    # Given that I have a background sender that holds one pending message
+    sender = BackgroundSender(fake_server.client(), max_pending=1, flush_interval=60)
+    sender.send("channel-a", "hello!")
+
+    # If I send a message to another channel
+    # I expect the queue to be full
+    with pytest.raises(Full):
+        sender.send("channel-b", "hello!", timeout=0.01)
+
+    # But messages for the pending channel to be accepted
+    sender.send("channel-a", "hello again!")
+    assert sender.close()
+
+
+def test_background_senders_keep_every_message_in_log_mode(fake_server):
+    # Given that I have a background sender in log mode that keeps 50 messages per channel
+    client = fake_server.client()
+    sender = BackgroundSender(client, batch_size=30, log=True, max_log_length=50, trim_interval=0)
+
+    # If I send many messages to a couple of channels
+    for i in range(100):
+        sender.send("channel-{}".format(i % 2), "message {}".format(i))
+
+    # And then flush the sender
+    assert sender.close()
+
+    # I expect each channel to have kept its last 50 messages, in order
+    for channel in range(2):
+        log = client.get("firechannels/channel-{}/log.json".format(channel))
+        messages = [b64decode(log[key]["message"]) for key in sorted(log)]
+        assert messages == ["message {}".format(i) for i in range(channel, 100, 2)]
@@ -0,0 +1,111 @@
+import json
+import pytest
+
+from base64 import b64decode
+from firechannel import CircuitBreaker, ShardedFirebase, create_channel, send_messages, sweep_expired_channels, warm_up
+from firechannel.testing import FakeFirebaseServer
+
+
+def decode(blob):
+    return json.loads(b64decode(blob))
+
+
+def sharded_client(server, count=3):
+    databases = ["{}/shard-{}".format(server.url, i) for i in range(count)]
+    return ShardedFirebase("fake", databases, server.credentials())
+
+
+def test_sharded_clients_map_channels_to_shards_stably():
+    with FakeFirebaseServer() as server:
+        # Given that I have a sharded client
+        client = sharded_client(server)
+
+        # If I look up the shards for many channels
+        shards = [client.shard_for("channel-{}".format(i)) for i in range(300)]
+
+        # I expect every shard to have been used
+        assert set(shards) == set(client.shards)
+
+        # And lookups to be stable, even across clients
+        other_client = sharded_client(server)
+        for i, shard in enumerate(shards):
+            assert other_client.shard_for("channel-{}".format(i)).database_url == shard.database_url
+
+
+def test_sharded_clients_route_tokens_messages_and_sweeps():
+    with FakeFirebaseServer() as server:
+        # Given that I have a sharded client
+        client = sharded_client(server)
+        channel_ids = ["channel-{}".format(i) for i in range(30)]
+
+        # If I create a channel
+        token = create_channel("channel-0", firebase_client=client)
+
+        # I expect its token to point at the channel's shard
+        assert decode(token.split(".")[1])["claims"]["db"] == client.shard_for("channel-0").database_url
+
+        # If I send messages to many channels
+        assert send_messages({channel_id: "hello!" for channel_id in channel_ids}, firebase_client=client) == []
+
+        # I expect each message to have been written to its channel's shard
+        for channel_id in channel_ids:
+            data = client.shard_for(channel_id).get("firechannels/{}.json".format(channel_id))
+            assert b64decode(data["message"]) == "hello!"
+
+        # Using one request per shard
+        assert sum(1 for method, _ in server.requests if method == "PATCH") == 3
+
+        # If I then sweep every channel
+        result = sweep_expired_channels(max_age=-1, firebase_client=client)
+
+        # I expect all of them to have been deleted from every shard
+        assert result.deleted == 30
+        assert server.store.get("") in (None, {})
+
+
+def test_warming_up_sharded_clients_warms_up_every_database():
+    with FakeFirebaseServer() as server:
+        # Given that I have a sharded client whose default database is on the fake server
+        databases = ["{}/shard-{}".format(server.url, i) for i in range(3)]
+        client = ShardedFirebase("fake", databases, server.credentials(), uri_template=server.uri_template)
+
+        # If I warm it up
+        warm_up(firebase_client=client, signing=False)
+
+        # I expect connections to every shard and to the default database to have been opened
+        paths = sorted(path for method, path in server.requests if method == "GET")
+        assert paths == ["/firechannelwarmup.json"] + ["/shard-{}/firechannelwarmup.json".format(i) for i in range(3)]
+
+
+def test_sharded_clients_give_every_database_its_own_circuit_breaker():
+    with FakeFirebaseServer() as server:
+        # Given that I have a sharded client with a circuit breaker factory
+        databases = ["{}/shard-{}".format(server.url, i) for i in range(3)]
+        client = ShardedFirebase("fake", databases, server.credentials(), circuit_breaker_factory=CircuitBreaker)
+
+        # If I look at the circuit breakers of its databases
+        breakers = [client.circuit_breaker] + [shard.circuit_breaker for shard in client.shards]
+
+        # I expect each of them to have its own
+        assert len(set(map(id, breakers))) == 4
+
+        # If I try to share a single circuit breaker between databases
+        # I expect a ValueError to be raised
+        with pytest.raises(ValueError):
+            ShardedFirebase("fake", databases, server.credentials(), circuit_breaker=CircuitBreaker())
+
+
+def test_sharded_clients_build_urls_for_named_databases_using_their_uri_template():
+    with FakeFirebaseServer() as server:
+        # Given that I have a sharded client with a URI template and databases given by name
+        uri_template = server.url + "/{project}/{path}"
+        client = ShardedFirebase("fake", ["db-0", "db-1"], server.credentials(), uri_template=uri_template)
+
+        # I expect the template to apply to the default database and to every shard
+        assert client.database_url == server.url + "/fake"
+        assert [shard.database_url for shard in client.shards] == [server.url + "/db-0", server.url + "/db-1"]
+
+        # And requests to go to the fake server
+        shard = client.shard_for("channel-a")
+        shard.put("firechannels/channel-a.json", {"timestamp": 0})
+        assert server.store.get(shard.project + "/firechannels/channel-a") == {"timestamp": 0}
@@ -0,0 +1,79 @@
+import pytest
+
+from base64 import b64decode
+from firechannel import create_channel, delete_channels, find_all_expired_channels, send_message, send_messages
+from firechannel.channel import decode_client_id
+from firechannel.errors import BadRequest, ServerError
+from firechannel.testing import FakeFirebaseServer
+
+
+@pytest.fixture()
+def fake_server():
+    with FakeFirebaseServer(indexes={"firechannels": ["timestamp"]}) as server:
+        yield server
+
+
+def test_fake_server_supports_the_channel_api(fake_server):
+    # Given that I have a client for a fake server
+    client = fake_server.client()
+
+    # If I create a channel and send it a message
+    token = create_channel(firebase_client=client)
+    send_message(token, "hello!", firebase_client=client)
+
+    # I expect the message to be stored on the server
+    channel_id = decode_client_id(token, firebase_client=client)
+    data = client.get("firechannels/" + channel_id + ".json")
+    assert b64decode(data["message"]) == "hello!"
+
+
+def test_fake_server_supports_multi_location_updates_and_queries(fake_server):
+    # Given that I have a client for a fake server
+    client = fake_server.client()
+
+    # If I send messages to many channels at once
+    send_messages({"channel-{}".format(i): "hello!" for i in range(10)}, firebase_client=client)
+
+    # I expect shallow reads to list all of them
+    assert len(client.get("firechannels.json", params={"shallow": "true"})) == 10
+
+    # And ordered queries to page through all of them
+    assert len(list(find_all_expired_channels(max_age=0, page_size=3, firebase_client=client))) == 10
+
+    # And bulk deletes to remove all of them
+    delete_channels(["channel-{}".format(i) for i in range(10)], firebase_client=client)
+    assert client.get("firechannels.json") is None
+
+
+def test_fake_server_rejects_queries_on_missing_indexes(fake_server):
+    # Given that I have a client for a fake server
+    client = fake_server.client()
+
+    # If I query an unindexed child
+    # I expect a BadRequest error to be raised
+    with pytest.raises(BadRequest):
+        client.get("firechannels.json", params={"orderBy": '"message"'})
+
+
+def test_fake_server_rejects_expired_access_tokens(fake_server):
+    # Given that I have a client for a fake server that has made a request
+    client = fake_server.client()
+    client.get("firechannels.json")
+
+    # If its access token expires
+    fake_server.expire_tokens()
+
+    # I expect the client to refresh it on the next request
+    client.get("firechannels.json")
+    assert client.credentials.refresh_count == 2
+
+
+def test_fake_server_can_inject_errors():
+    # Given that I have a fake server that fails every request
+    with FakeFirebaseServer(error_rate=1) as server:
+        client = server.client()
+
+        # If I make a request
+        # I expect a ServerError to be raised
+        with pytest.raises(ServerError):
+            client.get("firechannels.json")
@@ -0,0 +1,178 @@
+import httplib
+import pytest
+import sys
+import time
+
+from firechannel import BoundedPool, HTTP2Transport, RequestsTransport, Urllib3Transport, create_channel, send_message
+from firechannel.errors import ConnectionError, NotFound
+from firechannel.testing import FakeFirebaseServer
+from itertools import count
+from types import ModuleType
+
+
+class StubHTTP20Connection(object):
+    """Stands in for hyper's HTTP20Connection by sending each stream
+    as an HTTP/1.1 request.
+    """
+
+    instances = []
+
+    def __init__(self, host, secure=False, ssl_context=None, timeout=None):
+        self.host = host
+        self.timeout = timeout
+        self.closed = False
+        self.responses = {}
+        self.stream_ids = count(1)
+        self.instances.append(self)
+
+    def request(self, method, path, body=None, headers=None):
+        connection = httplib.HTTPConnection(self.host, timeout=self.timeout[1])
+        connection.request(method, path, body, headers or {})
+        stream_id = next(self.stream_ids)
+        self.responses[stream_id] = connection.getresponse()
+        return stream_id
+
+    def get_response(self, stream_id):
+        return self.responses.pop(stream_id)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture()
+def hyper_stub(monkeypatch):
+    modules = {name: ModuleType(name) for name in (
+        "hyper", "hyper.common", "hyper.common.exceptions", "hyper.http20", "hyper.http20.exceptions",
+    )}
+    modules["hyper"].HTTP20Connection = StubHTTP20Connection
+    modules["hyper.common.exceptions"].ConnectionResetError = type("ConnectionResetError", (Exception,), {})
+    modules["hyper.http20.exceptions"].HTTP20Error = type("HTTP20Error", (Exception,), {})
+    for name, module in modules.items():
+        monkeypatch.setitem(sys.modules, name, module)
+
+    StubHTTP20Connection.instances = []
+    return StubHTTP20Connection
+
+
+@pytest.mark.parametrize("transport_factory", [RequestsTransport, Urllib3Transport])
+def test_clients_can_send_messages_over_any_transport(transport_factory):
+    with FakeFirebaseServer() as server:
+        # Given that I have a client that uses a given transport
+        client = server.client(transport=transport_factory())
+
+        # If I create a channel and send it a message
+        create_channel("test-channel", firebase_client=client)
+        send_message("test-channel", "hello!", firebase_client=client)
+
+        # I expect the message to have been stored
+        assert client.get("firechannels/test-channel.json")["message"] == "aGVsbG8h"
+
+        # And query parameters to be passed through
+        assert client.get("firechannels.json", params={"shallow": "true"}) == {"test-channel": True}
+
+        # And error responses to be raised as Firebase errors
+        with pytest.raises(NotFound):
+            client.get("firechannels")
+
+
+@pytest.mark.parametrize("transport_factory", [RequestsTransport, Urllib3Transport])
+def test_transports_raise_connection_errors(transport_factory):
+    # Given that I have a client for a server that's gone away
+    with FakeFirebaseServer() as server:
+        client = server.client(transport=transport_factory())
+        client.get("firechannels.json")
+
+    # If I make a request
+    # I expect a ConnectionError to be raised
+    with pytest.raises(ConnectionError):
+        client.get("firechannels.json")
+
+
+def test_urllib3_transports_refresh_expired_access_tokens():
+    with FakeFirebaseServer() as server:
+        # Given that I have a client that uses urllib3 and whose access token has expired
+        client = server.client(transport=Urllib3Transport())
+        client.get("firechannels.json")
+        server.expire_tokens()
+
+        # If I make a request
+        client.get("firechannels.json")
+
+        # I expect the token to have been refreshed
+        assert client.credentials.refresh_count == 2
+
+
+def test_http2_transports_require_hyper():
+    try:
+        import hyper  # noqa
+    except ImportError:
+        # If I create an HTTP/2 transport without hyper installed
+        # I expect a RuntimeError to be raised
+        with pytest.raises(RuntimeError):
+            HTTP2Transport()
+    else:
+        pytest.skip("hyper is installed")
+
+
+def test_http2_transports_share_connections_between_requests(hyper_stub):
+    with FakeFirebaseServer() as server:
+        # Given that I have a client that uses HTTP/2 over two connections
+        client = server.client(transport=HTTP2Transport(connections_per_host=2))
+
+        # If I create a channel and send it a message
+        create_channel("test-channel", firebase_client=client)
+        send_message("test-channel", "hello!", firebase_client=client)
+
+        # I expect the message to have been stored
+        assert client.get("firechannels/test-channel.json")["message"] == "aGVsbG8h"
+
+        # And query parameters to be passed through
+        assert client.get("firechannels.json", params={"shallow": "true"}) == {"test-channel": True}
+
+        # And error responses to be raised as Firebase errors
+        with pytest.raises(NotFound):
+            client.get("firechannels")
+
+        # And only two connections to have been opened, using the client's timeout
+        assert len(hyper_stub.instances) == 2
+        assert all(connection.timeout == client.timeout for connection in hyper_stub.instances)
+
+
+def test_http2_transports_drop_broken_connections(hyper_stub):
+    # Given that I have an HTTP/2 client with a fixed timeout for a server that's gone away
+    with FakeFirebaseServer() as server:
+        client = server.client(transport=HTTP2Transport(timeout=(1, 5)))
+        client.get("firechannels.json")
+
+    # If I make a request
+    # I expect a ConnectionError to be raised
+    with pytest.raises(ConnectionError):
+        client.get("firechannels.json")
+
+    # And the connection to have been closed and replaced on the next request
+    with pytest.raises(ConnectionError):
+        client.get("firechannels.json")
+
+    first, second = hyper_stub.instances
+    assert first.closed and second.closed
+    assert first.timeout == (1, 5)
+
+
+def test_evicting_idle_sessions_does_not_close_shared_transports():
+    with FakeFirebaseServer() as server:
+        # Given that I have a client that uses urllib3 and a pool that evicts idle sessions right away
+        client = server.client(transport=Urllib3Transport(), pool_factory=BoundedPool.configure(max_idle=0.05))
+        with client.pool.reserve() as session:
+            client.get("firechannels.json")
+
+        # If I make a request once the idle session has been evicted
+        time.sleep(0.1)
+        with client.pool.reserve() as other_session:
+            pass
+
+        # I expect the evicted session to have been a handle of its own
+        assert session is not other_session
+        assert session is not client.transport
+
+        # And the transport's connections to have been left open
+        assert len(client.transport.manager.pools) == 1